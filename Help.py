@@ -1,5 +1,6 @@
 import streamlit as st
 import base64
+from cartar.data import fold_change_table, hpa_membrane_genes, no_membrane_genes
 
 st.set_page_config(
     page_title='CARTAR',
@@ -9,6 +10,11 @@ st.set_page_config(
 
 st.logo('logo_v2.png', icon_image='logo.png')
 
+# Load the datasets shared by all the tools once per server process
+fold_change_table()
+hpa_membrane_genes()
+no_membrane_genes()
+
 mystyle = '''
     <style>
         p {
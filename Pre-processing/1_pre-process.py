@@ -2,52 +2,49 @@
 
 import pandas as pd
 import numpy as np
+from common import raw, processed, selected, create_matrix
 
-# TCGA
-data = pd.read_csv('../Data/Raw/tcga_RSEM_gene_tpm', sep = '\t')
-# Replace the Ensembl ID for the gene symbol
-gene_map = pd.read_csv('../Data/Raw/probeMap_gencode.v23.annotation.gene.probemap', sep = '\t')
-ids = gene_map['id'].tolist()
-gene = gene_map['gene'].tolist()
-geneSymbol = []
-for each in data['sample'].tolist():
-    po = ids.index(each)
-    geneSymbol.append(gene[po])
-data['geneSymbol'] = geneSymbol
-data = data.drop_duplicates(['geneSymbol'])
-indexes = data['geneSymbol'].tolist()
-data = data.iloc[:,1:-1]
-data.index = indexes
-data_tpm = 2 ** data  - 0.001
-protein =  pd.read_csv('../Data/Raw/HUGO.txt', sep = '\t')
-gene = protein['Symbol'].tolist()
-gene_need = [i for i in gene if i in data_tpm.index.tolist()]
-data_tpm = data_tpm.loc[gene_need,:]
-col_sum = data_tpm.sum(axis = 0)
-ax = 1e6 / col_sum
-data_tpm = data_tpm * ax
-data_tpm.to_csv('../Data/Processed/tcgaTpm.csv',index_label = 'gene')
+# Ensembl ID -> gene symbol map (first symbol of each ID) and list of protein coding genes (HUGO)
+gene_map = pd.read_csv(raw('probeMap_gencode.v23.annotation.gene.probemap'), sep = '\t')
+gene_map = gene_map.drop_duplicates(['id']).set_index('id')['gene']
+protein =  pd.read_csv(raw('HUGO.txt'), sep = '\t')
+protein_genes = protein['Symbol'].tolist()
 
-#GTEX
-data = pd.read_csv('../Data/Raw/gtex_RSEM_gene_tpm', sep = '\t')
-# Replace the Ensembl id for the gene symbol
-ids = gene_map['id'].tolist()
-gene = gene_map['gene'].tolist()
-geneSymbol = []
-for each in data['sample'].tolist():
-    po = ids.index(each)
-    geneSymbol.append(gene[po])
-data['geneSymbol'] = geneSymbol
-data = data.drop_duplicates(['geneSymbol'])
-indexes = data['geneSymbol'].tolist()
-data = data.iloc[:,1:-1]
-data.index = indexes
-data_tpm = 2 ** data  - 0.001
-protein =  pd.read_csv('../Data/Raw/HUGO.txt', sep = '\t')
-gene = protein['Symbol'].tolist()
-gene_need = [i for i in gene if i in data_tpm.index.tolist()]
-data_tpm = data_tpm.loc[gene_need,:]
-col_sum = data_tpm.sum(axis = 0)
-ax = 1e6 / col_sum
-data_tpm = data_tpm * ax
-data_tpm.to_csv('../Data/Processed/gtexTpm.csv',index_label = 'gene')
\ No newline at end of file
+CHUNK_SIZE = 2000 # Number of genes of the raw matrices read at once
+
+def convert(raw_file, out_path):
+    # Replace the Ensembl ID for the gene symbol (first row of each symbol) reading only the ID column
+    symbols = pd.read_csv(raw_file, sep = '\t', usecols = [0]).iloc[:,0].map(gene_map)
+    first = ~symbols.duplicated()
+    # Keep the protein coding genes in the order of the HUGO list
+    rows = {symbol:row for row, symbol in symbols[first].items() if not pd.isna(symbol)}
+    gene_need = [i for i in dict.fromkeys(protein_genes) if i in rows]
+    kept = sorted(rows[i] for i in gene_need)
+    position = {row:n for n, row in enumerate(kept)}
+    slots = np.array([position[rows[i]] for i in gene_need])
+    order = np.empty(len(slots), dtype=int)
+    order[slots] = np.arange(len(slots))
+    # Read the expression values of the kept genes in chunks, convert log2(TPM+0.001) to TPM in float32 and 
+    # accumulate the sum of each sample for the renormalization. The values are written directly into the 
+    # memory-mapped binary matrix read by the next stage
+    samples = pd.read_csv(raw_file, sep = '\t', nrows = 0).columns[1:]
+    data_tpm = create_matrix(out_path, gene_need, samples)
+    col_sum = np.zeros(len(samples))
+    skip = set(range(1, len(symbols) + 1)) - {row + 1 for row in kept}
+    start = 0
+    for chunk in pd.read_csv(raw_file, sep = '\t', usecols = range(1, len(samples) + 1), dtype = np.float32,
+                             skiprows = skip, chunksize = CHUNK_SIZE):
+        values = chunk.to_numpy()
+        np.exp2(values, out = values)
+        values -= np.float32(0.001)
+        data_tpm[order[start:start + len(values)]] = values
+        col_sum += values.sum(axis = 0, dtype = np.float64)
+        start += len(values)
+    data_tpm *= (1e6 / col_sum).astype(np.float32)
+    data_tpm.flush()
+
+# Convert the TCGA and/or GTEX data (e.g: python 1_pre-process.py tcga)
+files = {'tcga':('tcga_RSEM_gene_tpm', 'tcgaTpm'), 'gtex':('gtex_RSEM_gene_tpm', 'gtexTpm')}
+for dataset in selected():
+    raw_file, out_path = files[dataset]
+    convert(raw(raw_file), processed(out_path))
@@ -1,60 +1,37 @@
 ## Keep only genes of interest (e.g: located in cell surface)
 
-# Remove duplicated lines from GO file
-GO = open('../Data/Raw/GO_0005886.txt','r') # Modify to GO list of interest
-out = open('../Data/Processed/GO_simplified_list.txt','w')
-lines = []
-for line in GO:
-	if line not in lines:
-	    lines.append(line)
-for line in lines:
-	out.write(line)
-out.close()
+from common import raw, processed, create_processed_dir, selected, read_matrix, write_matrix
 
-# Select genes located in the GO list
-GO = open('../Data/Processed/GO_simplified_list.txt','r')
-genes = []
-for line in GO: 
-	line = line.strip()
-	gene = line.split()[0]
-	genes.append(gene)
+# Parts of the stage to run: GO list, TCGA and/or GTEX (e.g: python 2_select_genes.py go tcga)
+parts = selected(('go', 'tcga', 'gtex'))
+
+# Remove duplicated lines from GO file (keeping the order of the first occurrence)
+if 'go' in parts:
+	with open(raw('GO_0005886.txt'),'r') as GO: # Modify to GO list of interest
+		lines = list(dict.fromkeys(GO))
+	create_processed_dir()
+	with open(processed('GO_simplified_list.txt'),'w') as out:
+		out.writelines(lines)
+
+# Set of genes located in the GO list
+with open(processed('GO_simplified_list.txt'),'r') as GO:
+	genes = {line.split()[0] for line in GO if line.strip()}
+
+def select(in_path, out_path):
+	# Save the rows of the genes in our GO list and return the excluded genes
+	all_genes, samples, values = read_matrix(in_path)
+	keep = [n for n, gene in enumerate(all_genes) if gene in genes]
+	write_matrix(out_path, values[keep], [all_genes[n] for n in keep], samples)
+	return [gene for gene in all_genes if gene not in genes]
 
 # GTEX
 # remove genes that are not in our GO list
-gtex = open('../Data/Processed/gtexTpm.csv','r')
-no_membrane_genes = open('../Data/Processed/no_membrane_genes.csv','w')
-exclusion = ''
-out_gtex = open('../Data/Processed/gtexTpm_selected_v1.csv','w')
-n = 0
-for line in gtex: 
-	# write header
-	if n == 0:
-		out_gtex.write(line)
-		n = 1
-	# selected genes information
-	else: 
-		gene = line.split(',')[0]
-		if gene in genes:
-			out_gtex.write(line)
-		else:
-			exclusion += gene + ','
-no_membrane_genes.write(exclusion.strip(','))
-out_gtex.close()
-no_membrane_genes.close()
+if 'gtex' in parts:
+	exclusion = select(processed('gtexTpm'), processed('gtexTpm_selected_v1'))
+	with open(processed('no_membrane_genes.csv'),'w') as no_membrane_genes:
+		no_membrane_genes.write(','.join(exclusion))
 
 # TCGA
 # remove genes that are not in our GO list
-tcga = open('../Data/Processed/tcgaTpm.csv','r')
-out_tcga = open('../Data/Processed/tcgaTpm_selected_v1.csv','w')
-n = 0
-for line in tcga: 
-	# write header
-	if n == 0:
-		out_tcga.write(line)
-		n = 1
-	# selected genes information
-	else: 
-		gene = line.split(',')[0]
-		if gene in genes:
-			out_tcga.write(line)
-out_tcga.close()
\ No newline at end of file
+if 'tcga' in parts:
+	select(processed('tcgaTpm'), processed('tcgaTpm_selected_v1'))
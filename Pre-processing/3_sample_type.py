@@ -1,9 +1,12 @@
 ## Identify to which tumor/tissue belongs each sample and remove those without this information
 
 import pandas as pd
+from common import raw, processed, selected, read_matrix, write_matrix
 
-# Add cancer type abbreviation to TCGA_phenotype file
-data = pd.read_csv('../Data/Raw/TCGA_phenotype_denseDataOnlyDownload.tsv',sep='\t')
+# Parts of the stage to run: TCGA and/or GTEX (e.g: python 3_sample_type.py tcga)
+parts = selected()
+
+# Cancer type abbreviation of each TCGA primary disease
 disease_match = {'kidney chromophobe':'KICH', 'colon adenocarcinoma':'COAD', 
                  'lung squamous cell carcinoma':'LUSC', 'bladder urothelial carcinoma':'BLCA', 
                  'diffuse large B-cell lymphoma':'DLBC', 'adrenocortical cancer':'ACC',
@@ -23,112 +26,37 @@ disease_match = {'kidney chromophobe':'KICH', 'colon adenocarcinoma':'COAD',
                  'pheochromocytoma & paraganglioma':'PCPG', 
                  'prostate adenocarcinoma':'PRAD', 
                  'ovarian serous cystadenocarcinoma':'OV'}
-primary_disease = []
-for each in data['_primary_disease'].tolist():
-    primary_disease.append(disease_match[each])
-data['primary_disease'] = primary_disease
-data.to_csv('../Data/Processed/TCGA_sample_cancertype.tsv', sep='\t', index=False)
+
+def relabel(in_path, out_path, labels, metadata_file):
+    # Keep only the samples with a label and replace the sample name by the label
+    genes, samples, values = read_matrix(in_path)
+    keep = [n for n, sample in enumerate(samples) if sample in labels.index]
+    write_matrix(out_path, values[:,keep], genes, [labels[samples[n]] for n in keep])
+    # Save the name and label of the kept samples in the order of the matrix columns
+    pd.DataFrame({'sample':[samples[n] for n in keep], 'label':[labels[samples[n]] for n in keep]}).to_csv(metadata_file, sep='\t', index=False)
 
 # TCGA
-# Create a dictionay assigning each sample to the tumor type and remove samples annotated as 'Addiotional'
-phenotype = open('../Data/Processed/TCGA_sample_cancertype.tsv','r')
-samples_cancer = {}
-n = 0 
-for line in phenotype: 
-    line = line.strip()
-    if n == 0:
-        n = 1
-    else:
-        fields = line.split('\t')
-        stype = fields [2]
-        if stype and 'Additional' not in stype:
-            sample = fields[0]
-            cancer = fields[-1]
-            sample_type = cancer + '_' + stype
-            samples_cancer[sample] = sample_type
-# Remove samples with no tumor type information
-tcga_matrix = pd.read_csv('../Data/Processed/tcgaTpm_selected_v1.csv') 
-remove = []
-n = 0
-for column in tcga_matrix.columns:
-    if n == 0: 
-        n = 1
-    else: 
-        if column not in samples_cancer.keys():
-            remove.append(column)
-for sample in remove: 
-    del tcga_matrix[sample]
-tcga_matrix.to_csv('../Data/Processed/tcgaTpm_selected_v2.csv', index=False)
-# Replace the sample name by the tumor type
-tcga = open('../Data/Processed/tcgaTpm_selected_v2.csv','r')
-out = open('../Data/Processed/tcgaTpm_selected_v3.csv','w')
-n = 0
-for line in tcga: 
-    if n == 0: 
-        line = line.strip()
-        samples = line.split(',')
-        n = 1
-        header = ''
-        x = 0
-        for sample in samples: 
-            if x == 0:
-                header += sample + ','
-                x = 1
-            else: 
-                header += samples_cancer[sample] + ','
-        header = header.strip(',')
-        out.write(header + '\n')
-    else: 
-        out.write(line)
-out.close()
-       
+if 'tcga' in parts:
+    # Add cancer type abbreviation to TCGA_phenotype file
+    data = pd.read_csv(raw('TCGA_phenotype_denseDataOnlyDownload.tsv'),sep='\t')
+    data['primary_disease'] = data['_primary_disease'].map(disease_match)
+    data.to_csv(processed('TCGA_sample_cancertype.tsv'), sep='\t', index=False)
+    # Assign each sample to the tumor type and sample type (e.g: ACC_Primary Tumor) removing samples without sample type 
+    # or annotated as 'Additional'
+    phenotype = pd.read_csv(processed('TCGA_sample_cancertype.tsv'), sep='\t', dtype=str, keep_default_na=False)
+    stype = phenotype.iloc[:,2]
+    phenotype = phenotype[(stype != '') & ~stype.str.contains('Additional')]
+    samples_cancer = pd.Series((phenotype['primary_disease'] + '_' + phenotype.iloc[:,2]).to_numpy(), index=phenotype.iloc[:,0])
+    samples_cancer = samples_cancer[~samples_cancer.index.duplicated(keep='last')]
+    relabel(processed('tcgaTpm_selected_v1'), processed('tcgaTpm_selected_v3'), samples_cancer,
+            processed('tcga_sample_metadata.tsv'))
+
 # GTEX
-# Create a dictionay assigning each sample to the tissue type
-phenotype = open('../Data/Raw/GTEX_phenotype.tsv','r')
-samples_tissue = {}
-n = 0 
-for line in phenotype: 
-    line = line.strip()
-    if n == 0:
-        n = 1
-    else:
-        fields = line.split('\t')
-        tissue = fields[2]
-        if tissue != '<not provided>':
-            sample = fields[0]
-            samples_tissue[sample] = tissue
-# Remove samples with no tissue type information
-gtex_matrix = pd.read_csv('../Data/Processed/gtexTpm_selected_v1.csv')
-remove = []
-n = 0
-for column in gtex_matrix.columns:
-    if n == 0: 
-        n = 1
-    else: 
-        if column not in samples_tissue.keys():
-            remove.append(column)
-for sample in remove: 
-    del gtex_matrix[sample]
-gtex_matrix.to_csv('../Data/Processed/gtexTpm_selected_v2.csv', index=False)
-# Replace the sample name by the tissue type
-gtex = open('../Data/Processed/gtexTpm_selected_v2.csv','r')
-out = open('../Data/Processed/gtexTpm_selected_v3.csv','w')
-n = 0
-for line in gtex: 
-    if n == 0: 
-        line = line.strip()
-        samples = line.split(',')
-        n = 1
-        header = ''
-        x = 0
-        for sample in samples: 
-            if x == 0:
-                header += sample + ','
-                x = 1
-            else: 
-                header += samples_tissue[sample] + ','
-        header = header.strip(',')
-        out.write(header + '\n')
-    else: 
-        out.write(line)
-out.close()
\ No newline at end of file
+if 'gtex' in parts:
+    # Assign each sample to the tissue type removing samples without tissue type information
+    phenotype = pd.read_csv(raw('GTEX_phenotype.tsv'), sep='\t', dtype=str, keep_default_na=False)
+    phenotype = phenotype[phenotype.iloc[:,2] != '<not provided>']
+    samples_tissue = pd.Series(phenotype.iloc[:,2].to_numpy(), index=phenotype.iloc[:,0])
+    samples_tissue = samples_tissue[~samples_tissue.index.duplicated(keep='last')]
+    relabel(processed('gtexTpm_selected_v1'), processed('gtexTpm_selected_v3'), samples_tissue,
+            processed('gtex_sample_metadata.tsv'))
@@ -2,122 +2,97 @@
 ## Combine all GTEX samples belonging to the same tissue
 ## Add GTEX samples to the corresponding control group of TCGA tumors
 
+from collections import Counter
+import numpy as np
 import pandas as pd
+from common import processed, read_matrix, create_matrix, write_matrix, map_matrix, column_median
+from cartar.tables import MEDIAN_GROUPS, write_median_tables
 
-#TCGA
-# Create a dictionary containing the list of samples belonging to the same tumor group
-tcga = pd.read_csv('../Data/Processed/tcgaTpm_selected_v3.csv')
-tumors = {}
-n = 0 
-for column in tcga.columns:
-    if n == 0: 
-        n = 1
-    else: 
-        stype = column.split('.')[0]
-        fields = stype.split('_')
-        tumor = fields[0]
-        group = fields[1]
-        if 'Primary' in group or 'Recurrent' in group:
-            tag = ''
-        elif group == 'Metastatic': 
-            tag = '_Metastatic'
-        elif 'Normal' in group:
-            tag = '_Normal'
-        sample_group = tumor + tag
-        if sample_group not in tumors.keys():
-            tumors[sample_group] = [column]
-        else:
-            tumors[sample_group].append(column)
-
-#GTEX
-# Create a dictionary containing the list of samples belonging to the same tissue
-gtex = pd.read_csv('../Data/Processed/gtexTpm_selected_v3.csv')
-tissues = {}
-n = 0 
-for column in gtex.columns:
-    if n == 0: 
-        n = 1
-    else: 
-        if '.' not in column:
-            tissues[column] = [column]   
-        else: 
-           tissue = column.split('.')[0]
-           tissues[tissue].append(column) 
-# Calculate median expression for the gtex data
-result = pd.DataFrame()
-result['gene'] = gtex['gene']
-out = open('../Data/Processed/replicates.tsv','w') # Save in a txt file the number of replicates of each tissue/tumor
-for tissue in tissues.keys():
-    replicate = len(tissues[tissue])
-    out.write(tissue + '\t' + str(replicate) + '\n')
-    median_per_tissue = gtex[tissues[tissue]].median(axis=1)
-    result[str(tissue)] = median_per_tissue
-result.to_csv('../Data/Processed/gtex_targetable_gene_Tpm_by_tissue.csv', index=False)
-for tumor in tumors.keys():
-    replicate = len(tumors[tumor])
-    out.write(tumor + '\t' + str(replicate) + '\n')
-out.close()
-
-# Create a dictionary with all the gtex tissues added to control samples
+# Dictionary with the gtex tissue added to the control samples of each tumor
 gtex_tcga = {'ACC':'Adrenal Gland','BLCA':'Bladder','BRCA':'Breast','CESC':'Cervix Uteri', 'COAD':'Colon', 'DLBC':'Blood',
                 'ESCA':'Esophagus','GBM':'Brain','KICH':'Kidney','KIRC':'Kidney','KIRP':'Kidney','LAML':'Bone Marrow','LGG':'Brain',
                 'LIHC':'Liver','LUAD':'Lung','LUSC':'Lung','OV':'Ovary','PAAD':'Pancreas','PRAD':'Prostate','READ':'Colon','SKCM':'Skin',
                 'STAD':'Stomach','TGCT':'Testis','THCA':'Thyroid','THYM':'Blood','UCEC':'Uterus','UCS':'Uterus'}
 
-#TCGA-GTEX
-# Combine the columns of tcga and gtex data
-combine = pd.merge(tcga, gtex, on='gene')
-combine.to_csv('../Data/Processed/targetable_genes_gtex_tcga.csv', index=False) 
+def tumor_group(label):
+    # Tumor group of a TCGA sample (e.g: ACC_Primary Tumor -> ACC, ACC_Solid Tissue Normal -> ACC_Normal)
+    tumor, group = label.split('_')[:2]
+    if 'Primary' in group or 'Recurrent' in group:
+        return tumor
+    elif group == 'Metastatic':
+        return tumor + '_Metastatic'
+    elif 'Normal' in group:
+        return tumor + '_Normal'
+    return None
+
+def group_medians(path, genes, groups):
+    # Median of the columns of each group ({group:columns}) of the matrix saved at path, one group per worker task
+    medians = map_matrix(column_median, path, [(columns,) for columns in groups.values()])
+    return pd.DataFrame(dict(zip(groups, medians)), index=genes)
+
+def group_columns(labels):
+    # Positions of the columns of each group (groups in order of first appearance, columns without group skipped)
+    groups = {}
+    for n, label in enumerate(labels):
+        if label is not None:
+            groups.setdefault(label, []).append(n)
+    return groups
+
+if __name__ == '__main__':
+    # Group label of each sample: tumor group for TCGA samples and tissue for GTEX samples
+    tcga_genes, tcga_labels, tcga = read_matrix(processed('tcgaTpm_selected_v3'))
+    gtex_genes, gtex_groups, gtex = read_matrix(processed('gtexTpm_selected_v3'))
+    tcga_groups = [tumor_group(label) for label in tcga_labels]
+    tumors = Counter(group for group in tcga_groups if group is not None) # Number of samples of each tumor group
+    tissues = Counter(gtex_groups) # Number of samples of each tissue
+
+    #GTEX
+    # Calculate median expression for the gtex data
+    result = group_medians(processed('gtexTpm_selected_v3'), gtex_genes, group_columns(gtex_groups))
+    result.to_csv(processed('gtex_targetable_gene_Tpm_by_tissue.csv'), index_label='gene')
+    with open(processed('replicates.tsv'),'w') as out: # Save in a txt file the number of replicates of each tissue/tumor
+        for group, replicate in list(tissues.items()) + list(tumors.items()):
+            out.write(group + '\t' + str(replicate) + '\n')
+
+    #TCGA-GTEX
+    # Combine the columns of tcga and gtex data for the genes present in both
+    gtex_rows = {gene:n for n, gene in enumerate(gtex_genes)}
+    tcga_rows = [n for n, gene in enumerate(tcga_genes) if gene in gtex_rows]
+    genes = [tcga_genes[n] for n in tcga_rows]
+    combine = create_matrix(processed('targetable_genes_gtex_tcga'), genes, tcga_labels + gtex_groups)
+    combine[:,:len(tcga_labels)] = tcga[tcga_rows]
+    combine[:,len(tcga_labels):] = gtex[[gtex_rows[gene] for gene in genes]]
+    combine.flush()
+    del combine
+
+    # Calculate median expression of each group: tcga groups, with the GTEX samples of the corresponding tissue added 
+    # to the control group of each tumor
+    groups = group_columns(tcga_groups)
+    tissue_columns = group_columns([None] * len(tcga_labels) + gtex_groups)
+    for tumor, tissue in gtex_tcga.items():
+        group = tumor + '_Normal'
+        groups[group] = groups.get(group, []) + tissue_columns.get(tissue, [])
+        tumors[group] += tissues[tissue]
+    result = group_medians(processed('targetable_genes_gtex_tcga'), genes, groups)
+    with open(processed('group_replicates.tsv'),'w') as out: # Save in a txt file the number of replicates of each group
+        for group in result.columns:
+            out.write(group + '\t' + str(tumors[group]) + '\n')
+    result = result[sorted(result.columns)]
+    write_matrix(processed('targetable_gene_Tpm_TumorVsControl'), result.to_numpy(), genes, result.columns)
+    # Change negative value to expression data to minimum expression (1E-08)
+    result = result.mask(result < 0, 1e-08)
+    result.to_csv(processed('targetable_gene_Tpm_TumorVsControl_final.csv'), index_label='gene')
 
-# Add the GTEX samples that act as control samples of any tumor
-# Add GTEX samples to the dicitinary in the tumor for which they can be used as control
-for tumor in gtex_tcga.keys():
-    control = gtex_tcga[tumor]
-    for tissue in tissues.keys():
-        if tissue == control and tissue not in tcga.keys():
-            for sample in tissues[tissue]:    
-                tcga[sample] = gtex[sample]
-tcga.to_csv('../Data/Processed/tcga_gtex_combined_data.csv', index=False)
-# Add the GTEX control samples to the corresponding group in the dictionary
-for control in gtex_tcga.keys():
-    tissue = gtex_tcga[control]
-    group = control + '_Normal'
-    if group in tumors.keys():
-        tumors[group].extend(tissues[tissue])
-    else:
-        tumors[group] = tissues[tissue]
-# Calculate median expression of each group 
-combined = pd.read_csv('../Data/Processed/tcga_gtex_combined_data.csv')
-out = open('../Data/Processed/group_replicates.tsv','w') # Save in a txt file the number of replicates of each group
-result = pd.DataFrame()
-for tumor in tumors.keys():
-    replicate = len(tumors[tumor])
-    out.write(tumor + '\t' + str(replicate) + '\n')
-    median_per_group = combined[tumors[tumor]].median(axis=1)
-    result[str(tumor)] = median_per_group
-out.close()
-result_final = pd.DataFrame()
-sorted_columns = sorted(result.columns)
-result_final = result[sorted_columns]
-result_final.insert(0, 'gene', combined['gene'])
-result_final.to_csv('../Data/Processed/targetable_gene_Tpm_TumorVsControl.csv', index=False)
-# Change negative value to expression data to minimum expression (1E-08)
-data = open('../Data/Processed/targetable_gene_Tpm_TumorVsControl.csv','r')
-out = open('../Data/Processed/targetable_gene_Tpm_TumorVsControl_final.csv','w')
-n = 0
-for line in data:
-    if n == 0:
-        out.write(line)
-        n = 1
-    else:
-        line = line.strip()
-        fields = line.split(',')
-        write = fields[0] + ','
-        for field in fields[1:]:
-           if '-' in field:
-               write += '1.0e-08,'
-           else:
-               write += field + ','
-        write = write.strip(',')
-        out.write(write + '\n')
-out.close()      
\ No newline at end of file
+    # Create a gene x tumor x group array with the median expression of the metastatic, primary tumor and control 
+    # samples of each tumor (NaN if the group has no samples) and the sample size of each group
+    tumor_types = sorted(group for group in tumors.keys() if '_' not in group)
+    group_names = {'Metastatic':'{}_Metastatic', 'Tumor':'{}', 'Control':'{}_Normal'}
+    median = np.full((len(result.index), len(tumor_types), len(MEDIAN_GROUPS)), np.nan)
+    sizes = np.zeros((len(tumor_types), len(MEDIAN_GROUPS)), dtype=np.int32)
+    for i, tumor in enumerate(tumor_types):
+        for k, group in enumerate(MEDIAN_GROUPS):
+            name = group_names[group].format(tumor)
+            if name in result.columns:
+                median[:,i,k] = result[name].to_numpy()
+                sizes[i,k] = tumors[name]
+    write_median_tables(processed('median_tables.npz'), result.index.tolist(), tumor_types, median, sizes)
@@ -1,381 +1,124 @@
 import pickle
-import statistics
-from scipy.stats import mannwhitneyu
+import numpy as np
+import statsmodels.stats.multitest as smm
+from common import processed, read_matrix, map_matrix, column_median
+from cartar.stats import mann_whitney, summarize, violin_densities
+from cartar.store import write_store
+from cartar.tables import write_antigen_tables, write_summary_tables
+from cartar.violins import write_violin_store
 
-# Create dicitionaries with expression values of all genes for all tumoral groups
 # List with all tumor abbreviations
 tumors = ['ACC','BLCA','BRCA','CESC','CHOL','COAD','DLBC','ESCA','GBM','HNSC','KICH','KIRC','KIRP','LAML','LGG','LIHC','LUAD','LUSC','OV','PAAD','PCPG','PRAD','READ','SARC','SKCM','STAD','TGCT','THCA','THYM','UCEC','UCS']
-
-# Read expression data for the samples
-data = open(r'C:\Users\34656\Pipeline for TCGA_GTEX\Data\Processed\tcga_gtex_combined_data.csv','r')
-tumor_replicates = {} # Dictionary with the following strcutre {tumors_group:[position_indexes]}
-result1 = {} # Dictionary with the following strcutre {genes:tumors:{groups:[TPM_expression_values]}} A-C
-result2 = {} #D-J
-result3 = {} #K-N
-result4 = {} #O-R
-result5 = {} #S-T
-result6 = {} #U-Z
-firstline = 1 
-n = 0
-# Identifiy the position of each tumor_group in the lines
-for line in data:
-    fields = line.strip().split(',')
-    if firstline:
-        for field in fields[1:]:
-            n += 1
-            field = field.split('.')[0]
-            abr = field.split('_')[0]
-            if abr in tumors:
-                if 'Primary' in field:
-                    name = abr + '_Tumor'
-                    if name not in tumor_replicates.keys():
-                        tumor_replicates[name] = [n]
-                    else:
-                        tumor_replicates[name].append(n)
-                elif 'Normal' in field:
-                    name = abr + '_Normal'
-                    if name not in tumor_replicates.keys():
-                        tumor_replicates[name] = [n]
-                    else:
-                        tumor_replicates[name].append(n)
-        firstline = 0
-    # Idnetify the expression values of the introduced gene belonging to each tumor_group
-    else: 
-        gene = fields[0]
-        if 'A' <= gene[0] <= 'C':
-            result1[gene] = {}
-            for sample in tumor_replicates.keys():
-                name = sample.split('_')
-                abr = name[0]
-                group = name[1]
-                if abr not in result1[gene].keys():
-                    result1[gene][abr] = {}
-                result1[gene][abr][group] = []
-                for index in tumor_replicates[sample]:
-                    result1[gene][abr][group].append(float(fields[index]))
-        elif 'D' <= gene[0] <= 'J':
-            result2[gene] = {}
-            for sample in tumor_replicates.keys():
-                name = sample.split('_')
-                abr = name[0]
-                group = name[1]
-                if abr not in result2[gene].keys():
-                    result2[gene][abr] = {}
-                result2[gene][abr][group] = []
-                for index in tumor_replicates[sample]:
-                    result2[gene][abr][group].append(float(fields[index]))
-        elif 'K' <= gene[0] <= 'N':
-            result3[gene] = {}
-            for sample in tumor_replicates.keys():
-                name = sample.split('_')
-                abr = name[0]
-                group = name[1]
-                if abr not in result3[gene].keys():
-                    result3[gene][abr] = {}
-                result3[gene][abr][group] = []
-                for index in tumor_replicates[sample]:
-                    result3[gene][abr][group].append(float(fields[index]))
-        elif 'O' <= gene[0] <= 'R':
-            result4[gene] = {}
-            for sample in tumor_replicates.keys():
-                name = sample.split('_')
-                abr = name[0]
-                group = name[1]
-                if abr not in result4[gene].keys():
-                    result4[gene][abr] = {}
-                result4[gene][abr][group] = []
-                for index in tumor_replicates[sample]:
-                    result4[gene][abr][group].append(float(fields[index]))
-        elif 'S' <= gene[0] <= 'T':
-            result5[gene] = {}
-            for sample in tumor_replicates.keys():
-                name = sample.split('_')
-                abr = name[0]
-                group = name[1]
-                if abr not in result5[gene].keys():
-                    result5[gene][abr] = {}
-                result5[gene][abr][group] = []
-                for index in tumor_replicates[sample]:
-                    result5[gene][abr][group].append(float(fields[index]))
-        elif 'U' <= gene[0] <= 'Z':
-            result6[gene] = {}
-            for sample in tumor_replicates.keys():
-                name = sample.split('_')
-                abr = name[0]
-                group = name[1]
-                if abr not in result6[gene].keys():
-                    result6[gene][abr] = {}
-                result6[gene][abr][group] = []
-                for index in tumor_replicates[sample]:
-                    result6[gene][abr][group].append(float(fields[index]))
-# Order tumors alphabetically
-for gene, tumors in result1.items():
-    result1[gene] = {tumor: tumors[tumor] for tumor in sorted(tumors)}
-for gene, tumors in result2.items():
-    result2[gene] = {tumor: tumors[tumor] for tumor in sorted(tumors)}
-for gene, tumors in result3.items():
-    result3[gene] = {tumor: tumors[tumor] for tumor in sorted(tumors)}
-for gene, tumors in result4.items():
-    result4[gene] = {tumor: tumors[tumor] for tumor in sorted(tumors)}
-for gene, tumors in result5.items():
-    result5[gene] = {tumor: tumors[tumor] for tumor in sorted(tumors)}
-for gene, tumors in result6.items():
-    result6[gene] = {tumor: tumors[tumor] for tumor in sorted(tumors)}
-#Save dictionary in file
-with open('../Data/Processed/tcga_AC.pkl', 'wb') as archivo:
-    pickle.dump(result1, archivo)
-with open('../Data/Processed/tcga_DJ.pkl', 'wb') as archivo:
-    pickle.dump(result2, archivo)
-with open('../Data/Processed/tcga_KN.pkl', 'wb') as archivo:
-    pickle.dump(result3, archivo)
-with open('../Data/Processed/tcga_OR.pkl', 'wb') as archivo:
-    pickle.dump(result4, archivo)
-with open('../Data/Processed/tcga_ST.pkl', 'wb') as archivo:
-    pickle.dump(result5, archivo)
-with open('../Data/Processed/tcga_UZ.pkl', 'wb') as archivo:
-    pickle.dump(result6, archivo)
-
-# Create dicitionaries with expression values of all genes for all GTEX tissues  
 # List with all gtex tissues
 tissues = ['Blood','Blood Vessel','Brain','Thyroid','Pancreas','Muscle','Lung','Skin','Colon','Nerve','Adipose Tissue','Ovary','Heart','Breast','Pituitary','Testis','Vagina','Esophagus','Small Intestine','Spleen','Adrenal Gland','Stomach','Uterus','Liver','Bone Marrow','Salivary Gland','Prostate','Kidney','Bladder','Fallopian Tube','Cervix Uteri']
-# Function for statistical analysis of significance of tumoral group vs gtex data and customize plot function
-# Read expression data for the samples
-data = open(r'C:\Users\34656\Pipeline for TCGA_GTEX\Data\Processed\targetable_genes_gtex_tcga.csv','r')
-tissue_replicates = {} # Dictionary with the following strcutre {tissue:[position_indexes]}
-result1 = {} # Dictionary with the following strcutre {genes:{tissue:[TPM_expression_values]}} A-C
-result2 = {} #D-J
-result3 = {} #K-N
-result4 = {} #O-R
-result5 = {} #S-T
-result6 = {} #U-Z
-firstline = 1
-n = 0
-for line in data:
-    fields = line.strip().split(',')
-    if firstline:
-        for field in fields[1:]:
-            n += 1
-            tissue = field.split('.')[0]
-            # Identify the tissue present in each field
-            if tissue in tissues:
-                if tissue not in tissue_replicates.keys():
-                    tissue_replicates[tissue] = [n]
-                else:
-                    tissue_replicates[tissue].append(n)
-        firstline = 0
-    else: 
-        gene = fields[0]
-        if 'A' <= gene[0] <= 'C':
-            result1[gene] = {}
-            for tissue in tissue_replicates.keys():
-                if tissue not in result1[gene].keys():
-                    result1[gene][tissue] = []
-                for index in tissue_replicates[tissue]:
-                    result1[gene][tissue].append(float(fields[index]))
-        elif 'D' <= gene[0] <= 'J':
-            result2[gene] = {}
-            for tissue in tissue_replicates.keys():
-                if tissue not in result2[gene].keys():
-                    result2[gene][tissue] = []
-                for index in tissue_replicates[tissue]:
-                    result2[gene][tissue].append(float(fields[index]))
-        elif 'K' <= gene[0] <= 'N':
-            result3[gene] = {}
-            for tissue in tissue_replicates.keys():
-                if tissue not in result3[gene].keys():
-                    result3[gene][tissue] = []
-                for index in tissue_replicates[tissue]:
-                    result3[gene][tissue].append(float(fields[index]))
-        elif 'O' <= gene[0] <= 'R':
-            result4[gene] = {}
-            for tissue in tissue_replicates.keys():
-                if tissue not in result4[gene].keys():
-                    result4[gene][tissue] = []
-                for index in tissue_replicates[tissue]:
-                    result4[gene][tissue].append(float(fields[index]))
-        elif 'S' <= gene[0] <= 'T':
-            result5[gene] = {}
-            for tissue in tissue_replicates.keys():
-                if tissue not in result5[gene].keys():
-                    result5[gene][tissue] = []
-                for index in tissue_replicates[tissue]:
-                    result5[gene][tissue].append(float(fields[index]))
-        elif 'U' <= gene[0] <= 'Z':
-            result6[gene] = {}
-            for tissue in tissue_replicates.keys():
-                if tissue not in result6[gene].keys():
-                    result6[gene][tissue] = []
-                for index in tissue_replicates[tissue]:
-                    result6[gene][tissue].append(float(fields[index]))
-# Order tissues alphabetically
-for gene, tissues in result1.items():
-    result1[gene] = {tissue: tissues[tissue] for tissue in sorted(tissues)}
-for gene, tissues in result2.items():
-    result2[gene] = {tissue: tissues[tissue] for tissue in sorted(tissues)}
-for gene, tissues in result3.items():
-    result3[gene] = {tissue: tissues[tissue] for tissue in sorted(tissues)}
-for gene, tissues in result4.items():
-    result4[gene] = {tissue: tissues[tissue] for tissue in sorted(tissues)}
-for gene, tissues in result5.items():
-    result5[gene] = {tissue: tissues[tissue] for tissue in sorted(tissues)}
-for gene, tissues in result6.items():
-    result6[gene] = {tissue: tissues[tissue] for tissue in sorted(tissues)}
-# Save dictionary in file
-with open('../Data/Processed/gtex_AC.pkl', 'wb') as archivo:
-    pickle.dump(result1, archivo)
-with open('../Data/Processed/gtex_DJ.pkl', 'wb') as archivo:
-    pickle.dump(result2, archivo)
-with open('../Data/Processed/gtex_KN.pkl', 'wb') as archivo:
-    pickle.dump(result3, archivo)
-with open('../Data/Processed/gtex_OR.pkl', 'wb') as archivo:
-    pickle.dump(result4, archivo)
-with open('../Data/Processed/gtex_ST.pkl', 'wb') as archivo:
-    pickle.dump(result5, archivo)
-with open('../Data/Processed/gtex_UZ.pkl', 'wb') as archivo:
-    pickle.dump(result6, archivo)
-
-# Create SKCM metastatic dicitionary
-data = open(r'c:\Users\34656\Pipeline for TCGA_GTEX\Data\Processed\tcga_gtex_combined_data.csv','r')
-gtex_tcga = {'SKCM':'Skin'}
-tissue_replicates = {} # Dictionary identifying the field in which is group is found ({group:[indexes]})
-result = {} # Dictionary identifying the expression values of each group (gene{tumor:{group:[TPM_expression_values]}})
-firstline = 1
-n = 0
-for line in data:
-    fields = line.strip().split(',')
-    # Select samples belonging to SKCM and control group
-    if firstline:
-        for field in fields[1:]:
-            n += 1
-            field = field.split('.')[0]
-            abr = field.split('_')[0]
-            # Identify the group
-            if abr == 'SKCM':
-                if 'Primary' in field:
-                    name = 'Primary'
-                    if name not in tissue_replicates.keys():
-                        tissue_replicates[name] = [n]
-                    else:
-                        tissue_replicates[name].append(n)
-                elif 'Normal' in field:
-                    name = 'Normal'
-                    if name not in tissue_replicates.keys():
-                        tissue_replicates[name] = [n]
-                    else:
-                        tissue_replicates[name].append(n)
-                elif 'Metastatic' in field:
-                    name = 'Metastatic'
-                    if name not in tissue_replicates.keys():
-                        tissue_replicates[name] = [n]
-                    else:
-                        tissue_replicates[name].append(n)
-            # Identify control samples from GTEX
-            elif field in gtex_tcga.values():   
-                for abr, tissue in gtex_tcga.items():
-                    if field == tissue and abr == 'SKCM':
-                        name = 'Normal'
-                        if name not in tissue_replicates.keys():
-                            tissue_replicates[name] = [n]
-                        else:
-                            tissue_replicates[name].append(n)
-        firstline = 0
-    else: 
-        # Select expresion values of SKCM according to the group
-        gene = fields[0]
-        result[gene] = {}
-        result[gene]['SKCM'] = {}
-        for group in tissue_replicates.keys():
-            result[gene]['SKCM'][group] = []
-            for index in tissue_replicates[group]:
-                result[gene]['SKCM'][group].append(float(fields[index]))
-with open('../Data/Processed/SKCM.pkl', 'wb') as archivo:
-    pickle.dump(result, archivo)
-
-# Create a dictionary with median TPM expression values for all genes and groups 
-tumors = ['ACC','BLCA','BRCA','CESC','CHOL','COAD','DLBC','ESCA','GBM','HNSC','KICH','KIRC','KIRP','LAML','LGG','LIHC','LUAD','LUSC','OV','PAAD','PCPG','PRAD','READ','SARC','SKCM','STAD','TGCT','THCA','THYM','UCEC','UCS']
+# Dictionary with the gtex tissue added to the control samples of each tumor
 gtex_tcga = {'ACC':'Adrenal Gland','BLCA':'Bladder','BRCA':'Breast','CESC':'Cervix Uteri', 'COAD':'Colon', 'DLBC':'Blood',
                 'ESCA':'Esophagus','GBM':'Brain','KICH':'Kidney','KIRC':'Kidney','KIRP':'Kidney','LAML':'Bone Marrow','LGG':'Brain',
                 'LIHC':'Liver','LUAD':'Lung','LUSC':'Lung','OV':'Ovary','PAAD':'Pancreas','PRAD':'Prostate','READ':'Colon','SKCM':'Skin',
                 'STAD':'Stomach','TGCT':'Testis','THCA':'Thyroid','THYM':'Blood','UCEC':'Uterus','UCS':'Uterus'}
 
-# Read expression data for the samples
-data = open(r'C:\Users\34656\Pipeline for TCGA_GTEX\Data\Processed\tcga_gtex_combined_data.csv','r')
-tumor_replicates = {} # Dictionary with the following strcutre {tumors_group:[position_indexes]}
-result = {} # Ditionary with following structure {gene:{tumor:{group:[median,sample_size]}}}
-firstline = 1
-n = 0
-# Identifiy the position of each tumor_group in the lines
-for line in data:
-    fields = line.strip().split(',')
-    if firstline:
-        for field in fields[1:]:
-            n += 1
-            field = field.split('.')[0]
-            abr = field.split('_')[0]
-            if abr in tumors:
-                if 'Primary' in field:
-                    name = abr + '_Tumor'
-                    if name not in tumor_replicates.keys():
-                        tumor_replicates[name] = [n]
-                    else:
-                        tumor_replicates[name].append(n)
-                elif 'Normal' in field:
-                    name = abr + '_Normal'
-                    if name not in tumor_replicates.keys():
-                        tumor_replicates[name] = [n]
-                    else:
-                        tumor_replicates[name].append(n)
-            else:                     
-                for tumor, tissue in gtex_tcga.items():
-                    if abr == tissue:
-                        name = tumor + '_Normal'
-                        if name not in tumor_replicates.keys():
-                            tumor_replicates[name] = [n]
-                        else:
-                            tumor_replicates[name].append(n)
-        firstline = 0
-    # Idnetify the expression values of the introduced gene belonging to each tumor_group
-    else: 
-        gene = fields[0]
-        result[gene] = {}
-        for sample in tumor_replicates.keys():
-            values = []
-            name = sample.split('_')
-            abr = name[0]
-            group = name[1]
-            if abr not in result[gene].keys():
-                result[gene][abr] = {}
-            for index in tumor_replicates[sample]:
-                values.append(float(fields[index]))
-            median = statistics.median(values)
-            result[gene][abr][group] = []
-            result[gene][abr][group].append(median)
-            result[gene][abr][group].append(len(values))
-with open('../Data/Processed/median.pkl', 'wb') as archivo:
-    pickle.dump(result, archivo)   
+def sample_group(label):
+    # Group (tumor_Tumor, tumor_Normal, tumor_Metastatic or gtex tissue) and project of a sample, None if not used
+    abr = label.split('_')[0]
+    if abr in tumors:
+        if 'Primary' in label:
+            return abr + '_Tumor', 'TCGA'
+        elif 'Normal' in label:
+            return abr + '_Normal', 'TCGA'
+        elif 'Metastatic' in label:
+            return abr + '_Metastatic', 'TCGA'
+    elif label in tissues:
+        return label, 'GTEX'
+    return None, None
+
+def tumor_statistics(values, tumor_columns, normal_columns):
+    # Median expression of the 'Primary tumor' and control samples of a tumor and p-values of the Mann-Whitney U test 
+    # comparing them, for all genes at once (NaN p-values if any of the groups has no samples). As scipy, the p-values
+    # are exact for small groups without ties
+    p_value = np.full(len(values), np.nan)
+    if tumor_columns and normal_columns:
+        p_value = mann_whitney(values[:,tumor_columns], values[:,normal_columns], method='auto').p_value
+    return column_median(values, tumor_columns), column_median(values, normal_columns), p_value
+
+def group_summary(values, columns):
+    # Box plot statistics of every gene in the given columns, in TPM and log2(TPM+1)
+    values = values[:,columns].astype(np.float64)
+    return summarize(values), summarize(np.log2(values + 1))
+
+def group_violins(values, columns):
+    # Violin densities of every gene in the given columns, in TPM and log2(TPM+1) (float16 as stored)
+    values = values[:,columns].astype(np.float64)
+    return [(support, density.astype(np.float16)) for support, density in
+            (violin_densities(values), violin_densities(np.log2(values + 1)))]
+
+if __name__ == '__main__':
+    # Gene and sample labels of the expression data (memory-mapped) and group of each sample
+    genes, labels, values = read_matrix(processed('targetable_genes_gtex_tcga'))
+    groups = {} # Dictionary with the following structure {group:(project,[position_indexes])}
+    for n, label in enumerate(labels):
+        name, project = sample_group(label)
+        if name is not None:
+            groups.setdefault(name, (project, []))[1].append(n)
+
+    # Create the expression store with the expression values of all genes for all tumoral groups and GTEX tissues
+    # Save the genes x samples matrix with the samples of each group in contiguous columns
+    write_store(processed('expression_store'), genes, values,
+                [(name, project, columns) for name, (project, columns) in groups.items()])
+
+    # Positions of the 'Primary tumor' and control samples ('Normal' samples and GTEX samples of the corresponding tissue)
+    # of each tumor
+    samples = {'Tumor':{}, 'Normal':{}}
+    for tumor in tumors:
+        samples['Tumor'][tumor] = groups.get(tumor + '_Tumor', (None, []))[1]
+        samples['Normal'][tumor] = groups.get(tumor + '_Normal', (None, []))[1] + groups.get(gtex_tcga.get(tumor), (None, []))[1]
+
+    # Median TPM expression values and sample size of the primary tumor and control samples of each tumor for all genes, 
+    # and p-values comparing 'Primary tumor' and control samples of each tumor with a Mann-Whitney U test. Each tumor is 
+    # a task of the worker processes sharing the memory-mapped expression matrix
+    statistics = map_matrix(tumor_statistics, processed('targetable_genes_gtex_tcga'),
+                            [(samples['Tumor'][tumor], samples['Normal'][tumor]) for tumor in tumors])
+    medians = {group:np.column_stack([result[k] for result in statistics]) for k, group in enumerate(samples)}
+    sizes = {group:np.array([len(samples[group][tumor]) for tumor in tumors], dtype=np.int32) for group in samples}
+    p_value = np.column_stack([result[2] for result in statistics])
+    # Create a dictionary with median TPM expression values for all genes and groups
+    median_lists = {group:medians[group].tolist() for group in samples}
+    result = {} # Ditionary with following structure {gene:{tumor:{group:[median,sample_size]}}}
+    for i, gene in enumerate(genes):
+        result[gene] = {tumor:{group:[median_lists[group][i][k], int(sizes[group][k])] for group in samples if sizes[group][k]}
+                        for k, tumor in enumerate(tumors)}
+    with open(processed('median.pkl'), 'wb') as archivo:
+        pickle.dump(result, archivo)
+
+    # Create dictionary with p-values of each gene and tumor
+    result = {gene:dict(zip(tumors, p)) for gene, p in zip(genes, p_value.tolist())} # Ditionary with following structure {gene:{tumor:p_value}}
+    with open(processed('p_value.pkl'), 'wb') as archivo:
+        pickle.dump(result, archivo)
+
+    # Create columnar gene x tumor tables for the tumor-associated antigens tool: p-value, adjusted p-value 
+    # (Benjamini-Hochberg over all genes of each tumor), median and sample size of tumor and control samples
+    q_value = np.full_like(p_value, np.nan)
+    for k in range(len(tumors)):
+        tested = ~np.isnan(p_value[:,k])
+        if tested.any():
+            q_value[tested,k] = smm.multipletests(p_value[tested,k], method='fdr_bh')[1]
+    write_antigen_tables(processed('antigen_tables.npz'), genes, tumors, p_value=p_value, q_value=q_value,
+                         tumor_median=medians['Tumor'], tumor_n=np.tile(sizes['Tumor'], (len(genes), 1)),
+                         control_median=medians['Normal'], control_n=np.tile(sizes['Normal'], (len(genes), 1)))
+
+    # Box plot statistics of every gene in each group of the expression store and in the control samples of each tumor
+    # ({tumor}_Control), in TPM and log2(TPM+1), so that the pages draw the box plots without reading the samples
+    summary_groups = [(name, columns) for name, (_, columns) in groups.items()]
+    summary_groups += [(tumor + '_Control', samples['Normal'][tumor]) for tumor in tumors]
+    summaries = map_matrix(group_summary, processed('targetable_genes_gtex_tcga'),
+                           [(columns,) for _, columns in summary_groups])
+    write_summary_tables(processed('summary_tables.npz'), genes, [name for name, _ in summary_groups],
+                         np.stack([summary for summary, _ in summaries], axis=1),
+                         np.stack([log2_summary for _, log2_summary in summaries], axis=1),
+                         [len(columns) for _, columns in summary_groups])
 
-# Create dictionary with tumor median and p-values comparing 'Primary tumor' and 'Normal' samples
-firstline = 1
-result = {} # Ditionary with following structure {gene:{tumor:p_value}}
-# Identifiy the position of each tumor_group in the lines
-for line in data:
-    fields = line.strip().split(',')
-    if firstline:
-        firstline = 0
-    # Idnetify the expression values of the introduced gene belonging to each tumor_group
-    else: 
-        gene = fields[0]
-        result[gene] = {}
-        for tumor in tumors:
-            T = tumor + '_Tumor'
-            N = tumor + '_Normal'
-            N_values = []
-            T_values = []
-            for index in tumor_replicates[T]:
-                T_values.append(float(fields[index]))
-            for index in tumor_replicates[N]:
-                N_values.append(float(fields[index]))
-            _, p_value = mannwhitneyu(T_values, N_values)
-            result[gene][tumor] = p_value
-with open('../Data/Processed/p_value.pkl', 'wb') as archivo:
-    pickle.dump(result, archivo)  
+    # Violin densities of every gene in the groups drawn as violins (all the summary groups except the normal samples, 
+    # which are only plotted within the control group of their tumor)
+    violin_groups = [(name, columns) for name, columns in summary_groups if not name.endswith('_Normal')]
+    violins = map_matrix(group_violins, processed('targetable_genes_gtex_tcga'),
+                         [(columns,) for _, columns in violin_groups])
+    write_violin_store(processed('violin_store'), genes, [name for name, _ in violin_groups], violins)
@@ -1,53 +1,19 @@
-from math import log2
-import pandas as pd
-
-# Transform expression data to log2(TPM+1)
-data = open('../Data/Processed/targetable_gene_Tpm_TumorVsControl.csv','r')
-out = open('../Data/Processed/combined_log2_expression.csv','w')
-n = 0
-for line in data:
-    if n == 0:
-        out.write(line)
-        n = 1
-    else: 
-        line = line.strip()
-        fields = line.split(',')
-        write = fields[0]
-        for field in fields[1:]:
-            field = float(field)
-            expression = log2(field +1)
-            write += ',' + str(expression)
-        out.write(write + '\n')
-out.close()
+## Calculate log2(FC) as log2(TPM+1) tumor expression - log2(TPM+1) control expression 
 
-# Remove columns of Metastasic samples and tumors without control data
-data = pd.read_csv('../Data/Processed/combined_log2_expression.csv', index_col= False)
-out = pd.DataFrame()
-for column in data.columns:
-    if column != 'MESO' and column != 'UVM':
-        if 'Metastatic' not in column:
-            out[column] = data[column]
-out.to_csv('../Data/Processed/combined_log2_expression_v2.csv', index=False) 
+import numpy as np
+import pandas as pd
+from common import processed, read_matrix
+from cartar.tables import write_fold_change_table
 
-# Calculate log2(FC) as log2(TPM+1) tumor expression - log2(TPM+1) control expression 
-data = open('../Data/Processed/combined_log2_expression_v2.csv','r')
-out = open('../Data/Processed/log2FC_expression.csv','w')
-n = 0
-for line in data: 
-    line = line.strip()
-    fields = line.split(',')
-    if n == 0:
-        write = fields[0]
-        for field in fields[1::2]:
-            write += ',' + field 
-        n = 1
-        out.write(write + '\n')
-    else: 
-        write = fields[0]
-        k = 2
-        for field in fields[1::2]:
-            logFC = float(field) - float(fields[k])
-            k += 2
-            write += ',' + str(logFC)
-        out.write(write + '\n')
-out.close()
\ No newline at end of file
+# Transform median expression data to log2(TPM+1)
+genes, groups, medians = read_matrix(processed('targetable_gene_Tpm_TumorVsControl'))
+data = pd.DataFrame(medians, index=genes, columns=groups)
+log2_data = np.log2(data + 1)
+# Pair each tumor ('Primary tumor' samples) with its control group. Metastasic samples and tumors without control
+# data (e.g: MESO and UVM) are not included
+tumors = [column for column in data.columns if '_' not in column and column + '_Normal' in data.columns]
+controls = [tumor + '_Normal' for tumor in tumors]
+log2FC = log2_data[tumors].to_numpy() - log2_data[controls].to_numpy()
+pd.DataFrame(log2FC, index=data.index, columns=tumors).to_csv(processed('log2FC_expression.csv'), index_label='gene')
+# Numeric copy of the table loaded by the web app
+write_fold_change_table(processed('log2FC_expression.npz'), data.index.tolist(), tumors, log2FC)
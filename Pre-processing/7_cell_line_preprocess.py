@@ -1,11 +1,14 @@
 # Preporcess cell line data files
 import pandas as pd
+from common import raw, processed, create_processed_dir
+from cartar.cell_lines import write_cell_line_store, VERSION
 
 # Open files
-expression = pd.read_csv('../Data/Raw/Expression_Public_23Q4.csv')
-metadata = open('../Data/Raw/cell_line_metadata.csv', 'r')
-out = open('../Data/Processed/cell_line_metadata.csv','w')
-out2 = open('../Data/Processed/genes_cells.csv','w')
+expression = pd.read_csv(raw('Expression_Public_23Q4.csv'))
+metadata = open(raw('cell_line_metadata.csv'), 'r')
+create_processed_dir()
+out = open(processed('cell_line_metadata.csv'),'w')
+out2 = open(processed('genes_cells.csv'),'w')
 
 # Remove cell lines from metadata file not pressent in expression file
 # Identify cell lines in expression file
@@ -21,13 +24,13 @@ for line in metadata:
         if cell_line in exp_lines:
             out.write(line)
 out.close()
-df = pd.read_csv('../Data/Processed/cell_line_metadata.csv')
+df = pd.read_csv(processed('cell_line_metadata.csv'))
 columns = ['ModelID','CellLineName','OncotreeLineage','OncotreePrimaryDisease','OncotreeSubtype','OncotreeCode','CatalogNumber']
 df_reduced = df[columns]
-df_reduced.to_csv('../Data/Processed/cell_line_metadata_reduced.csv', index=False)
+df_reduced.to_csv(processed('cell_line_metadata_reduced.csv'), index=False)
 
 # Keep only expression data of genes in the indicated Gene Ontology (e.g: located in cell surface)
-GO = open('../Data/Processed/GO_simplified_list.txt','r')
+GO = open(processed('GO_simplified_list.txt'),'r')
 genes = ['Unnamed: 0']
 for line in GO: 
 	line = line.strip()
@@ -42,4 +45,10 @@ write = ','.join(found_genes[1:])
 out2.write(write)
 out2.close()
 expression_filtered = expression[found_genes]
-expression_filtered.to_csv('../Data/Processed/Expression_Public_23Q4_filtered.csv', index=False)
\ No newline at end of file
+expression_filtered.to_csv(processed('Expression_Public_23Q4_filtered.csv'), index=False)
+
+# Create the cell line store used by the cell line selector: log2(TPM+1) expression of the selected genes 
+# (cell lines x genes, each gene once although it can be repeated in the gene list) and metadata of each cell line
+store_genes = list(dict.fromkeys(found_genes[1:]))
+write_cell_line_store(processed('cell_line_store.npz'), expression['Unnamed: 0'].tolist(), store_genes,
+                      expression[store_genes].to_numpy(), df_reduced.set_index('ModelID'), VERSION)
@@ -0,0 +1,174 @@
+## Benchmark the pre-processing stages and compare benchmark reports
+##
+## run: run the stages one after the other (whether they are up to date or not) and save a JSON report with the wall
+## time, CPU time, peak memory of the largest process, disk reads/writes and size of the declared input/output files of
+## each stage. With --synthetic the raw data is first generated with synthetic_data.py at the given scale of the real
+## data.
+##
+## diff: compare two reports stage by stage and exit with code 1 if any stage got slower or used more memory than the
+## threshold (e.g: to catch regressions when the data release grows or to prove an optimization).
+##
+## python benchmark.py run [--data-dir DIR] [--synthetic SCALE] [--workers N] [--output REPORT] [stage ...]
+## python benchmark.py diff OLD_REPORT NEW_REPORT [--threshold PERCENT]
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from run_pipeline import PIPELINE_DIR, ROOT_DIR, select_stages
+
+METRICS = ['wall_s', 'cpu_s', 'max_rss_mb', 'read_mb', 'written_mb', 'input_mb', 'output_mb']
+HEADERS = {'wall_s': 'wall (s)', 'cpu_s': 'CPU (s)', 'max_rss_mb': 'max proc RSS (MB)', 'read_mb': 'read (MB)',
+           'written_mb': 'written (MB)', 'input_mb': 'inputs (MB)', 'output_mb': 'outputs (MB)'}
+# Metrics checked for regressions by diff and absolute change below which a difference is taken as noise
+NOISE = {'wall_s': 0.5, 'cpu_s': 0.5, 'max_rss_mb': 10}
+# Size of the blocks counted by ru_inblock and ru_oublock
+BLOCK_SIZE = 512
+
+
+def size(data_dir, paths):
+    # Total size in MB of the files that exist
+    paths = [os.path.join(data_dir, path) for path in paths]
+    return round(sum(os.path.getsize(path) for path in paths if os.path.exists(path)) / 1e6, 3)
+
+
+def measure(stage, data_dir, env):
+    # Run a stage and return its resource usage. The CPU time and the disk reads/writes given by wait4 add up the stage 
+    # and its worker processes, but ru_maxrss is the peak RSS of the largest of them, not of all of them together. The 
+    # reads only count the data not found in the page cache. The size of the declared input/output files is reported 
+    # separately (the stages can read their memory-mapped inputs partially or several times)
+    inputs = size(data_dir, stage.inputs)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, stage.script] + stage.args, cwd=PIPELINE_DIR, env=env)
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = usage.ru_maxrss / (1 << 20 if sys.platform == 'darwin' else 1 << 10)
+    return {'name': stage.name, 'exit_code': process.returncode, 'wall_s': round(wall, 3),
+            'user_s': round(usage.ru_utime, 3), 'system_s': round(usage.ru_stime, 3),
+            'cpu_s': round(usage.ru_utime + usage.ru_stime, 3), 'max_rss_mb': round(max_rss, 1),
+            'read_mb': round(usage.ru_inblock * BLOCK_SIZE / 1e6, 3),
+            'written_mb': round(usage.ru_oublock * BLOCK_SIZE / 1e6, 3),
+            'input_mb': inputs, 'output_mb': size(data_dir, stage.outputs)}
+
+
+def run(args):
+    data_dir = os.path.abspath(args.data_dir)
+    if args.synthetic is not None:
+        subprocess.check_call([sys.executable, 'synthetic_data.py', data_dir, '--scale', str(args.synthetic)],
+                              cwd=PIPELINE_DIR)
+    stages = select_stages(args.stages)
+    env = dict(os.environ, CARTAR_DATA_DIR=data_dir)
+    if args.workers:
+        env['CARTAR_WORKERS'] = str(args.workers)
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'data_dir': data_dir, 'scale': args.synthetic,
+              'raw_mb': size(data_dir, ['Raw/' + name for name in os.listdir(os.path.join(data_dir, 'Raw'))]),
+              'workers': int(env.get('CARTAR_WORKERS', 0)) or os.cpu_count(), 'cpu_count': os.cpu_count(),
+              'python': platform.python_version(), 'platform': platform.platform(), 'commit': commit(), 'stages': []}
+    for stage in stages:
+        print(f'[run] {stage.name}', flush=True)
+        result = measure(stage, data_dir, env)
+        report['stages'].append(result)
+        if result['exit_code'] != 0:
+            print(f'[failed] {stage.name} (exit code {result["exit_code"]})', flush=True)
+            break
+    report['total'] = total(report['stages'])
+    output = args.output or os.path.join(data_dir, 'benchmark_' + time.strftime('%Y%m%d_%H%M%S') + '.json')
+    with open(output, 'w') as out:
+        json.dump(report, out, indent=1)
+    print_table(report['stages'] + [dict(report['total'], name='total')])
+    print(f'Report saved to {output}')
+    if any(stage['exit_code'] != 0 for stage in report['stages']):
+        sys.exit(1)
+
+
+def total(stages):
+    # Summed time and sizes and largest peak memory of the stages (metrics missing from older reports are left out)
+    totals = {metric: round(sum(stage[metric] for stage in stages), 3) for metric in METRICS
+              if metric != 'max_rss_mb' and all(metric in stage for stage in stages)}
+    totals['max_rss_mb'] = max((stage['max_rss_mb'] for stage in stages), default=0)
+    return totals
+
+
+def commit():
+    # Current git commit of the repository (None if git is not available)
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(rows):
+    print(f'{"stage":<22}' + ''.join(f'{HEADERS[metric]:>19}' for metric in METRICS))
+    for row in rows:
+        print(f'{row["name"]:<22}' + ''.join(f'{row[metric]:>19.2f}' for metric in METRICS))
+
+
+def change(old, new):
+    # Relative change in percent (None if the old value is 0)
+    return (new - old) / old * 100 if old else None
+
+
+def diff(args):
+    with open(args.old, 'r') as old_file, open(args.new, 'r') as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    old_stages = {stage['name']: stage for stage in old['stages']}
+    new_stages = {stage['name']: stage for stage in new['stages']}
+    names = [name for name in old_stages if name in new_stages]
+    # The total row only adds up the stages found in both reports
+    rows = [(name, old_stages[name], new_stages[name]) for name in names]
+    rows.append(('total', total([before for _, before, _ in rows]), total([after for _, _, after in rows])))
+    for name in sorted(set(old_stages) ^ set(new_stages)):
+        print(f'{name} only in the {"old" if name in old_stages else "new"} report')
+    print(f'{"stage":<22}' + ''.join(f'{HEADERS[metric]:>26}' for metric in METRICS))
+    regressions = []
+    for name, before, after in rows:
+        cells = []
+        for metric in METRICS:
+            if metric not in before or metric not in after:
+                # Metric added after one of the reports was created
+                cells.append('n/a')
+                continue
+            percent = change(before[metric], after[metric])
+            cells.append(f'{before[metric]:.2f} -> {after[metric]:.2f}'
+                         + (f' ({percent:+.0f}%)' if percent is not None else ''))
+            if (metric in NOISE and percent is not None and percent > args.threshold
+                    and after[metric] - before[metric] > NOISE[metric]):
+                regressions.append(f'{name} {HEADERS[metric]} {percent:+.0f}%')
+        print(f'{name:<22}' + ''.join(f'{cell:>26}' for cell in cells))
+    if regressions:
+        print(f'Regressions above {args.threshold:g}%: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the CARTAR pre-processing stages.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the stages and save a report')
+    run_parser.add_argument('stages', nargs='*', help='stages to run (with the stages they depend on), all by default')
+    run_parser.add_argument('--data-dir', default=os.environ.get('CARTAR_DATA_DIR', os.path.join(ROOT_DIR, 'Data')),
+                            help='folder with the Raw and Processed data (default: CARTAR_DATA_DIR or the Data folder)')
+    run_parser.add_argument('--synthetic', type=float, metavar='SCALE',
+                            help='generate synthetic raw data at this scale of the real data before running')
+    run_parser.add_argument('--workers', type=int, help='worker processes of the stages split by tumor/tissue')
+    run_parser.add_argument('--output', help='report file (default: benchmark_<date>.json in the data folder)')
+    diff_parser = commands.add_parser('diff', help='compare two reports')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    diff_parser.add_argument('--threshold', type=float, default=10,
+                             help='percent increase of wall time, CPU time or max process RSS reported as a regression (default: 10), '
+                                  'ignoring changes below 0.5 s or 10 MB')
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        diff(args)
+
+
+if __name__ == '__main__':
+    main()
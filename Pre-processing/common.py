@@ -0,0 +1,87 @@
+## Paths and command line options shared by the pre-processing stages
+
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Make the cartar package importable from the stages
+sys.path.insert(0, ROOT_DIR)
+
+# Folder with the Raw and Processed data (the Data folder of the repository unless CARTAR_DATA_DIR is set)
+DATA_DIR = os.path.abspath(os.environ.get('CARTAR_DATA_DIR', os.path.join(ROOT_DIR, 'Data')))
+RAW_DIR = os.path.join(DATA_DIR, 'Raw')
+PROCESSED_DIR = os.path.join(DATA_DIR, 'Processed')
+# Number of worker processes of the stages that split their work by tumor/tissue (all the cores unless CARTAR_WORKERS 
+# is set)
+WORKERS = int(os.environ.get('CARTAR_WORKERS', 0)) or os.cpu_count()
+
+def raw(name):
+    # Path of a raw data file
+    return os.path.join(RAW_DIR, name)
+
+def processed(name):
+    # Path of a processed data file
+    return os.path.join(PROCESSED_DIR, name)
+
+def create_processed_dir():
+    # Create the Processed folder before writing to it (done by the stages, never on import)
+    os.makedirs(PROCESSED_DIR, exist_ok=True)
+
+def write_labels(path, genes, columns):
+    # Save the gene (row) and column labels of the matrix saved in path + '.npy' to path + '.json'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.json', 'w') as out:
+        json.dump({'genes':list(genes), 'columns':list(columns)}, out)
+
+def create_matrix(path, genes, columns, dtype=np.float32):
+    # Memory-mapped genes x columns matrix saved in path + '.npy' (with its labels) to be filled by the caller
+    write_labels(path, genes, columns)
+    return np.lib.format.open_memmap(path + '.npy', mode='w+', dtype=dtype, shape=(len(genes), len(columns)))
+
+def write_matrix(path, values, genes, columns):
+    # Save a genes x columns matrix to path + '.npy' and its labels to path + '.json'
+    write_labels(path, genes, columns)
+    np.save(path + '.npy', values)
+
+def read_matrix(path):
+    # Gene labels, column labels and memory-mapped values of a matrix saved with write_matrix or create_matrix
+    with open(path + '.json', 'r') as labels_file:
+        labels = json.load(labels_file)
+    return labels['genes'], labels['columns'], np.load(path + '.npy', mmap_mode='r')
+
+def column_median(values, columns):
+    # Median expression of every gene (row) in the given columns (NaN if there are no columns)
+    if not len(columns):
+        return np.full(len(values), np.nan)
+    return np.median(values[:,columns].astype(np.float64), axis=1)
+
+_shared = None # Matrix mapped by each worker process of map_matrix
+
+def _map_shared(path):
+    global _shared
+    _shared = read_matrix(path)[2]
+
+def _call_shared(task):
+    return task[0](_shared, *task[1:])
+
+def map_matrix(function, path, tasks, workers=WORKERS):
+    # Results of function(values, *task) for each task, where values is the matrix saved at path. The tasks run in 
+    # a pool of worker processes that memory-map the matrix once, so the workers share it without copying it. 
+    # function must be defined at the top level of a module (the stage body goes under if __name__ == '__main__')
+    tasks = [(function,) + tuple(task) for task in tasks]
+    if workers == 1 or len(tasks) < 2:
+        _map_shared(path)
+        return [_call_shared(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_map_shared, initargs=(path,)) as pool:
+        return list(pool.map(_call_shared, tasks))
+
+def selected(choices=('tcga', 'gtex')):
+    # Parts of a stage given in the command line (e.g: python 1_pre-process.py gtex), all of them if none is given
+    names = sys.argv[1:] or list(choices)
+    unknown = [name for name in names if name not in choices]
+    if unknown:
+        sys.exit(f'Unknown option(s) {unknown}, choose from {list(choices)}')
+    return names
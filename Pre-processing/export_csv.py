@@ -0,0 +1,29 @@
+## Export the binary matrices exchanged by the pre-processing stages as human-readable CSV files (one row per gene)
+##
+## python export_csv.py [name ...] (e.g: python export_csv.py tcgaTpm_selected_v3), all the matrices by default
+
+import glob
+import os
+import sys
+import pandas as pd
+from common import PROCESSED_DIR, processed, read_matrix
+
+CHUNK_SIZE = 2000 # Number of genes written at once
+
+def export(name):
+    # Write the matrix saved as name.npy/name.json in the Processed folder to name.csv
+    genes, columns, values = read_matrix(processed(name))
+    with open(processed(name + '.csv'), 'w') as out:
+        for start in range(0, len(genes), CHUNK_SIZE):
+            chunk = pd.DataFrame(values[start:start + CHUNK_SIZE], index=genes[start:start + CHUNK_SIZE], columns=columns)
+            chunk.to_csv(out, header=start == 0, index_label='gene')
+
+matrices = sorted(os.path.basename(path)[:-len('.npy')] for path in glob.glob(os.path.join(PROCESSED_DIR, '*.npy'))
+                  if os.path.exists(path[:-len('.npy')] + '.json'))
+names = sys.argv[1:] or matrices
+unknown = [name for name in names if name not in matrices]
+if unknown:
+    sys.exit(f'Unknown matrix(es) {unknown}, choose from {matrices}')
+for name in names:
+    export(name)
+    print(f'{name}.csv')
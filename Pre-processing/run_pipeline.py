@@ -0,0 +1,282 @@
+## Run the pre-processing stages that are out of date
+##
+## Each stage declares the files it reads and writes (relative to the data folder). A stage is run again only if
+## the content of its inputs or code changed since its last successful run, or if any of its outputs is missing or
+## was modified. Stages whose inputs are ready run in parallel processes (e.g: the TCGA and GTEX branches).
+## With --publish, the files read by the app are then copied from the Processed folder to the app data folder (the
+## Data folder unless --app-dir or CARTAR_APP_DATA is given); only the files that changed are replaced.
+##
+## python run_pipeline.py [--data-dir DIR] [--jobs N] [--workers N] [--force] [--dry-run] [--publish [--app-dir DIR]]
+##                        [stage ...]
+
+import argparse
+import filecmp
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(PIPELINE_DIR)
+STATE_FILE = 'Processed/.pipeline_state.json'
+
+Stage = namedtuple('Stage', ['name', 'script', 'args', 'inputs', 'outputs'])
+
+def matrix(name):
+    # Files of a binary matrix saved with common.write_matrix (values and gene/column labels)
+    return [f'Processed/{name}.npy', f'Processed/{name}.json']
+
+
+STAGES = [
+    Stage('pre_process_tcga', '1_pre-process.py', ['tcga'],
+          ['Raw/tcga_RSEM_gene_tpm', 'Raw/probeMap_gencode.v23.annotation.gene.probemap', 'Raw/HUGO.txt'],
+          matrix('tcgaTpm')),
+    Stage('pre_process_gtex', '1_pre-process.py', ['gtex'],
+          ['Raw/gtex_RSEM_gene_tpm', 'Raw/probeMap_gencode.v23.annotation.gene.probemap', 'Raw/HUGO.txt'],
+          matrix('gtexTpm')),
+    Stage('go_list', '2_select_genes.py', ['go'],
+          ['Raw/GO_0005886.txt'],
+          ['Processed/GO_simplified_list.txt']),
+    Stage('select_genes_tcga', '2_select_genes.py', ['tcga'],
+          ['Processed/GO_simplified_list.txt'] + matrix('tcgaTpm'),
+          matrix('tcgaTpm_selected_v1')),
+    Stage('select_genes_gtex', '2_select_genes.py', ['gtex'],
+          ['Processed/GO_simplified_list.txt'] + matrix('gtexTpm'),
+          matrix('gtexTpm_selected_v1') + ['Processed/no_membrane_genes.csv']),
+    Stage('sample_type_tcga', '3_sample_type.py', ['tcga'],
+          ['Raw/TCGA_phenotype_denseDataOnlyDownload.tsv'] + matrix('tcgaTpm_selected_v1'),
+          ['Processed/TCGA_sample_cancertype.tsv', 'Processed/tcga_sample_metadata.tsv']
+          + matrix('tcgaTpm_selected_v3')),
+    Stage('sample_type_gtex', '3_sample_type.py', ['gtex'],
+          ['Raw/GTEX_phenotype.tsv'] + matrix('gtexTpm_selected_v1'),
+          ['Processed/gtex_sample_metadata.tsv'] + matrix('gtexTpm_selected_v3')),
+    Stage('group_samples', '4_group_samples.py', [],
+          matrix('tcgaTpm_selected_v3') + matrix('gtexTpm_selected_v3'),
+          ['Processed/gtex_targetable_gene_Tpm_by_tissue.csv', 'Processed/replicates.tsv',
+           'Processed/group_replicates.tsv', 'Processed/targetable_gene_Tpm_TumorVsControl_final.csv',
+           'Processed/median_tables.npz']
+          + matrix('targetable_genes_gtex_tcga') + matrix('targetable_gene_Tpm_TumorVsControl')),
+    Stage('create_dictionaries', '5_create_dictionaries.py', [],
+          matrix('targetable_genes_gtex_tcga'),
+          ['Processed/expression_store/matrix.npy', 'Processed/expression_store/index.json',
+           'Processed/median.pkl', 'Processed/p_value.pkl', 'Processed/antigen_tables.npz',
+           'Processed/summary_tables.npz', 'Processed/violin_store/density.npy', 'Processed/violin_store/support.npy',
+           'Processed/violin_store/index.json']),
+    Stage('log2FC', '6_log2FC.py', [],
+          matrix('targetable_gene_Tpm_TumorVsControl'),
+          ['Processed/log2FC_expression.csv', 'Processed/log2FC_expression.npz']),
+    Stage('cell_lines', '7_cell_line_preprocess.py', [],
+          ['Raw/Expression_Public_23Q4.csv', 'Raw/cell_line_metadata.csv', 'Processed/GO_simplified_list.txt'],
+          ['Processed/cell_line_metadata.csv', 'Processed/genes_cells.csv', 'Processed/cell_line_metadata_reduced.csv',
+           'Processed/Expression_Public_23Q4_filtered.csv', 'Processed/cell_line_store.npz',
+           'Processed/cell_line_store.npz.sha256']),
+]
+
+# Outputs read by the app (see cartar/data.py), copied by --publish to the same path relative to the app data folder.
+# The index of each store goes after its arrays, since the app reloads a store when its index changes
+APP_FILES = ['Processed/log2FC_expression.csv', 'Processed/log2FC_expression.npz', 'Processed/no_membrane_genes.csv',
+             'Processed/genes_cells.csv', 'Processed/antigen_tables.npz', 'Processed/median_tables.npz',
+             'Processed/summary_tables.npz', 'Processed/expression_store/matrix.npy',
+             'Processed/expression_store/index.json', 'Processed/violin_store/density.npy',
+             'Processed/violin_store/support.npy', 'Processed/violin_store/index.json',
+             'Processed/cell_line_store.npz.sha256', 'Processed/cell_line_store.npz']
+
+
+class Fingerprints:
+    """SHA-256 of files, recomputed only when their size or modification time changed."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __call__(self, path):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns]
+        cached = self.cache.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as data:
+            for chunk in iter(lambda: data.read(1 << 24), b''):
+                digest.update(chunk)
+        self.cache[path] = key + [digest.hexdigest()]
+        return digest.hexdigest()
+
+
+def code_files(stage):
+    # Stage script, shared pre-processing module and cartar modules imported by the script
+    script = os.path.join(PIPELINE_DIR, stage.script)
+    with open(script, 'r', encoding='utf-8') as code:
+        modules = re.findall(r'^from cartar\.(\w+) import', code.read(), flags=re.MULTILINE)
+    return [script, os.path.join(PIPELINE_DIR, 'common.py')] + [os.path.join(ROOT_DIR, 'cartar', module + '.py')
+                                                                for module in sorted(set(modules))]
+
+
+def fingerprint(stage, data_dir, fingerprints):
+    # Content hash of the code and inputs of a stage
+    return {'code': {os.path.relpath(path, ROOT_DIR): fingerprints(path) for path in code_files(stage)},
+            'inputs': {path: fingerprints(os.path.join(data_dir, path)) for path in stage.inputs}}
+
+
+def out_of_date(stage, record, current, data_dir, fingerprints):
+    # Reason to run the stage, None if it is up to date
+    if record is None:
+        return 'never run'
+    missing = [path for path, digest in current['inputs'].items() if digest is None]
+    if missing:
+        return f'missing inputs {missing}'
+    for kind in ('code', 'inputs'):
+        changed = [path for path, digest in current[kind].items() if record[kind].get(path) != digest]
+        if changed:
+            return f'{kind} changed {changed}'
+    changed = [path for path in stage.outputs if fingerprints(os.path.join(data_dir, path)) != record['outputs'].get(path)]
+    if changed:
+        return f'outputs missing or modified {changed}'
+    return None
+
+
+def run_stage(stage, data_dir, workers=None):
+    # Run the stage script in its own process and return the exit code and wall time
+    start = time.time()
+    env = dict(os.environ, CARTAR_DATA_DIR=data_dir)
+    if workers:
+        env['CARTAR_WORKERS'] = str(workers)
+    code = subprocess.call([sys.executable, stage.script] + stage.args, cwd=PIPELINE_DIR, env=env)
+    return code, time.time() - start
+
+
+def dependencies(stages):
+    # Stages producing the inputs of each stage
+    producers = {output: stage.name for stage in STAGES for output in stage.outputs}
+    names = {stage.name for stage in stages}
+    return {stage.name: {producers[path] for path in stage.inputs if producers.get(path) in names} for stage in stages}
+
+
+def publish(stages, data_dir, app_dir, dry_run=False):
+    # Copy the app files written by the stages to the app data folder, replacing each file at once so the running app
+    # never reads a partial copy. Unchanged files are left as they are (and so are the app caches keyed by them)
+    outputs = {path for stage in stages for path in stage.outputs}
+    for path in [path for path in APP_FILES if path in outputs]:
+        source = os.path.join(data_dir, path)
+        target = os.path.join(app_dir, os.path.relpath(path, 'Processed'))
+        if os.path.exists(source) and os.path.exists(target) and filecmp.cmp(source, target, shallow=False):
+            continue
+        print(f'[{"would publish" if dry_run else "publish"}] {os.path.relpath(target, app_dir)}', flush=True)
+        if not dry_run:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target + '.tmp')
+            os.replace(target + '.tmp', target)
+
+
+def select_stages(names):
+    # Requested stages and the stages they depend on, in declaration order
+    if not names:
+        return list(STAGES)
+    unknown = set(names) - {stage.name for stage in STAGES}
+    if unknown:
+        sys.exit(f'Unknown stage(s) {sorted(unknown)}, choose from {[stage.name for stage in STAGES]}')
+    needed = set(names)
+    depends = dependencies(STAGES)
+    for stage in reversed(STAGES):
+        if stage.name in needed:
+            needed |= depends[stage.name]
+    return [stage for stage in STAGES if stage.name in needed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the out of date CARTAR pre-processing stages.')
+    parser.add_argument('stages', nargs='*', help='stages to bring up to date (with their dependencies), all by default')
+    parser.add_argument('--data-dir', default=os.environ.get('CARTAR_DATA_DIR', os.path.join(ROOT_DIR, 'Data')),
+                        help='folder with the Raw and Processed data (default: CARTAR_DATA_DIR or the Data folder)')
+    parser.add_argument('--jobs', type=int, default=2, help='maximum number of stages run at the same time')
+    parser.add_argument('--workers', type=int,
+                        help='worker processes of the stages split by tumor/tissue (default: CARTAR_WORKERS or all cores)')
+    parser.add_argument('--force', action='store_true', help='run the stages even if they are up to date')
+    parser.add_argument('--dry-run', action='store_true', help='only report which stages would run')
+    parser.add_argument('--publish', action='store_true',
+                        help='copy the processed files read by the app to the app data folder after the stages')
+    parser.add_argument('--app-dir', default=os.environ.get('CARTAR_APP_DATA', os.path.join(ROOT_DIR, 'Data')),
+                        help='data folder of the app (default: CARTAR_APP_DATA or the Data folder)')
+    args = parser.parse_args()
+    data_dir = os.path.abspath(args.data_dir)
+    stages = select_stages(args.stages)
+    depends = dependencies(stages)
+
+    state_file = os.path.join(data_dir, STATE_FILE)
+    state = {'files': {}, 'stages': {}}
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as saved:
+            state = json.load(saved)
+    fingerprints = Fingerprints(state['files'])
+
+    def save_state():
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        with open(state_file + '.tmp', 'w') as out:
+            json.dump(state, out, indent=1, sort_keys=True)
+        os.replace(state_file + '.tmp', state_file)
+
+    pending = list(stages)
+    done, failed, rerun = set(), set(), set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if depends[stage.name] & failed:
+                    print(f'[skip] {stage.name}: a previous stage failed', flush=True)
+                    pending.remove(stage)
+                    failed.add(stage.name)
+                    continue
+                if not depends[stage.name] <= done:
+                    continue
+                pending.remove(stage)
+                current = fingerprint(stage, data_dir, fingerprints)
+                reason = 'forced' if args.force else out_of_date(stage, state['stages'].get(stage.name), current,
+                                                                 data_dir, fingerprints)
+                if args.dry_run and reason is None and depends[stage.name] & rerun:
+                    reason = 'an input stage would run'
+                if reason is None:
+                    print(f'[up to date] {stage.name}', flush=True)
+                    done.add(stage.name)
+                elif args.dry_run:
+                    print(f'[would run] {stage.name}: {reason}', flush=True)
+                    done.add(stage.name)
+                    rerun.add(stage.name)
+                else:
+                    print(f'[run] {stage.name}: {reason}', flush=True)
+                    running[pool.submit(run_stage, stage, data_dir, args.workers)] = (stage, current)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, current = running.pop(future)
+                code, seconds = future.result()
+                if code != 0:
+                    print(f'[failed] {stage.name} (exit code {code})', flush=True)
+                    failed.add(stage.name)
+                    continue
+                current['outputs'] = {path: fingerprints(os.path.join(data_dir, path)) for path in stage.outputs}
+                missing = [path for path, digest in current['outputs'].items() if digest is None]
+                if missing:
+                    print(f'[failed] {stage.name} did not write {missing}', flush=True)
+                    failed.add(stage.name)
+                    continue
+                state['stages'][stage.name] = current
+                save_state()
+                print(f'[done] {stage.name} ({seconds:.1f} s)', flush=True)
+                done.add(stage.name)
+    save_state()
+    if failed:
+        sys.exit(1)
+    if args.publish:
+        publish(stages, data_dir, os.path.abspath(args.app_dir), args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+## Generate synthetic raw data files to run and time the pre-processing stages without downloading the real data
+##
+## The files have the layout of the real downloads: UCSC Xena TCGA and GTEX log2(TPM+0.001) matrices, gene probe map
+## and phenotypes, HUGO protein-coding gene list, GO plasma membrane annotation list and DepMap expression and model
+## files. Their size is given relative to the real data with --scale (e.g: 1, 0.1 or 0.01), and any count can be set
+## directly. The same seed always gives the same files.
+##
+## python synthetic_data.py OUT_DIR [--scale X] [--genes N] [--tcga-samples N] [--gtex-samples N] [--tumors N]
+##                          [--tissues N] [--cell-lines N] [--seed N]
+##
+## The files are written to OUT_DIR/Raw, ready for: python run_pipeline.py --data-dir OUT_DIR
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Size of the real data (Xena TCGA and GTEX RSEM TPM matrices and DepMap Public 23Q4)
+PRODUCTION = {'genes':60498, 'tcga_samples':10535, 'gtex_samples':7862, 'cell_lines':1450}
+PROTEIN_CODING = 0.33 # Fraction of the genes that are protein coding (HUGO list)
+MEMBRANE = 0.28 # Fraction of the protein coding genes annotated in the plasma membrane (GO list)
+CHUNK_SIZE = 1000 # Number of genes generated and written at once
+MIN_LOG = np.log2(0.001) # log2(TPM+0.001) of a gene not detected in a sample
+
+# TCGA primary disease, tumor abbreviation and approximate number of samples of each tumor
+TUMORS = [('breast invasive carcinoma', 'BRCA', 1212), ('kidney clear cell carcinoma', 'KIRC', 607),
+          ('lung adenocarcinoma', 'LUAD', 576), ('thyroid carcinoma', 'THCA', 572),
+          ('head & neck squamous cell carcinoma', 'HNSC', 564), ('lung squamous cell carcinoma', 'LUSC', 552),
+          ('prostate adenocarcinoma', 'PRAD', 550), ('brain lower grade glioma', 'LGG', 530),
+          ('skin cutaneous melanoma', 'SKCM', 473), ('stomach adenocarcinoma', 'STAD', 450),
+          ('bladder urothelial carcinoma', 'BLCA', 427), ('ovarian serous cystadenocarcinoma', 'OV', 427),
+          ('liver hepatocellular carcinoma', 'LIHC', 423), ('colon adenocarcinoma', 'COAD', 329),
+          ('kidney papillary cell carcinoma', 'KIRP', 321), ('cervical & endocervical cancer', 'CESC', 309),
+          ('sarcoma', 'SARC', 265), ('uterine corpus endometrioid carcinoma', 'UCEC', 201),
+          ('esophageal carcinoma', 'ESCA', 195), ('pheochromocytoma & paraganglioma', 'PCPG', 187),
+          ('pancreatic adenocarcinoma', 'PAAD', 183), ('acute myeloid leukemia', 'LAML', 173),
+          ('glioblastoma multiforme', 'GBM', 172), ('testicular germ cell tumor', 'TGCT', 156),
+          ('thymoma', 'THYM', 122), ('rectum adenocarcinoma', 'READ', 105), ('kidney chromophobe', 'KICH', 91),
+          ('mesothelioma', 'MESO', 87), ('uveal melanoma', 'UVM', 80), ('adrenocortical cancer', 'ACC', 79),
+          ('uterine carcinosarcoma', 'UCS', 57), ('diffuse large B-cell lymphoma', 'DLBC', 47),
+          ('cholangiocarcinoma', 'CHOL', 45)]
+# GTEX tissue and approximate number of samples of each tissue
+TISSUES = [('Brain', 1152), ('Skin', 812), ('Esophagus', 763), ('Blood Vessel', 689), ('Adipose Tissue', 515),
+           ('Blood', 444), ('Muscle', 396), ('Heart', 377), ('Colon', 345), ('Thyroid', 323), ('Lung', 320),
+           ('Nerve', 278), ('Breast', 214), ('Stomach', 204), ('Pancreas', 197), ('Testis', 172),
+           ('Adrenal Gland', 159), ('Liver', 136), ('Prostate', 119), ('Spleen', 118), ('Pituitary', 107),
+           ('Small Intestine', 104), ('Bone Marrow', 102), ('Ovary', 97), ('Vagina', 96), ('Uterus', 90),
+           ('Salivary Gland', 70), ('Kidney', 32), ('Bladder', 11), ('Cervix Uteri', 10), ('Fallopian Tube', 6)]
+# Dictionary with the gtex tissue added to the control samples of each tumor
+gtex_tcga = {'ACC':'Adrenal Gland','BLCA':'Bladder','BRCA':'Breast','CESC':'Cervix Uteri', 'COAD':'Colon', 'DLBC':'Blood',
+                'ESCA':'Esophagus','GBM':'Brain','KICH':'Kidney','KIRC':'Kidney','KIRP':'Kidney','LAML':'Bone Marrow','LGG':'Brain',
+                'LIHC':'Liver','LUAD':'Lung','LUSC':'Lung','OV':'Ovary','PAAD':'Pancreas','PRAD':'Prostate','READ':'Colon','SKCM':'Skin',
+                'STAD':'Stomach','TGCT':'Testis','THCA':'Thyroid','THYM':'Blood','UCEC':'Uterus','UCS':'Uterus'}
+NO_NORMAL = {'ACC', 'DLBC', 'LAML', 'LGG', 'MESO', 'OV', 'TGCT', 'UCS', 'UVM'} # Tumors without 'Solid Tissue Normal' samples
+# TCGA sample type, code (last field of the barcode) and id
+SAMPLE_TYPES = {'Primary Tumor':('01', 1), 'Recurrent Tumor':('02', 2),
+                'Primary Blood Derived Cancer - Peripheral Blood':('03', 3), 'Additional - New Primary':('05', 5),
+                'Metastatic':('06', 6), 'Solid Tissue Normal':('11', 11)}
+# DepMap lineage, primary disease, subtype and Oncotree code of the cell lines
+LINEAGES = [('Lung', 'Non-Small Cell Lung Cancer', 'Lung Adenocarcinoma', 'LUAD'),
+            ('Lung', 'Non-Small Cell Lung Cancer', 'Lung Squamous Cell Carcinoma', 'LUSC'),
+            ('Breast', 'Invasive Breast Carcinoma', 'Breast Invasive Ductal Carcinoma', 'IDC'),
+            ('Skin', 'Melanoma', 'Cutaneous Melanoma', 'SKCM'),
+            ('Bowel', 'Colorectal Adenocarcinoma', 'Colon Adenocarcinoma', 'COAD'),
+            ('Myeloid', 'Acute Myeloid Leukemia', 'Acute Myeloid Leukemia', 'AML'),
+            ('Lymphoid', 'Mature B-Cell Neoplasms', 'Diffuse Large B-Cell Lymphoma, NOS', 'DLBCLNOS'),
+            ('CNS/Brain', 'Diffuse Glioma', 'Glioblastoma', 'GB'),
+            ('Ovary/Fallopian Tube', 'Ovarian Epithelial Tumor', 'High-Grade Serous Ovarian Cancer', 'HGSOC'),
+            ('Pancreas', 'Pancreatic Adenocarcinoma', 'Pancreatic Adenocarcinoma', 'PAAD'),
+            ('Kidney', 'Renal Cell Carcinoma', 'Renal Clear Cell Carcinoma', 'CCRCC'),
+            ('Esophagus/Stomach', 'Esophagogastric Adenocarcinoma', 'Stomach Adenocarcinoma', 'STAD')]
+MODEL_COLUMNS = ['ModelID', 'PatientID', 'CellLineName', 'StrippedCellLineName', 'Age', 'SourceType', 'SangerModelID',
+                 'RRID', 'DepmapModelType', 'AgeCategory', 'GrowthPattern', 'LegacyMolecularSubtype',
+                 'PrimaryOrMetastasis', 'SampleCollectionSite', 'Sex', 'SourceDetail', 'LegacySubSubtype',
+                 'CatalogNumber', 'CCLEName', 'COSMICID', 'PublicComments', 'WTSIMasterCellID', 'EngineeredModel',
+                 'TreatmentStatus', 'OnboardedMedia', 'PlateCoating', 'OncotreeCode', 'OncotreeSubtype',
+                 'OncotreePrimaryDisease', 'OncotreeLineage']
+
+
+def allocate(total, weights, minimum):
+    # Split total samples proportionally to the weights with at least minimum samples each
+    counts = np.maximum(np.floor(total * np.asarray(weights) / np.sum(weights)).astype(int), minimum)
+    counts[np.argmax(counts)] += max(total - counts.sum(), 0)
+    return counts
+
+
+def write_genes(out_dir, n_genes, rng):
+    # Probe map (Ensembl ID -> gene symbol), HUGO protein-coding list and GO plasma membrane list
+    ids = np.array([f'ENSG{11 * n + 1:011d}.{n % 9 + 1}' for n in range(n_genes)])
+    n_protein = max(int(n_genes * PROTEIN_CODING), 1)
+    symbols = np.array([f'GENE{n + 1}' for n in range(n_protein)] + [f'LINC{n + 1:05d}' for n in range(n_genes - n_protein)])
+    symbols = symbols[rng.permutation(n_genes)]
+    # A few IDs share the symbol of another ID (the first one in the matrix is kept)
+    shared = rng.choice(n_genes, size=n_genes // 200, replace=False)
+    symbols[shared] = symbols[rng.choice(n_genes, size=len(shared))]
+    probemap = pd.DataFrame({'id':ids, 'gene':symbols, 'chrom':rng.choice([f'chr{n}' for n in list(range(1, 23)) + ['X', 'Y']], n_genes),
+                             'chromStart':rng.integers(1, 200000000, n_genes)})
+    probemap['chromEnd'] = probemap['chromStart'] + rng.integers(200, 200000, n_genes)
+    probemap['strand'] = rng.choice(['+', '-'], n_genes)
+    probemap.to_csv(os.path.join(out_dir, 'probeMap_gencode.v23.annotation.gene.probemap'), sep='\t', index=False)
+
+    protein = [f'GENE{n + 1}' for n in range(n_protein)]
+    hugo = protein + [f'GENE{n_protein + n + 1}' for n in range(max(n_protein // 50, 1))] # Some are not in the probe map
+    pd.DataFrame({'HGNC ID':[f'HGNC:{n + 1}' for n in range(len(hugo))], 'Symbol':hugo,
+                  'Approved name':[f'{gene} protein' for gene in hugo], 'Locus type':'gene with protein product'}
+                 ).to_csv(os.path.join(out_dir, 'HUGO.txt'), sep='\t', index=False)
+
+    membrane = rng.choice(protein, size=max(int(n_protein * MEMBRANE), 1), replace=False)
+    with open(os.path.join(out_dir, 'GO_0005886.txt'), 'w') as out:
+        for gene in membrane:
+            for evidence in rng.choice(['IDA', 'IBA', 'TAS', 'IEA'], size=rng.integers(1, 4)):
+                out.write(f'{gene}\tGO:0005886\tplasma membrane\t{evidence}\n')
+            if rng.random() < 0.2: # Exact duplicated lines
+                out.write(f'{gene}\tGO:0005886\tplasma membrane\tIEA\n')
+    return ids, protein
+
+
+def write_matrix(path, ids, samples, groups, rng):
+    # Xena log2(TPM+0.001) matrix (genes x samples) with a gene baseline, a shift of some genes in each group of
+    # samples and undetected genes; the rows are written in chunks
+    n_groups = groups.max() + 1
+    order = rng.permutation(len(ids))
+    with open(path, 'w') as out:
+        out.write('\t'.join(['sample'] + list(samples)) + '\n')
+        for start in range(0, len(ids), CHUNK_SIZE):
+            rows = order[start:start + CHUNK_SIZE]
+            base = rng.normal(1.5, 2.5, size=(len(rows), 1))
+            shift = rng.normal(0, 2, size=(len(rows), n_groups)) * (rng.random((len(rows), n_groups)) < 0.1)
+            values = base + shift[:, groups] + rng.normal(0, 1, size=(len(rows), len(samples)))
+            values = np.where((values < -3) | (rng.random(values.shape) < 0.05), MIN_LOG, np.log2(np.exp2(values) + 0.001))
+            lines = pd.DataFrame(values.round(4), index=ids[rows]).to_csv(sep='\t', header=False)
+            out.write(lines)
+
+
+def write_tcga(out_dir, ids, n_samples, tumors, rng):
+    # TCGA expression matrix and phenotype (sample type and primary disease of each sample)
+    counts = allocate(n_samples, [count for _, _, count in tumors], 2)
+    samples, types, diseases = [], [], []
+    for (disease, abr, _), count in zip(tumors, counts):
+        weights = {'Primary Tumor':0.89, 'Recurrent Tumor':0.02, 'Additional - New Primary':0.01,
+                   'Solid Tissue Normal':0.0 if abr in NO_NORMAL else 0.08}
+        if abr == 'SKCM':
+            weights.update({'Primary Tumor':0.2, 'Metastatic':0.72})
+        if abr == 'LAML':
+            weights = {'Primary Blood Derived Cancer - Peripheral Blood':1.0}
+        names = list(weights)
+        kinds = rng.choice(names, size=count, p=np.array(list(weights.values())) / sum(weights.values()))
+        kinds[0] = names[0] # At least one sample of the main type of each tumor
+        for kind in kinds:
+            samples.append(f'TCGA-{rng.integers(10, 99)}-{len(samples):04X}-{SAMPLE_TYPES[kind][0]}')
+            types.append(kind)
+            diseases.append(disease)
+    shuffle = rng.permutation(len(samples))
+    samples, types, diseases = [np.array(values)[shuffle] for values in (samples, types, diseases)]
+    group_names = {group:n for n, group in enumerate(dict.fromkeys(zip(diseases, types)))}
+    groups = np.array([group_names[group] for group in zip(diseases, types)])
+    write_matrix(os.path.join(out_dir, 'tcga_RSEM_gene_tpm'), ids, samples, groups, rng)
+
+    phenotype = pd.DataFrame({'sample':samples, 'sample_type_id':[SAMPLE_TYPES[kind][1] for kind in types],
+                              'sample_type':types, '_primary_disease':diseases})
+    # Some samples have no sample type, some are missing and some samples are not in the matrix
+    phenotype.loc[rng.random(len(phenotype)) < 0.01, ['sample_type_id', 'sample_type']] = None
+    phenotype = phenotype[rng.random(len(phenotype)) > 0.01]
+    extra = pd.DataFrame({'sample':[f'TCGA-{rng.integers(10, 99)}-{n:04X}-01' for n in range(len(samples), len(samples) + len(samples) // 5)],
+                          'sample_type_id':1, 'sample_type':'Primary Tumor'})
+    extra['_primary_disease'] = rng.choice([disease for disease, _, _ in tumors], len(extra))
+    phenotype = pd.concat([phenotype, extra]).sample(frac=1, random_state=rng.integers(2 ** 31))
+    phenotype['sample_type_id'] = phenotype['sample_type_id'].astype('Int64')
+    phenotype.to_csv(os.path.join(out_dir, 'TCGA_phenotype_denseDataOnlyDownload.tsv'), sep='\t', index=False)
+    return len(samples)
+
+
+def write_gtex(out_dir, ids, n_samples, tissues, rng):
+    # GTEX expression matrix and phenotype (primary site of each sample)
+    counts = allocate(n_samples, [count for _, count in tissues], 2)
+    sites = np.repeat([tissue for tissue, _ in tissues], counts)[rng.permutation(counts.sum())]
+    samples = np.array([f'GTEX-{n // 3:05X}-{n % 3 + 1:04d}-SM-{n:05X}' for n in range(len(sites))])
+    groups = np.unique(sites, return_inverse=True)[1]
+    write_matrix(os.path.join(out_dir, 'gtex_RSEM_gene_tpm'), ids, samples, groups, rng)
+    sites = sites.astype(object)
+    sites[rng.random(len(sites)) < 0.005] = '<not provided>'
+    pd.DataFrame({'Sample':samples, 'body_site_detail (SMTSD)':[f'{site} - Site' for site in sites], '_primary_site':sites,
+                  '_gender':rng.choice(['male', 'female'], len(samples)), '_patient':[sample[:10] for sample in samples],
+                  '_cohort':'GTEX'}).to_csv(os.path.join(out_dir, 'GTEX_phenotype.tsv'), sep='\t', index=False)
+    return len(samples)
+
+
+def write_depmap(out_dir, protein, n_cell_lines, rng):
+    # DepMap log2(TPM+1) expression (cell lines x protein-coding genes) and model metadata
+    cell_lines = [f'ACH-{n + 1:06d}' for n in range(n_cell_lines)]
+    genes = [gene for gene in protein if rng.random() < 0.95]
+    values = np.log2(1 + rng.gamma(0.6, 12, size=(n_cell_lines, len(genes))) * (rng.random((n_cell_lines, len(genes))) > 0.15))
+    pd.DataFrame(values.round(6), index=cell_lines, columns=genes).to_csv(os.path.join(out_dir, 'Expression_Public_23Q4.csv'))
+
+    models = cell_lines + [f'ACH-{n + 1:06d}' for n in range(n_cell_lines, n_cell_lines + n_cell_lines // 10 + 1)]
+    lineages = [LINEAGES[n] for n in rng.integers(len(LINEAGES), size=len(models))]
+    metadata = pd.DataFrame({column:'' for column in MODEL_COLUMNS}, index=range(len(models)))
+    metadata['ModelID'] = models
+    metadata['PatientID'] = [f'PT-{n:06X}' for n in range(len(models))]
+    metadata['CellLineName'] = [f'CL-{n + 1}' for n in range(len(models))]
+    metadata['StrippedCellLineName'] = [f'CL{n + 1}' for n in range(len(models))]
+    metadata['Age'] = rng.integers(1, 90, len(models)).astype(float)
+    metadata['Sex'] = rng.choice(['Male', 'Female', 'Unknown'], len(models))
+    metadata['DepmapModelType'] = [code for _, _, _, code in lineages]
+    metadata['PrimaryOrMetastasis'] = rng.choice(['Primary', 'Metastatic', ''], len(models))
+    metadata['CatalogNumber'] = [f'CRL-{n}' if rng.random() < 0.6 else '' for n in range(len(models))]
+    metadata['CCLEName'] = [f'CL{n + 1}_{lineage[0].upper()}' for n, lineage in enumerate(lineages)]
+    for column, values in zip(['OncotreeLineage', 'OncotreePrimaryDisease', 'OncotreeSubtype', 'OncotreeCode'], zip(*lineages)):
+        metadata[column] = values
+    metadata.sample(frac=1, random_state=rng.integers(2 ** 31)).to_csv(os.path.join(out_dir, 'cell_line_metadata.csv'), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic raw data files for the CARTAR pre-processing stages.')
+    parser.add_argument('out_dir', help='data folder (the files are written to its Raw folder)')
+    parser.add_argument('--scale', type=float, default=0.01, help='size relative to the real data (default: 0.01)')
+    parser.add_argument('--genes', type=int, help='number of genes (Ensembl IDs)')
+    parser.add_argument('--tcga-samples', type=int, help='number of TCGA samples')
+    parser.add_argument('--gtex-samples', type=int, help='number of GTEX samples')
+    parser.add_argument('--tumors', type=int, default=len(TUMORS), help=f'number of tumors (default: {len(TUMORS)})')
+    parser.add_argument('--tissues', type=int, default=len(TISSUES), help=f'number of GTEX tissues, at least the controls of the tumors (default: {len(TISSUES)})')
+    parser.add_argument('--cell-lines', type=int, help='number of cell lines')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    args = parser.parse_args()
+    sizes = {name:getattr(args, name) or max(int(round(size * args.scale)), 10) for name, size in PRODUCTION.items()}
+    rng = np.random.default_rng(args.seed)
+
+    # Tumors in order of size and the GTEX tissues used as their control first
+    tumors = TUMORS[:args.tumors]
+    needed = list(dict.fromkeys(gtex_tcga[abr] for _, abr, _ in tumors if abr in gtex_tcga))
+    tissues = [tissue for tissue in TISSUES if tissue[0] in needed]
+    tissues += [tissue for tissue in TISSUES if tissue[0] not in needed][:max(args.tissues - len(tissues), 0)]
+
+    out_dir = os.path.join(args.out_dir, 'Raw')
+    os.makedirs(out_dir, exist_ok=True)
+    ids, protein = write_genes(out_dir, sizes['genes'], rng)
+    tcga_samples = write_tcga(out_dir, ids, sizes['tcga_samples'], tumors, rng)
+    gtex_samples = write_gtex(out_dir, ids, sizes['gtex_samples'], tissues, rng)
+    write_depmap(out_dir, protein, sizes['cell_lines'], rng)
+    print(f"{out_dir}: {sizes['genes']} genes, {tcga_samples} TCGA samples ({len(tumors)} tumors), "
+          f"{gtex_samples} GTEX samples ({len(tissues)} tissues), {sizes['cell_lines']} cell lines")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+"""Data access helpers shared by the CARTAR pages and the pre-processing pipeline."""
@@ -0,0 +1,133 @@
+"""Local store with the expression and metadata of the CCLE cancer cell lines.
+
+The log2(TPM+1) expression of every cell line (rows) and gene (columns) is
+kept as a float32 matrix in a single uncompressed .npz file, together with
+the metadata columns shown by the cell line selector stored as categorical
+codes. A ``.sha256`` file with the checksum of the store is written next to
+it so that a copy downloaded from a remote host can be verified before it
+replaces the local one. Without a local store, it can be built from the
+filtered expression and metadata CSV files published by the project.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import requests
+
+# Metadata columns of each cell line (ModelID is the row label)
+METADATA_COLUMNS = ('CellLineName', 'OncotreeLineage', 'OncotreePrimaryDisease', 'OncotreeSubtype',
+                    'OncotreeCode', 'CatalogNumber')
+CHECKSUM_SUFFIX = '.sha256'
+# CSV files written by stage 7 of the pre-processing pipeline and published by the project
+EXPRESSION_URL = 'https://gitlab.com/gmx2/CARTAR/-/raw/main/Expression_Public_23Q4_filtered.csv'
+METADATA_URL = 'https://gitlab.com/gmx2/CARTAR/-/raw/main/cell_line_metadata_reduced.csv'
+VERSION = 'DepMap Public 23Q4'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as store_file:
+        for chunk in iter(lambda: store_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_cell_line_store(path, cell_lines, genes, values, metadata, version):
+    """Save the store to ``path`` (.npz) and its checksum to ``path`` + ``.sha256``.
+
+    ``values`` is a cell lines x genes array of log2(TPM+1) values and
+    ``metadata`` a DataFrame indexed by ModelID with the ``METADATA_COLUMNS``
+    of (at least) every cell line in ``cell_lines``.
+    """
+    if np.shape(values) != (len(cell_lines), len(genes)):
+        raise ValueError(f'Expected a {len(cell_lines)} x {len(genes)} expression array, got {np.shape(values)}')
+    arrays = {'cell_lines': np.array(cell_lines), 'genes': np.array(genes),
+              'values': np.asarray(values, dtype=np.float32), 'version': np.array(version)}
+    metadata = metadata.reindex(cell_lines)
+    for column in METADATA_COLUMNS:
+        categorical = pd.Categorical(metadata[column].astype('string'))
+        arrays[column + '_categories'] = np.array(categorical.categories.tolist(), dtype=str)
+        arrays[column + '_codes'] = categorical.codes.astype(np.int16)
+    with open(path, 'wb') as out:
+        np.savez(out, **arrays)
+    with open(path + CHECKSUM_SUFFIX, 'w') as out:
+        out.write(file_sha256(path) + '\n')
+
+
+def build_cell_line_store(path, expression=EXPRESSION_URL, metadata=METADATA_URL, version=VERSION):
+    """Build the store at ``path`` from the filtered expression and reduced metadata CSV files of stage 7.
+
+    ``expression`` and ``metadata`` are local paths or URLs (the published
+    files by default). The store is written to a temporary file that then
+    replaces ``path``, so readers never see a partial store.
+    """
+    expression = pd.read_csv(expression, index_col=0)
+    # Genes repeated in the gene list of stage 7 have duplicated columns, renamed GENE.1, GENE.2, ... by pandas
+    columns = set(expression.columns)
+    expression = expression[[gene for gene in expression.columns
+                             if not (gene.rpartition('.')[0] in columns and gene.rpartition('.')[2].isdigit())]]
+    metadata = pd.read_csv(metadata, index_col='ModelID')
+    handle, build = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(path)))
+    os.close(handle)
+    try:
+        write_cell_line_store(build, expression.index.tolist(), expression.columns.tolist(), expression.to_numpy(),
+                              metadata, version)
+        os.replace(build + CHECKSUM_SUFFIX, path + CHECKSUM_SUFFIX)
+        os.replace(build, path)
+    finally:
+        for leftover in (build, build + CHECKSUM_SUFFIX):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def refresh_cell_line_store(path, url, timeout=60):
+    """Replace the store at ``path`` by the one published at ``url``.
+
+    The checksum published at ``url`` + ``.sha256`` is checked against the
+    downloaded file before it atomically replaces the local store, so readers
+    never see a partial or corrupted file. A ValueError is raised (and the
+    local store kept) if the checksums do not match.
+    """
+    response = requests.get(url + CHECKSUM_SUFFIX, timeout=timeout)
+    response.raise_for_status()
+    expected = response.text.split()[0].lower()
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, download = tempfile.mkstemp(suffix='.npz', dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as out, requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                out.write(chunk)
+        if file_sha256(download) != expected:
+            raise ValueError(f'Checksum mismatch for the cell line store downloaded from {url}')
+        os.replace(download, path)
+    finally:
+        if os.path.exists(download):
+            os.remove(download)
+    with open(path + CHECKSUM_SUFFIX, 'w') as out:
+        out.write(expected + '\n')
+
+
+class CellLineStore:
+    """Read-only view of a store written by :func:`write_cell_line_store`."""
+
+    def __init__(self, path):
+        with np.load(path) as store:
+            self.cell_lines = store['cell_lines'].tolist()
+            self.genes = store['genes'].tolist()
+            self.values = store['values']
+            self.version = str(store['version'])
+            self.metadata = pd.DataFrame(
+                {column: pd.Categorical.from_codes(store[column + '_codes'], store[column + '_categories'].tolist())
+                 for column in METADATA_COLUMNS},
+                index=pd.Index(self.cell_lines, name='ModelID'))
+        self.columns = {gene: column for column, gene in enumerate(self.genes)}
+
+    def __contains__(self, gene):
+        return gene in self.columns
+
+    def expression(self, gene):
+        """log2(TPM+1) expression of ``gene`` in every cell line (in ``cell_lines`` order)."""
+        return self.values[:, self.columns[gene]]
@@ -0,0 +1,163 @@
+"""Process-wide cached access to the CARTAR data files.
+
+Every dataset is parsed once per server process and the same object is
+shared, read-only, by all sessions and reruns. The caches are keyed by the
+modification time of the underlying file, so replacing a file in the data
+folder (e.g. with ``run_pipeline.py --publish``) invalidates its entry on the
+next access; :func:`clear_caches` drops all of them explicitly.
+"""
+import os
+
+import pandas as pd
+import streamlit as st
+
+from cartar.cell_lines import CellLineStore, build_cell_line_store, refresh_cell_line_store
+from cartar.store import ExpressionStore, INDEX_FILE
+from cartar.tables import AntigenTables, FoldChangeTable, MedianTables, SummaryTables
+from cartar.violins import ViolinStore, INDEX_FILE as VIOLIN_INDEX_FILE
+
+# Folder with the data files of the app (the Data folder of the repository unless CARTAR_APP_DATA is set), where
+# run_pipeline.py --publish copies the processed files
+DATA_DIR = os.environ.get('CARTAR_APP_DATA',
+                          os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Data'))
+LOG2FC_FILE = os.path.join(DATA_DIR, 'log2FC_expression.csv')
+# Numeric copy of LOG2FC_FILE, used instead of parsing the CSV when present
+LOG2FC_BINARY_FILE = os.path.join(DATA_DIR, 'log2FC_expression.npz')
+HPA_FILE = os.path.join(DATA_DIR, 'HPA_evidence_pm.csv')
+NO_MEMBRANE_FILE = os.path.join(DATA_DIR, 'no_membrane_genes.csv')
+CELL_LINE_GENES_FILE = os.path.join(DATA_DIR, 'genes_cells.csv')
+STORE_DIR = os.path.join(DATA_DIR, 'expression_store')
+ANTIGEN_FILE = os.path.join(DATA_DIR, 'antigen_tables.npz')
+MEDIAN_FILE = os.path.join(DATA_DIR, 'median_tables.npz')
+SUMMARY_FILE = os.path.join(DATA_DIR, 'summary_tables.npz')
+VIOLIN_DIR = os.path.join(DATA_DIR, 'violin_store')
+CELL_LINE_STORE_FILE = os.path.join(DATA_DIR, 'cell_line_store.npz')
+# Optional published copy of the cell line store (with its .sha256 file next to it), downloaded instead of building
+# the store from the published CSV files when there is no local store
+CELL_LINE_STORE_URL = os.environ.get('CARTAR_CELL_LINE_STORE_URL')
+
+
+def _version(path):
+    return os.stat(path).st_mtime_ns
+
+
+def _read_gene_list(path):
+    with open(path, 'r') as gene_file:
+        return frozenset(gene.strip() for gene in gene_file.read().split(',') if gene.strip())
+
+
+@st.cache_resource(show_spinner=False)
+def _fold_change_table(path, version):
+    if path == LOG2FC_BINARY_FILE:
+        return FoldChangeTable.load(path)
+    return FoldChangeTable.from_frame(pd.read_csv(path))
+
+
+@st.cache_resource(show_spinner=False)
+def _gene_list(path, version):
+    return _read_gene_list(path)
+
+
+@st.cache_resource(show_spinner=False)
+def _expression_store(version):
+    return ExpressionStore(STORE_DIR)
+
+
+@st.cache_resource(show_spinner=False)
+def _antigen_tables(version):
+    return AntigenTables(ANTIGEN_FILE)
+
+
+@st.cache_resource(show_spinner=False)
+def _median_tables(version):
+    return MedianTables(MEDIAN_FILE)
+
+
+@st.cache_resource(show_spinner=False)
+def _summary_tables(version):
+    return SummaryTables(SUMMARY_FILE)
+
+
+@st.cache_resource(show_spinner=False)
+def _violin_store(version):
+    return ViolinStore(VIOLIN_DIR)
+
+
+@st.cache_resource(show_spinner=False)
+def _cell_line_store(version):
+    return CellLineStore(CELL_LINE_STORE_FILE)
+
+
+def fold_change_table() -> FoldChangeTable:
+    """log2(FC) matrix with each tumor column sorted for threshold queries."""
+    path = LOG2FC_BINARY_FILE if os.path.exists(LOG2FC_BINARY_FILE) else LOG2FC_FILE
+    return _fold_change_table(path, _version(path))
+
+
+def hpa_membrane_genes() -> frozenset:
+    """Genes experimentally located in the plasma membrane by the Human Protein Atlas."""
+    return _gene_list(HPA_FILE, _version(HPA_FILE))
+
+
+def no_membrane_genes() -> frozenset:
+    """Genes excluded from CARTAR because they are not located in the membrane."""
+    return _gene_list(NO_MEMBRANE_FILE, _version(NO_MEMBRANE_FILE))
+
+
+def cell_line_genes() -> frozenset:
+    """Genes with expression data in the cancer cell lines."""
+    return _gene_list(CELL_LINE_GENES_FILE, _version(CELL_LINE_GENES_FILE))
+
+
+def expression_store() -> ExpressionStore:
+    """Memory-mapped expression values of all TCGA and GTEx samples."""
+    return _expression_store(_version(os.path.join(STORE_DIR, INDEX_FILE)))
+
+
+def antigen_tables() -> AntigenTables:
+    """Precomputed p-values, q-values, medians and sample sizes of every gene and tumor."""
+    return _antigen_tables(_version(ANTIGEN_FILE))
+
+
+def median_tables() -> MedianTables:
+    """Median expression of every gene in the metastatic, primary tumor and control samples of each tumor."""
+    return _median_tables(_version(MEDIAN_FILE))
+
+
+def summary_tables() -> SummaryTables:
+    """Quantiles, extremes and sample size of every gene in each sample group, drawn as box plots."""
+    return _summary_tables(_version(SUMMARY_FILE))
+
+
+def violin_store() -> ViolinStore:
+    """Memory-mapped violin densities of every gene in each sample group."""
+    return _violin_store(_version(os.path.join(VIOLIN_DIR, VIOLIN_INDEX_FILE)))
+
+
+def cell_line_store() -> CellLineStore:
+    """Expression and metadata of the cancer cell lines.
+
+    If there is no local store, it is built once from the published CSV
+    files or, if ``CARTAR_CELL_LINE_STORE_URL`` is set, downloaded from that
+    URL. Network errors are raised as OSError and checksum errors as
+    ValueError.
+    """
+    if not os.path.exists(CELL_LINE_STORE_FILE):
+        if CELL_LINE_STORE_URL:
+            refresh_cell_lines(CELL_LINE_STORE_URL)
+        else:
+            build_cell_line_store(CELL_LINE_STORE_FILE)
+    return _cell_line_store(_version(CELL_LINE_STORE_FILE))
+
+
+def refresh_cell_lines(url):
+    """Replace the local cell line store by the one published at ``url`` after checking its checksum."""
+    refresh_cell_line_store(CELL_LINE_STORE_FILE, url)
+    _cell_line_store.clear()
+
+
+def clear_caches():
+    """Drop every cached dataset so that it is read again on next access."""
+    for loader in (_fold_change_table, _gene_list, _expression_store, _antigen_tables,
+                   _median_tables, _summary_tables, _violin_store, _cell_line_store):
+        loader.clear()
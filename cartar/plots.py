@@ -0,0 +1,226 @@
+"""Thread-safe rendering of the matplotlib/seaborn figures of the pages.
+
+Each request draws on its own :class:`~matplotlib.figure.Figure`, created
+without pyplot so that no global figure is shared between the sessions of
+the server process. The seaborn whitegrid theme is applied to the figures
+while they are drawn (see :func:`theme`), not set for the whole process.
+The figure is rasterized to PNG in a small thread pool, which bounds the
+number of figures rendered (and held in memory) at the same time, and is
+cleared as soon as the image is produced.
+"""
+import colorsys
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import matplotlib as mpl
+import numpy as np
+import seaborn as sns
+from matplotlib.colors import to_rgb
+from matplotlib.figure import Figure
+from matplotlib.patches import Patch
+
+# Maximum number of figures rendered at the same time by the server process
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+# Same resolution as st.pyplot
+DPI = 200
+# Maximum number of points of a group drawn in the dot plots, unless all the points are requested
+MAX_DOTS = int(os.environ.get('CARTAR_MAX_DOTS', 500))
+
+_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='cartar-render')
+
+# rcParams of the seaborn whitegrid theme, applied only while the figures are drawn
+THEME = {**sns.axes_style('whitegrid'), **sns.plotting_context('notebook'),
+         'axes.prop_cycle': mpl.cycler(color=sns.color_palette('deep'))}
+# rcParams are shared by the whole process: the lock keeps the sessions from
+# restoring each other's values
+_theme_lock = threading.RLock()
+
+
+@contextmanager
+def theme():
+    """Apply :data:`THEME` to the artists created in the block, without changing the rcParams of the process."""
+    with _theme_lock, mpl.rc_context(THEME):
+        yield
+
+
+def new_figure(figsize=None):
+    """New figure with a single axes in the seaborn theme, not tracked by pyplot.
+
+    The axes keep the theme, including the ticks created later on, but the
+    legends and texts added by the pages must be drawn within :func:`theme`.
+    """
+    with theme():
+        figure = Figure(figsize=figsize)
+        ax = figure.subplots()
+        _pin_ticks(ax)
+    return figure, ax
+
+
+def rotate_xticks(ax, rotation=45):
+    """Rotate the x tick labels and align them to the right (as ``plt.xticks(rotation=45, ha='right')``)."""
+    ax.tick_params(axis='x', labelrotation=rotation)
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+
+
+def box_plot(ax, stats, positions, colors, width=0.8, whiskers=('whisker_p10', 'whisker_p90')):
+    """Draw box plots without fliers from precomputed statistics, as ``sns.boxplot``.
+
+    ``stats`` is a DataFrame with one row per box (see
+    :meth:`cartar.tables.SummaryTables.frame`), drawn at ``positions`` and
+    filled with ``colors``. The whiskers end at the ``whiskers`` fields, e.g.
+    ``('whisker_low', 'whisker_high')`` for Tukey whiskers. Groups without
+    samples are skipped.
+    """
+    colors, gray = _colors(colors)
+    line = {'color': gray}
+    drawn = [k for k, n in enumerate(stats['n']) if n > 0]
+    boxes = [{'med': stats['median'].iloc[k], 'q1': stats['q1'].iloc[k], 'q3': stats['q3'].iloc[k],
+              'whislo': stats[whiskers[0]].iloc[k], 'whishi': stats[whiskers[1]].iloc[k], 'fliers': []}
+             for k in drawn]
+    with theme():
+        artists = ax.bxp(boxes, positions=[positions[k] for k in drawn], widths=width, capwidths=width / 2,
+                         patch_artist=True, showfliers=False, manage_ticks=False,
+                         boxprops={'edgecolor': line['color']}, medianprops=dict(line, solid_capstyle='butt'),
+                         whiskerprops=dict(line, solid_capstyle='butt'), capprops=line)
+    for box, k in zip(artists['boxes'], drawn):
+        box.set_facecolor(colors[k])
+    return artists
+
+
+def violin_plot(ax, support, density, stats, positions, colors, width=0.8, sides=None, inner='quart'):
+    """Draw violins from precomputed densities, as ``sns.violinplot`` with ``density_norm='width'``.
+
+    ``support`` and ``density`` come from
+    :meth:`cartar.violins.ViolinStore.violins` and ``stats`` (see
+    :meth:`cartar.tables.SummaryTables.frame`) gives the sample size of each
+    violin and the statistics drawn inside it: the quartiles as dashed lines
+    (``inner='quart'``) or a small box plot (``inner='box'``). ``sides``
+    draws only the left (-1) or right (1) half of each violin, as split
+    violins. Groups without samples are skipped.
+    """
+    colors, gray = _colors(colors)
+    linewidth = 1.25 * THEME['patch.linewidth']
+    sides = sides or [0] * len(positions)
+    with theme():
+        for k, position in enumerate(positions):
+            if not stats['n'].iloc[k]:
+                continue
+            half = width / 2
+            if np.isnan(density[k]).all():
+                # Samples without variance are drawn as a line at their value
+                left = position - half if sides[k] <= 0 else position
+                right = position + half if sides[k] >= 0 else position
+                ax.plot([left, right], [support[k, 0]] * 2, color=gray, linewidth=linewidth)
+                continue
+            values = np.linspace(support[k, 0], support[k, 1], density.shape[1])
+            left = position - density[k] * half if sides[k] <= 0 else np.full(len(values), position)
+            right = position + density[k] * half if sides[k] >= 0 else np.full(len(values), position)
+            ax.fill_betweenx(values, left, right, facecolor=colors[k], edgecolor=gray, linewidth=linewidth)
+            if inner == 'quart':
+                dashes = [(1.25, .75), (2.5, 1), (1.25, .75)]
+                for stat, dash in zip(['q1', 'median', 'q3'], dashes):
+                    value = stats[stat].iloc[k]
+                    ax.plot([np.interp(value, values, left), np.interp(value, values, right)], [value, value],
+                            color=gray, linewidth=linewidth, dashes=dash)
+            elif inner == 'box':
+                box_width = linewidth * 4.5
+                ax.plot([position, position], [stats['whisker_low'].iloc[k], stats['whisker_high'].iloc[k]],
+                        color=gray, linewidth=box_width / 3)
+                ax.plot([position, position], [stats['q1'].iloc[k], stats['q3'].iloc[k]], color=gray,
+                        linewidth=box_width)
+                ax.plot([position], [stats['median'].iloc[k]], marker='_', markersize=box_width / 1.2,
+                        markeredgewidth=box_width / 5, markeredgecolor='w', markerfacecolor='w', color=gray)
+
+
+def thin_dots(values, max_points=MAX_DOTS, bins=50):
+    """Indexes (in ascending order) of the ``values`` of a group drawn in a dot plot of about ``max_points`` points.
+
+    The points more than 1.5 IQR away from the quartiles (the outliers of a
+    Tukey box plot) are always kept and the cap applies to the other points.
+    These are binned by value and only the most populated bins are thinned,
+    down to a common number of points, so the tails and sparse regions keep
+    all their points. The points kept in a bin are evenly spaced in value
+    order, so the same values always give the same subsample.
+    """
+    values = np.asarray(values)
+    if len(values) <= max_points:
+        return np.arange(len(values))
+    q1, q3 = np.percentile(values, [25, 75])
+    outliers = (values < q1 - 1.5 * (q3 - q1)) | (values > q3 + 1.5 * (q3 - q1))
+    inner = np.flatnonzero(~outliers)
+    inner = inner[np.argsort(values[inner], kind='stable')]
+    budget = max(max_points - np.count_nonzero(outliers), bins)
+    if len(inner) <= budget:
+        return np.arange(len(values))
+    edges = np.linspace(values[inner[0]], values[inner[-1]], bins + 1)
+    bounds = np.searchsorted(values[inner], edges[1:-1], side='right')
+    sizes = np.diff(np.concatenate([[0], bounds, [len(inner)]]))
+    # Largest number of points per bin that fits the budget: the k smallest bins are kept whole and the others share
+    # the rest of the budget
+    ordered = np.sort(sizes)
+    taken = np.cumsum(ordered) + ordered * np.arange(bins - 1, -1, -1)
+    k = np.searchsorted(taken, budget, side='right')
+    cap = (budget - ordered[:k].sum()) // (bins - k)
+    kept = [np.flatnonzero(outliers)]
+    for start, size in zip(np.cumsum(sizes) - sizes, sizes):
+        if size <= cap:
+            kept.append(inner[start:start + size])
+        else:
+            kept.append(inner[start + np.round(np.linspace(0, size - 1, cap)).astype(int)])
+    return np.sort(np.concatenate(kept))
+
+
+def hue_legend(ax, colors, title):
+    """Legend with a patch for each label of ``colors`` (label: color), as the hue legend of seaborn."""
+    fills, gray = _colors(list(colors.values()))
+    with theme():
+        ax.legend(handles=[Patch(facecolor=fill, edgecolor=gray, label=label) for label, fill in zip(colors, fills)],
+                  title=title)
+
+
+def categorical_axis(ax, labels):
+    """Label the x axis with one category per integer position, as seaborn's categorical plots."""
+    ax.set_xticks(range(len(labels)), labels)
+    ax.set_xlim(-0.5, len(labels) - 0.5)
+    ax.xaxis.grid(False)
+
+
+def _pin_ticks(ax):
+    # The ticks are created lazily (e.g. when the figure is rendered) from the current rcParams, unless their style is
+    # set on the axis
+    rc = mpl.rcParams
+    for axis in 'xy':
+        color = rc[f'{axis}tick.color']
+        labelcolor = rc[f'{axis}tick.labelcolor']
+        for which in ['major', 'minor']:
+            ax.tick_params(axis=axis, which=which, direction=rc[f'{axis}tick.direction'],
+                           length=rc[f'{axis}tick.{which}.size'], width=rc[f'{axis}tick.{which}.width'],
+                           pad=rc[f'{axis}tick.{which}.pad'], color=color, labelsize=rc[f'{axis}tick.labelsize'],
+                           labelcolor=color if labelcolor == 'inherit' else labelcolor, grid_color=rc['grid.color'],
+                           grid_linestyle=rc['grid.linestyle'], grid_linewidth=rc['grid.linewidth'],
+                           grid_alpha=rc['grid.alpha'])
+
+
+def _colors(colors):
+    # Same colors as seaborn: fills desaturated to 75% and lines in a gray darker than all the fills
+    colors = [sns.desaturate(color, 0.75) for color in colors]
+    gray = min(colorsys.rgb_to_hls(*to_rgb(color))[1] for color in colors) * 0.6
+    return colors, (gray, gray, gray)
+
+
+def _png(figure):
+    image = io.BytesIO()
+    figure.savefig(image, format='png', dpi=DPI, bbox_inches='tight')
+    return image.getvalue()
+
+
+def render(figure):
+    """PNG image of ``figure``; the figure is cleared afterwards and must not be reused."""
+    try:
+        return _pool.submit(_png, figure).result()
+    finally:
+        figure.clear()
@@ -0,0 +1,145 @@
+"""Statistical tests and summaries computed for all genes at once."""
+from collections import namedtuple
+
+import numpy as np
+from scipy.stats import norm
+
+from cartar.tables import SUMMARY_FIELDS
+
+MannWhitneyResult = namedtuple('MannWhitneyResult', ['u', 'z', 'p_value', 'auc'])
+
+
+def _rank_sums(values, n1):
+    """Sum of the (average) ranks of the first ``n1`` columns of each row and tie term of each row.
+
+    Every row is sorted once; the runs of tied values give both the average
+    rank of their members and the sum of t**3 - t used in the tie correction.
+    """
+    n_rows, n = values.shape
+    order = np.argsort(values, axis=1)
+    values = np.take_along_axis(values, order, axis=1)
+    start = np.ones(values.shape, dtype=bool)
+    start[:, 1:] = values[:, 1:] != values[:, :-1]
+    positions = np.flatnonzero(start)
+    lengths = np.diff(np.append(positions, values.size)).astype(np.float64)
+    # Average rank of each run (ranks start at 1 in each row)
+    first = positions % n
+    ranks = (first + (lengths + 1) / 2)[np.cumsum(start.ravel()) - 1].reshape(values.shape)
+    rank_sums = np.where(order < n1, ranks, 0).sum(axis=1)
+    ties = np.bincount(positions // n, weights=lengths ** 3 - lengths, minlength=n_rows)
+    return rank_sums, ties
+
+
+def _exact_u_distribution(n1, n2):
+    """Probability of each value of U (0 to n1 * n2) without ties under the null hypothesis.
+
+    The number of orderings of the samples giving each U are the coefficients
+    of the Gaussian binomial coefficient, the product over i of
+    (1 - q**(n + i)) / (1 - q**i) for i = 1..m (m <= n the group sizes).
+    """
+    m, n = sorted((n1, n2))
+    counts = np.zeros(m * n + 1)
+    counts[0] = 1
+    for i in range(1, m + 1):
+        counts[n + i:] -= counts[:-(n + i)].copy()
+        # Division by 1 - q**i: running sums of the coefficients i apart
+        for start in range(i):
+            counts[start::i] = np.cumsum(counts[start::i])
+    return counts / counts.sum()
+
+
+def mann_whitney(x, y, method='asymptotic'):
+    """Two-sided Mann-Whitney U test of every row of ``x`` against the same row of ``y``.
+
+    ``x`` and ``y`` are genes x samples arrays with the samples of each group.
+    Both groups are ranked together once and the p-values come from the normal
+    approximation with tie correction and continuity correction, as
+    ``scipy.stats.mannwhitneyu(x, y, method='asymptotic')``. With
+    ``method='auto'`` the rows without ties get the exact p-value when a group
+    has 8 samples or fewer, as the default method of scipy. ``u`` is the U
+    statistic of ``x``, ``z`` is positive when ``x`` tends to be greater than
+    ``y`` and ``auc`` is the probability that a value of ``x`` is greater than
+    one of ``y`` (ties counted as one half).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n1, n2 = x.shape[1], y.shape[1]
+    n = n1 + n2
+    rank_sums, ties = _rank_sums(np.concatenate([x, y], axis=1), n1)
+    u = rank_sums - n1 * (n1 + 1) / 2
+    mu = n1 * n2 / 2
+    s = np.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    distance = np.abs(u - mu) - 0.5
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.sign(u - mu) * distance / s
+        p_value = np.clip(2 * norm.sf(distance / s), 0, 1)
+    if method == 'auto' and min(n1, n2) <= 8 and n1 and n2:
+        exact = ties == 0
+        if exact.any():
+            # P(U >= k) for every k; the p-value doubles the tail beyond the largest of the U of both groups
+            tail = np.cumsum(_exact_u_distribution(n1, n2)[::-1])[::-1]
+            largest = np.maximum(u[exact], n1 * n2 - u[exact]).astype(int)
+            p_value[exact] = np.clip(2 * tail[largest], 0, 1)
+    return MannWhitneyResult(u, z, p_value, u / (n1 * n2))
+
+
+def summarize(values):
+    """Box plot statistics of every row of ``values`` (genes x samples).
+
+    Returns a genes x ``SUMMARY_FIELDS`` array: minimum, 10th percentile,
+    first quartile, median, third quartile, 90th percentile, maximum and the
+    whisker ends of ``matplotlib.cbook.boxplot_stats`` with ``whis=(10, 90)``
+    and with Tukey whiskers. All of them are NaN if there are no samples.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[1] == 0:
+        return np.full((len(values), len(SUMMARY_FIELDS)), np.nan)
+    summary = np.percentile(values, [0, 10, 25, 50, 75, 90, 100], axis=1).T
+    q1, q3 = summary[:, 2:3], summary[:, 4:5]
+    whiskers = []
+    for low, high in [(summary[:, 1:2], summary[:, 5:6]), (q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1))]:
+        whiskers.append(np.minimum(np.where(values >= low, values, np.inf).min(axis=1), q1[:, 0]))
+        whiskers.append(np.maximum(np.where(values <= high, values, -np.inf).max(axis=1), q3[:, 0]))
+    return np.column_stack([summary] + whiskers)
+
+
+def violin_densities(values, gridsize=100, cut=2):
+    """Gaussian kernel density of every row of ``values`` (genes x samples), as drawn by ``seaborn.violinplot``.
+
+    The bandwidth follows Scott's rule and each density is evaluated on
+    ``gridsize`` evenly spaced points from ``cut`` bandwidths below the
+    minimum to ``cut`` bandwidths above the maximum of the row. Returns the
+    genes x 2 support limits and the genes x ``gridsize`` densities scaled to
+    a peak of 1. Rows with fewer than 2 samples or without variance have NaN
+    densities and both support limits at their mean (seaborn draws them as a
+    line); rows of a group without samples are all NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = values.shape[1]
+    density = np.full((len(values), gridsize), np.nan)
+    if n == 0:
+        return np.full((len(values), 2), np.nan), density
+    mean = values.mean(axis=1)
+    support = np.column_stack([mean, mean])
+    if n < 2:
+        return support, density
+    bandwidth = values.std(axis=1, ddof=1) * n ** -0.2
+    smooth = bandwidth > 0
+    support[smooth, 0] = values[smooth].min(axis=1) - cut * bandwidth[smooth]
+    support[smooth, 1] = values[smooth].max(axis=1) + cut * bandwidth[smooth]
+    grid = np.linspace(0, 1, gridsize)
+    # The kernels are evaluated in float32 (far more precise than the stored densities and several times faster), in
+    # bandwidth units from the start of the support and for a block of genes at a time to bound the memory used
+    block = max(1, (1 << 22) // (gridsize * n))
+    for start in range(0, len(values), block):
+        rows = start + np.flatnonzero(smooth[start:start + block])
+        if len(rows) == 0:
+            continue
+        scale = bandwidth[rows, None]
+        points = (grid * ((support[rows, 1:] - support[rows, :1]) / scale)).astype(np.float32)
+        z = points[:, :, None] - ((values[rows] - support[rows, :1]) / scale).astype(np.float32)[:, None, :]
+        np.square(z, out=z)
+        z *= np.float32(-0.5)
+        kernels = np.exp(z, out=z).sum(axis=2, dtype=np.float64)
+        density[rows] = kernels / kernels.max(axis=1, keepdims=True)
+    return support, density
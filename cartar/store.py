@@ -0,0 +1,84 @@
+"""Memory-mapped gene x sample expression store.
+
+All TCGA and GTEx samples are kept in a single float32 matrix with one row per
+gene. The samples of each group (``ACC_Tumor``, ``ACC_Normal``,
+``SKCM_Metastatic``, ``Blood``, ...) occupy a contiguous range of columns, so
+reading the expression values of a gene in a group is a slice of one row of
+the memory-mapped file and nothing has to be deserialized. The log2(TPM+1)
+values of a gene are computed for the whole row at once and kept for the
+most recently requested genes, so switching the scale of a plot does not
+transform the values again.
+"""
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+MATRIX_FILE = 'matrix.npy'
+INDEX_FILE = 'index.json'
+# Number of genes whose log2(TPM+1) values are kept in memory (about 150 KB per gene with all the samples)
+LOG2_CACHE_SIZE = 128
+
+
+def write_store(path, genes, values, groups):
+    """Write the store to the ``path`` directory.
+
+    ``values`` is a genes x samples array and ``groups`` a list of
+    ``(name, project, columns)`` tuples giving the columns of ``values``
+    belonging to each group. Samples not included in any group are dropped.
+    """
+    os.makedirs(path, exist_ok=True)
+    groups = sorted(groups, key=lambda group: (group[1], group[0]))
+    n_samples = sum(len(columns) for _, _, columns in groups)
+    matrix = np.lib.format.open_memmap(os.path.join(path, MATRIX_FILE), mode='w+',
+                                       dtype=np.float32, shape=(len(genes), n_samples))
+    index = {'genes': list(genes), 'groups': []}
+    start = 0
+    for name, project, columns in groups:
+        stop = start + len(columns)
+        matrix[:, start:stop] = values[:, columns]
+        index['groups'].append({'name': name, 'project': project, 'start': start, 'stop': stop})
+        start = stop
+    matrix.flush()
+    del matrix
+    with open(os.path.join(path, INDEX_FILE), 'w') as out:
+        json.dump(index, out)
+
+
+class ExpressionStore:
+    """Read-only view of a store written by :func:`write_store`."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, INDEX_FILE), 'r') as index_file:
+            index = json.load(index_file)
+        self.genes = index['genes']
+        self.rows = {gene: row for row, gene in enumerate(self.genes)}
+        self.groups = {group['name']: (group['start'], group['stop']) for group in index['groups']}
+        self.projects = {group['name']: group['project'] for group in index['groups']}
+        self.matrix = np.load(os.path.join(path, MATRIX_FILE), mmap_mode='r')
+        self._log2_row = lru_cache(maxsize=LOG2_CACHE_SIZE)(self._transform)
+
+    def __contains__(self, gene):
+        return gene in self.rows
+
+    def tissues(self):
+        """GTEx tissues in alphabetical order."""
+        return sorted(name for name, project in self.projects.items() if project == 'GTEX')
+
+    def values(self, gene, group, log2=False):
+        """Expression values of ``gene`` in the samples of ``group``, in TPM or, if ``log2``, in log2(TPM+1).
+
+        An empty array is returned for groups without samples (e.g. tumors
+        without TCGA control samples). The log2(TPM+1) values are read-only.
+        """
+        start, stop = self.groups.get(group, (0, 0))
+        if log2:
+            return self._log2_row(self.rows[gene])[start:stop]
+        return np.asarray(self.matrix[self.rows[gene], start:stop])
+
+    def _transform(self, row):
+        # log2(TPM+1) of all the samples of a gene, in double precision as math.log2
+        values = np.log2(self.matrix[row].astype(np.float64) + 1)
+        values.flags.writeable = False
+        return values
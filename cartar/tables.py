@@ -0,0 +1,193 @@
+"""Columnar gene x tumor tables precomputed by the pre-processing pipeline."""
+import numpy as np
+import pandas as pd
+
+# Statistics of the primary tumor vs control comparison stored for every gene and tumor
+ANTIGEN_FIELDS = ('p_value', 'q_value', 'tumor_median', 'control_median', 'tumor_n', 'control_n')
+# Sample groups of each tumor with a median expression value
+MEDIAN_GROUPS = ('Metastatic', 'Tumor', 'Control')
+# Statistics of every gene and sample group drawn in the box plots. The whisker ends are the most extreme values
+# between the 10th and 90th percentiles (whisker_p10, whisker_p90) or within 1.5 IQR of the quartiles (whisker_low,
+# whisker_high, as in a Tukey box plot)
+SUMMARY_FIELDS = ('min', 'p10', 'q1', 'median', 'q3', 'p90', 'max', 'whisker_p10', 'whisker_p90', 'whisker_low',
+                  'whisker_high')
+
+
+def write_antigen_tables(path, genes, tumors, **fields):
+    """Save the gene x tumor arrays given in ``fields`` (see ``ANTIGEN_FIELDS``) to ``path`` (.npz)."""
+    missing = set(ANTIGEN_FIELDS) - set(fields)
+    if missing:
+        raise ValueError(f'Missing antigen table fields: {sorted(missing)}')
+    np.savez(path, genes=np.array(genes), tumors=np.array(tumors),
+             **{name: np.asarray(fields[name]) for name in ANTIGEN_FIELDS})
+
+
+def write_fold_change_table(path, genes, tumors, values):
+    """Save the genes x tumors log2(FC) array to ``path`` (.npz), read back by :meth:`FoldChangeTable.load`."""
+    np.savez(path, genes=np.array(genes), tumors=np.array(tumors), values=np.asarray(values, dtype=np.float64))
+
+
+def write_median_tables(path, genes, tumors, median, n):
+    """Save the median TPM of every gene, tumor and group to ``path`` (.npz).
+
+    ``median`` is a genes x tumors x groups array (groups in ``MEDIAN_GROUPS``
+    order, NaN for groups without samples) and ``n`` the tumors x groups
+    sample sizes. The log2(TPM+1) medians are stored alongside.
+    """
+    median = np.asarray(median, dtype=np.float64)
+    np.savez(path, genes=np.array(genes), tumors=np.array(tumors), groups=np.array(MEDIAN_GROUPS),
+             median=median, log2_median=np.log2(median + 1), n=np.asarray(n, dtype=np.int32))
+
+
+def write_summary_tables(path, genes, groups, summary, log2_summary, n):
+    """Save the summary statistics of every gene and sample group to ``path`` (.npz).
+
+    ``summary`` and ``log2_summary`` are genes x groups x fields arrays (fields
+    in ``SUMMARY_FIELDS`` order, NaN for groups without samples) computed on
+    the TPM and log2(TPM+1) values, and ``n`` the sample size of each group.
+    """
+    np.savez(path, genes=np.array(genes), groups=np.array(groups), fields=np.array(SUMMARY_FIELDS),
+             summary=np.asarray(summary, dtype=np.float32), log2_summary=np.asarray(log2_summary, dtype=np.float32),
+             n=np.asarray(n, dtype=np.int32))
+
+
+class MedianTables:
+    """Median TPM and log2(TPM+1) of every gene in the metastatic, primary tumor and control samples of each tumor."""
+
+    def __init__(self, path):
+        with np.load(path) as tables:
+            self.genes = tables['genes'].tolist()
+            self.tumors = tables['tumors'].tolist()
+            self.groups = tables['groups'].tolist()
+            self.median = tables['median']
+            self.log2_median = tables['log2_median']
+            self.n = tables['n']
+        self.rows = {gene: row for row, gene in enumerate(self.genes)}
+        self.columns = {tumor: column for column, tumor in enumerate(self.tumors)}
+
+    def __contains__(self, gene):
+        return gene in self.rows
+
+    def values(self, gene, tumors, log2=False):
+        """tumors x groups medians of ``gene`` in TPM or, if ``log2``, in log2(TPM+1)."""
+        medians = self.log2_median if log2 else self.median
+        return medians[self.rows[gene], [self.columns[tumor] for tumor in tumors]]
+
+
+class SummaryTables:
+    """Quantiles, extremes and sample size of every gene in each sample group, in TPM and log2(TPM+1).
+
+    The groups are those of the expression store (``ACC_Tumor``,
+    ``ACC_Normal``, ``Blood``, ...) and the control group of each tumor
+    (``ACC_Control``: its normal samples and the samples of the GTEx tissue
+    used as control), so a box plot is drawn from a few numbers per group.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as tables:
+            self.genes = tables['genes'].tolist()
+            self.groups = tables['groups'].tolist()
+            self.fields = tables['fields'].tolist()
+            self.summary = tables['summary']
+            self.log2_summary = tables['log2_summary']
+            self.n = tables['n']
+        self.rows = {gene: row for row, gene in enumerate(self.genes)}
+        self.columns = {group: column for column, group in enumerate(self.groups)}
+
+    def __contains__(self, gene):
+        return gene in self.rows
+
+    def frame(self, gene, groups, log2=False):
+        """DataFrame indexed by group with the statistics of ``gene`` in TPM or, if ``log2``, in log2(TPM+1) and the
+        sample size (``n``) of each group."""
+        columns = [self.columns[group] for group in groups]
+        summary = (self.log2_summary if log2 else self.summary)[self.rows[gene], columns].astype(np.float64)
+        frame = pd.DataFrame(summary, index=pd.Index(groups, name='group'), columns=self.fields)
+        frame['n'] = self.n[columns]
+        return frame
+
+
+class AntigenTables:
+    """Per-tumor p-value, BH q-value, medians and sample sizes of every gene."""
+
+    def __init__(self, path):
+        with np.load(path) as tables:
+            self.genes = tables['genes'].tolist()
+            self.tumors = tables['tumors'].tolist()
+            self.fields = {name: tables[name] for name in ANTIGEN_FIELDS}
+        self.rows = {gene: row for row, gene in enumerate(self.genes)}
+        self.columns = {tumor: column for column, tumor in enumerate(self.tumors)}
+
+    def values(self, gene, tumors, field):
+        """``field`` (see ``ANTIGEN_FIELDS``) of ``gene`` in each of ``tumors``."""
+        return self.fields[field][self.rows[gene], [self.columns[tumor] for tumor in tumors]]
+
+    def frame(self, tumor):
+        """DataFrame indexed by gene with one column per field for ``tumor``."""
+        column = self.columns[tumor]
+        return pd.DataFrame({name: values[:, column] for name, values in self.fields.items()},
+                            index=pd.Index(self.genes, name='gene'))
+
+
+class FoldChangeTable:
+    """log2(FC) of every gene (rows) and tumor (columns) with each tumor column pre-sorted.
+
+    The genes above or below any threshold are found with a binary search on
+    the sorted column and returned as row indexes into ``genes``/``values``.
+    Genes are located through a gene -> row index, so the log2(FC) of any
+    panel of genes and tumors is read with a single fancy-index operation.
+    """
+
+    def __init__(self, genes, tumors, values):
+        self.genes = np.asarray(genes)
+        self.tumors = list(tumors)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.columns = {tumor: column for column, tumor in enumerate(self.tumors)}
+        self.rows = {gene: row for row, gene in enumerate(self.genes.tolist())}
+        self.order = np.argsort(self.values, axis=0, kind='stable')
+        self.sorted = np.take_along_axis(self.values, self.order, axis=0)
+        # Missing values are sorted last and never returned
+        self.valid = np.count_nonzero(~np.isnan(self.values), axis=0)
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Build from a DataFrame with a ``gene`` column followed by one column per tumor."""
+        tumors = [column for column in frame.columns if column != 'gene']
+        return cls(frame['gene'].to_numpy(), tumors, frame[tumors].to_numpy())
+
+    @classmethod
+    def load(cls, path):
+        """Build from a file written by :func:`write_fold_change_table`."""
+        with np.load(path) as table:
+            return cls(table['genes'], table['tumors'].tolist(), table['values'])
+
+    def __contains__(self, gene):
+        return gene in self.rows
+
+    def column(self, tumor):
+        return self.values[:, self.columns[tumor]]
+
+    def lookup(self, genes, tumors):
+        """log2(FC) of ``genes`` (rows) in ``tumors`` (columns), in the given order."""
+        rows = [self.rows[gene] for gene in genes]
+        columns = [self.columns[tumor] for tumor in tumors]
+        return self.values[np.ix_(rows, columns)]
+
+    def limits(self, tumor):
+        """Minimum and maximum log2(FC) of ``tumor``, or None if it has no log2(FC) values."""
+        column = self.columns[tumor]
+        if not self.valid[column]:
+            return None
+        return self.sorted[0, column], self.sorted[self.valid[column] - 1, column]
+
+    def above(self, tumor, threshold):
+        """Rows with log2(FC) >= ``threshold``, in ascending log2(FC) order."""
+        column = self.columns[tumor]
+        start = np.searchsorted(self.sorted[:self.valid[column], column], threshold, side='left')
+        return self.order[start:self.valid[column], column]
+
+    def below(self, tumor, threshold):
+        """Rows with log2(FC) <= ``threshold``, in ascending log2(FC) order."""
+        column = self.columns[tumor]
+        stop = np.searchsorted(self.sorted[:self.valid[column], column], threshold, side='right')
+        return self.order[:stop, column]
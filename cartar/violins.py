@@ -0,0 +1,74 @@
+"""Memory-mapped violin densities of every gene and sample group.
+
+The kernel density of the expression of each gene in each sample group is
+evaluated once by the pre-processing pipeline on a fixed number of evenly
+spaced points, in TPM and in log2(TPM+1), and stored as float16 curves
+scaled to a peak of 1. The curves of a gene are contiguous in the file, so
+drawing the violins of a gene reads a few kilobytes and runs no KDE.
+"""
+import json
+import os
+
+import numpy as np
+
+DENSITY_FILE = 'density.npy'
+SUPPORT_FILE = 'support.npy'
+INDEX_FILE = 'index.json'
+# Scales of the stored densities
+SCALES = ('TPM', 'log2(TPM+1)')
+
+
+def write_violin_store(path, genes, groups, violins):
+    """Write the violin densities to the ``path`` directory.
+
+    ``groups`` are the group names and ``violins`` gives, for each group, the
+    ``(support, density)`` pairs returned by
+    :func:`cartar.stats.violin_densities` for the TPM and the log2(TPM+1)
+    values of every gene.
+    """
+    os.makedirs(path, exist_ok=True)
+    gridsize = violins[0][0][1].shape[1]
+    shape = (len(genes), len(SCALES), len(groups))
+    density = np.lib.format.open_memmap(os.path.join(path, DENSITY_FILE), mode='w+', dtype=np.float16,
+                                        shape=shape + (gridsize,))
+    support = np.empty(shape + (2,), dtype=np.float32)
+    for column, scales in enumerate(violins):
+        for scale, (group_support, group_density) in enumerate(scales):
+            support[:, scale, column] = group_support
+            density[:, scale, column] = group_density
+    density.flush()
+    del density
+    np.save(os.path.join(path, SUPPORT_FILE), support)
+    with open(os.path.join(path, INDEX_FILE), 'w') as out:
+        json.dump({'genes': list(genes), 'groups': list(groups), 'scales': list(SCALES), 'gridsize': gridsize}, out)
+
+
+class ViolinStore:
+    """Read-only view of a store written by :func:`write_violin_store`."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, INDEX_FILE), 'r') as index_file:
+            index = json.load(index_file)
+        self.genes = index['genes']
+        self.groups = index['groups']
+        self.rows = {gene: row for row, gene in enumerate(self.genes)}
+        self.columns = {group: column for column, group in enumerate(self.groups)}
+        self.density = np.load(os.path.join(path, DENSITY_FILE), mmap_mode='r')
+        self.support = np.load(os.path.join(path, SUPPORT_FILE), mmap_mode='r')
+
+    def __contains__(self, gene):
+        return gene in self.rows
+
+    def violins(self, gene, groups, log2=False):
+        """Support limits (groups x 2) and densities (groups x points) of ``gene`` in TPM or, if ``log2``, in
+        log2(TPM+1).
+
+        The densities are scaled to a peak of 1 and evaluated on evenly spaced
+        points between the support limits. They are NaN for groups whose
+        samples have no variance, with both limits at their value, and the
+        limits are NaN for groups without samples.
+        """
+        row, scale = self.rows[gene], int(log2)
+        columns = [self.columns[group] for group in groups]
+        return (self.support[row, scale, columns].astype(np.float64),
+                self.density[row, scale, columns].astype(np.float64))
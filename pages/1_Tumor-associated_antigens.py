@@ -1,10 +1,10 @@
 import math
-import pickle
+import numpy as np
 import pandas as pd
-import statsmodels.stats.multitest as smm
 import streamlit as st
 import plotly.express as px
 import base64
+from cartar.data import fold_change_table, hpa_membrane_genes, antigen_tables
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -78,9 +78,7 @@ abbreviations = {'ACC':'Adrenocortical carcinoma','BLCA':'Bladder Urothelial Car
                  'READ':'Rectum adenocarcinoma','SARC':'Sarcoma','SKCM':'Skin Cutaneous Melanoma','STAD':'Stomach adenocarcinoma',
                  'TGCT':'Testicular Germ Cell Tumors','THCA':'Thyroid carcinoma','THYM':'Thymoma',
                  'UCEC':'Uterine Corpus Endometrial Carcinoma','UCS':'Uterine Carcinosarcoma'}
-experimental_pm_file = open('Data/HPA_evidence_pm.csv','r')
-for line in experimental_pm_file:
-    experimental_pm_genes = line.split(',')
+experimental_pm_genes = hpa_membrane_genes()
 # List with expression options
 limit_options = ['Above', 'Below']
 # Select tumor
@@ -91,130 +89,81 @@ if not tumor:
 with st.expander('Extension of tumor abbreviations\' meaning'):
     for abbreviation, meaning in abbreviations.items():
         st.write(f"**{abbreviation}:** {meaning}")
-# Introduce fold change
-FC = st.text_input('Enter the Fold Change (FC) value to be used as the threshold for identifying tumor-associated genes:')
-FC = FC.replace(',', '.')
-if FC and FC.replace('.', '').isdigit():
-    if ',' in FC:
-        FC_f = float(FC) 
-    else:
-        FC_f = float(FC)
 limit =st.radio('Select whether you are interested in genes above or below the specified threshold.', limit_options)
-    
-if st.button('Show tumor-associated genes'):
-    if FC.replace('.', '').isdigit() and FC != '':
-        # Identify genes meeting the stablished threshold
-        log2FC = math.log2(FC_f)
-        data = pd.read_csv('Data/log2FC_expression.csv')
-        final = {'Gene': [], 'log2(FC)': [], 'FC': [], f'{tumor} median': [], f'{tumor} sample size': [],
-                'Control median': [], 'Control sample size': [], 'Significance': [], 'p_value': [], 'p_adjusted': [], 'HPA membrane location': []}
-        figure = {'Gene': [], 'log2(FC)': [], 'adjusted_p_value': [], 'Legend': []}
-        selected_genes = []
-        for index, row in data.iterrows():
-            gene = row['gene']
-            log2_FC = row[tumor]
-            figure['Gene'].append(gene)
-            figure['log2(FC)'].append(log2_FC)
-            if limit == 'Above':
-                if row[tumor] >= log2FC:
-                    selected_genes.append(gene)
-                    final['Gene'].append(gene)
-                    final['log2(FC)'].append(log2_FC)
-                    final['FC'].append(2**log2_FC)
-                    if gene in experimental_pm_genes:
-                        final['HPA membrane location'].append('Yes')
-                    else:
-                        final['HPA membrane location'].append('No')
-            else:
-                if row[tumor] <= log2FC:
-                    selected_genes.append(gene)
-                    final['Gene'].append(gene)
-                    final['log2(FC)'].append(log2_FC)
-                    final['FC'].append(2**log2_FC)
-                    if gene in experimental_pm_genes:
-                        final['HPA membrane location'].append('Yes')
-                    else:
-                        final['HPA membrane location'].append('No')
-        if not selected_genes:
-            max_FC = 2 ** data[tumor].max()
-            min_FC = 2 ** data[tumor].min()
-            st.error(f'Fold Change (FC) used is beyond the valid range. The maximum allowable value in this tumor is {max_FC} and the minimum is {min_FC}.')
-        else:
-            # Determine median and p-value of differential expression
-            with open('Data/median.pkl', 'rb') as archivo:
-                medians = pickle.load(archivo)
-            with open('Data/p_value.pkl', 'rb') as archivo:
-                p_values = pickle.load(archivo)
-            list_p_values = [p_values[gene][tumor] for gene in p_values]
-            adjusted_p_values = smm.multipletests(list_p_values, method='fdr_bh')[1]
-            n = 0
-            for gene in medians.keys():
-                p_value = p_values[gene][tumor]
-                adjusted_p_value = adjusted_p_values[n]
-                if gene in selected_genes:
-                    for group in medians[gene][tumor].keys():
-                        if group == 'Tumor':
-                            final[f'{tumor} median'].append(medians[gene][tumor][group][0])
-                            final[f'{tumor} sample size'].append(medians[gene][tumor][group][1])
-                        elif group == 'Normal':
-                            final['Control median'].append(medians[gene][tumor][group][0])
-                            final['Control sample size'].append(medians[gene][tumor][group][1])
-                    final['p_value'].append(p_value)
-                    final['p_adjusted'].append(adjusted_p_values[n])
-                    if adjusted_p_values[n] < 0.001:
-                        final['Significance'].append('<0.001')
-                    elif adjusted_p_values[n] < 0.01:
-                        final['Significance'].append('<0.01')
-                    elif adjusted_p_values[n] < 0.05:
-                        final['Significance'].append('<0.05')
-                    else: 
-                        final['Significance'].append('No significant')
-                figure['adjusted_p_value'].append(-(math.log10(adjusted_p_values[n])))
-                if adjusted_p_values[n] < 0.05 and gene in selected_genes:
-                    figure['Legend'].append('Above threshold')
-                else:
-                    figure['Legend'].append('Below threshold')
-                n += 1
-        table = pd.DataFrame(final)
-        if table.size > 0:
-            t_data = table.sort_values(by='FC', ascending=False)
-            # Show plot and table with the results
-            table_data = pd.DataFrame(t_data)
-            figure = pd.DataFrame(figure)
-            color1 = 'rgba(156, 165, 196, 0.95)'
-            color2 = 'rgba(179, 48, 41, 0.89)'
-            fig = px.scatter(figure, x='log2(FC)', y='adjusted_p_value', color='Legend', color_discrete_map={'Above threshold': color2, 'Below threshold':color1,},custom_data=['Gene'])
-            fig.update_layout(legend=dict(traceorder='reversed'))
-            fig.update_traces(hovertemplate='%{customdata}')
-            fig.update_layout(title=f'Tumor-associated antigens in {tumor}', title_x=0.35, xaxis_title='log2(FC)', yaxis_title= '-log10(adjusted p-value)')
-            st.header('Volcano plot', divider='rainbow')
-            st.plotly_chart(fig,use_container_width=True)
-            if limit == 'Above':
-                text = f'The interactive volcano plot above visualizes the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the corresponding p-values for all genes. Significant genes (adjusted p-value < 0.05) exhibiting a fold change higher than the specified threshold are highlighted in <span style="color:{color2}">red</span>, while other genes appear in <span style="color:{color1}">grey</span>. Hovering over the plot reveals the name of each gene.'
-            else:
-                text = f'The interactive volcano plot above visualizes the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the corresponding p-values for all genes. Significant genes (adjusted p-value < 0.05) exhibiting a fold change lower than the specified threshold are highlighted in <span style="color:{color2}">red</span>, while other genes appear in <span style="color:{color1}">grey</span>. Hovering over the plot reveals the name of each gene.'            
-            st.markdown(text, unsafe_allow_html=True)
-            st.header('Data table', divider='rainbow')
-            if limit == 'Above':
-                st.write(
-                    f'The table below presents all relevant data, encompassing the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the p-value and adjusted p-value for each gene above the specified threshold. You can enhance exploration by clicking on the column names to arrange genes based on that column, either from higher to lower or vice versa. Please note that **the adjusted p-values under 0.001 are rounded to 0**; for the complete decimal value, click on the respective cell.'
-                )
-            else:
-                st.write(
-                    f'The table below presents all relevant data, encompassing the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the p-value and adjusted p-value for each gene below the specified threshold. You can enhance exploration by clicking on the column names to arrange genes based on that column, either from higher to lower or vice versa. Please note that **p-values under 0.001 are rounded to 0**; for the complete decimal value, click on the respective cell.'
-                )       
-            st.write(
-                'The **HPA (Human Protein Atlas) membrane location column** will be "Yes" if the protein has been experimentally reported to be located in the plasma membrane and "No" when they are only located in the membrane acording to the Gene Ontology, without having been experimentally located in the plasma membrane by Human Protien Atlas.'
-            )
-            st.dataframe(table_data, hide_index=True)
-            table = table_data.to_csv(encoding='utf-8', index=False)
-            b64 = base64.b64encode(table.encode()).decode()
-            href = f'<a href="data:file/csv;base64,{b64}" download="table.csv">Download CSV File</a>'
-            st.markdown(href, unsafe_allow_html=True)
-    elif FC == '':
-        st.error('No FC was introduced') 
-    elif FC[0] == '-':
-        st.error('FC must be a positive number') 
-    else: 
-        st.error('Introduce a numerical FC') 
+# Introduce fold change (any value in steps of 0.05 across the range of the selected tumor)
+fold_changes = fold_change_table()
+limits = fold_changes.limits(tumor)
+if limits is None:
+    st.error(f'There are no Fold Change (FC) values for {tumor}')
+    create_footer()
+    st.stop()
+low, high = limits
+FC_min = max(0.05, round(math.floor(2 ** low / 0.05) * 0.05, 2))
+FC_max = max(FC_min, round(math.ceil(2 ** high / 0.05) * 0.05, 2))
+default = 2.0 if limit == 'Above' else 0.5
+FC_f = st.slider('Select the Fold Change (FC) value to be used as the threshold for identifying tumor-associated genes:', min_value=FC_min, max_value=FC_max, value=min(max(default, FC_min), FC_max), step=0.05)
+
+# Identify genes meeting the stablished threshold
+log2FC = math.log2(FC_f)
+genes = fold_changes.genes
+log2_FC = fold_changes.column(tumor)
+if limit == 'Above':
+    rows = fold_changes.above(tumor, log2FC)
+else:
+    rows = fold_changes.below(tumor, log2FC)
+final = {}
+figure = {}
+if len(rows) == 0:
+    st.error(f'Fold Change (FC) used is beyond the valid range. The maximum allowable value in this tumor is {2 ** high} and the minimum is {2 ** low}.')
+else:
+    # Get the precomputed median, p-value and adjusted p-value of differential expression
+    stats = antigen_tables().frame(tumor).reindex(genes)
+    adjusted_p_values = stats['q_value'].to_numpy()
+    final = {'Gene': genes[rows], 'log2(FC)': log2_FC[rows], 'FC': 2**log2_FC[rows],
+             f'{tumor} median': stats['tumor_median'].to_numpy()[rows], f'{tumor} sample size': stats['tumor_n'].to_numpy()[rows],
+             'Control median': stats['control_median'].to_numpy()[rows], 'Control sample size': stats['control_n'].to_numpy()[rows],
+             'Significance': np.select([adjusted_p_values[rows] < 0.001, adjusted_p_values[rows] < 0.01, adjusted_p_values[rows] < 0.05],
+                                       ['<0.001', '<0.01', '<0.05'], 'No significant'),
+             'p_value': stats['p_value'].to_numpy()[rows], 'p_adjusted': adjusted_p_values[rows],
+             'HPA membrane location': np.where(np.isin(genes[rows], list(experimental_pm_genes)), 'Yes', 'No')}
+    selected = np.zeros(len(genes), dtype=bool)
+    selected[rows] = True
+    figure = {'Gene': genes, 'log2(FC)': log2_FC, 'adjusted_p_value': -np.log10(adjusted_p_values),
+              'Legend': np.where((adjusted_p_values < 0.05) & selected, 'Above threshold', 'Below threshold')}
+table = pd.DataFrame(final)
+if table.size > 0:
+    t_data = table.sort_values(by='FC', ascending=False)
+    # Show plot and table with the results
+    table_data = pd.DataFrame(t_data)
+    figure = pd.DataFrame(figure)
+    color1 = 'rgba(156, 165, 196, 0.95)'
+    color2 = 'rgba(179, 48, 41, 0.89)'
+    fig = px.scatter(figure, x='log2(FC)', y='adjusted_p_value', color='Legend', color_discrete_map={'Above threshold': color2, 'Below threshold':color1,},custom_data=['Gene'])
+    fig.update_layout(legend=dict(traceorder='reversed'))
+    fig.update_traces(hovertemplate='%{customdata}')
+    fig.update_layout(title=f'Tumor-associated antigens in {tumor}', title_x=0.35, xaxis_title='log2(FC)', yaxis_title= '-log10(adjusted p-value)')
+    st.header('Volcano plot', divider='rainbow')
+    st.plotly_chart(fig,use_container_width=True)
+    if limit == 'Above':
+        text = f'The interactive volcano plot above visualizes the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the corresponding p-values for all genes. Significant genes (adjusted p-value < 0.05) exhibiting a fold change higher than the specified threshold are highlighted in <span style="color:{color2}">red</span>, while other genes appear in <span style="color:{color1}">grey</span>. Hovering over the plot reveals the name of each gene.'
+    else:
+        text = f'The interactive volcano plot above visualizes the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the corresponding p-values for all genes. Significant genes (adjusted p-value < 0.05) exhibiting a fold change lower than the specified threshold are highlighted in <span style="color:{color2}">red</span>, while other genes appear in <span style="color:{color1}">grey</span>. Hovering over the plot reveals the name of each gene.'            
+    st.markdown(text, unsafe_allow_html=True)
+    st.header('Data table', divider='rainbow')
+    if limit == 'Above':
+        st.write(
+            f'The table below presents all relevant data, encompassing the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the p-value and adjusted p-value for each gene above the specified threshold. You can enhance exploration by clicking on the column names to arrange genes based on that column, either from higher to lower or vice versa. Please note that **the adjusted p-values under 0.001 are rounded to 0**; for the complete decimal value, click on the respective cell.'
+        )
+    else:
+        st.write(
+            f'The table below presents all relevant data, encompassing the log2(FC) between "Primary {tumor} tumor" and "Control" samples, along with the p-value and adjusted p-value for each gene below the specified threshold. You can enhance exploration by clicking on the column names to arrange genes based on that column, either from higher to lower or vice versa. Please note that **p-values under 0.001 are rounded to 0**; for the complete decimal value, click on the respective cell.'
+        )       
+    st.write(
+        'The **HPA (Human Protein Atlas) membrane location column** will be "Yes" if the protein has been experimentally reported to be located in the plasma membrane and "No" when they are only located in the membrane acording to the Gene Ontology, without having been experimentally located in the plasma membrane by Human Protien Atlas.'
+    )
+    st.dataframe(table_data, hide_index=True)
+    table = table_data.to_csv(encoding='utf-8', index=False)
+    b64 = base64.b64encode(table.encode()).decode()
+    href = f'<a href="data:file/csv;base64,{b64}" download="table.csv">Download CSV File</a>'
+    st.markdown(href, unsafe_allow_html=True)
 create_footer()
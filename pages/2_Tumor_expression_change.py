@@ -4,6 +4,7 @@ import pandas as pd
 from math import log2
 import requests
 import base64
+from cartar.data import fold_change_table, hpa_membrane_genes, no_membrane_genes
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -78,15 +79,11 @@ abbreviations = {'ACC':'Adrenocortical carcinoma','BLCA':'Bladder Urothelial Car
                  'UCEC':'Uterine Corpus Endometrial Carcinoma','UCS':'Uterine Carcinosarcoma'}
 
 genes = st.text_input('Enter gene symbols of interest (separated by commas or spaces):').upper().strip(' ')
-experimental_pm_file = open('Data/HPA_evidence_pm.csv','r')
-for line in experimental_pm_file:
-    experimental_pm_genes = line.split(',')
+experimental_pm_genes = hpa_membrane_genes()
 correct_genes = []
 # Identify if indicated gene is present in the data
-exclude = open('Data/no_membrane_genes.csv','r')
-for line in exclude:
-    no_membrane = line.split(',')
-data = pd.read_csv('Data/log2FC_expression.csv')
+no_membrane = no_membrane_genes()
+data = fold_change_table()
 if ' ' in genes and ',' not in genes:
     genes = genes.replace(' ',',')
 elif ', ' in genes or ' ,' in genes:
@@ -98,7 +95,7 @@ else:
     for gene in genes:
         if gene == '':
             pass
-        elif gene not in data['gene'].values:
+        elif gene not in data:
             if gene in no_membrane:
                 st.error(f'The protein encoded by {gene} is not located at the membrane')
             else:
@@ -131,38 +128,16 @@ st.info('FC = Fold Change')
 if st.button('Show Fold Change'):
     # If there is at least one valid gene
     if correct_genes:
-        data = open('Data/log2FC_expression.csv','r')
-        t_data = {'Tumor':[]}
-        for gene in correct_genes:
-            t_data[gene] = []
-        firstline = 1
-        indexes = [] # List indicating the index corresponding to the introdueced tumors
-        for line in data:
-            line = line.strip()
-            fields = line.split(',')
-            # Idnetify the name of the intoduced tumors and their indexes
-            if firstline: 
-                for field in fields[1:]:
-                    if field in tumors:
-                        indexes.append(f'{field}_{fields.index(field)}')
-                firstline = 0
-            # Identify the corresponding fold change for the introduced tumors in the desired scale
-            else: 
-                for gene in correct_genes:
-                    if fields[0] == gene:
-                        if scale == 'FC':
-                            for index in indexes:
-                                tumor = index.split('_')[0]
-                                n = int(index.split('_')[1])
-                                t_data[gene].append(2**float((fields[n])))
-                        else:
-                            for index in indexes:
-                                tumor = index.split('_')[0]
-                                n = int(index.split('_')[1])
-                                t_data[gene].append(float(fields[n]))
-        for index in indexes:
-            tumor = index.split('_')[0]
-            t_data['Tumor'].append(tumor)
+        # Introduced tumors in the order of the table and introduced genes without repetitions
+        selected_tumors = [tumor for tumor in data.tumors if tumor in tumors]
+        selected_genes = list(dict.fromkeys(correct_genes))
+        # Identify the fold change of all genes for the introduced tumors in the desired scale
+        values = data.lookup(selected_genes, selected_tumors)
+        if scale == 'FC':
+            values = 2 ** values
+        t_data = {'Tumor':selected_tumors}
+        for n, gene in enumerate(selected_genes):
+            t_data[gene] = values[n]
         # Show table with the results
         table_data = pd.DataFrame(t_data)
         st.header('Data table', divider='rainbow')
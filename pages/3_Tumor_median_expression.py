@@ -9,6 +9,7 @@ from io import StringIO
 import requests
 import csv
 import base64
+from cartar.data import median_tables, hpa_membrane_genes, no_membrane_genes
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -83,17 +84,13 @@ abbreviations = {'ACC':'Adrenocortical carcinoma','BLCA':'Bladder Urothelial Car
                  'UCEC':'Uterine Corpus Endometrial Carcinoma','UCS':'Uterine Carcinosarcoma'}
 
 gene = st.text_input('Enter gene symbol').upper().strip(' ')
-experimental_pm_file = open('Data/HPA_evidence_pm.csv','r')
-for line in experimental_pm_file:
-    experimental_pm_genes = line.split(',')
+experimental_pm_genes = hpa_membrane_genes()
 # Identify if indicated gene is present in the data
-data = pd.read_csv('Data/log2FC_expression.csv')
-exclude = open('Data/no_membrane_genes.csv','r')
-for line in exclude:
-    no_membrane = line.split(',')
+medians = median_tables()
+no_membrane = no_membrane_genes()
 if gene == '':
     st.error('Introduce gene symbol. You can try CEACAM6')
-elif gene != '' and gene not in data['gene'].values:
+elif gene != '' and gene not in medians:
     if gene in no_membrane:
         st.error(f' The protein encoded by {gene} is not located at the membrane')
     else:
@@ -114,80 +111,12 @@ elif selection == 'log2(TPM+1)':
 st.info('TPM = Transcript Per Million')
 
 if st.button('Create barplot'):
-    if gene != '' and gene in data['gene'].values: 
-        # Get the required data
-        t_data = {'Tumor':[],'Metastatic median':[], 'Primary tumor median':[], 'Control median':[]}         
-        categories = [] # List conatining the name of introduced valid tumors
-        for tumor in tumors:
-            categories.append(tumor)
-            t_data['Tumor'].append(tumor)
-        categories = sorted(categories) # Sort tumor named alphabetically
-        metastatic = [] # List with median values of metastatic sample groups (NA if not available)
-        primary = [] # List with median values of primary tumor sample groups
-        normal = [] # List with median values of control sample groups
-        data = open('Data/targetable_gene_Tpm_TumorVsControl_final.csv','r') # Read expression data for the samples
-        m_indexes = [] # List with indexes of metastatic sample groups
-        p_indexes = [] # List with indexes values of primary tumor sample groups
-        n_indexes = [] # List with indexes values of control sample groups
-        firstline = 1
-        for line in data:
-            fields = line.split(',')
-            # Identify position of fields belonging to each sample group of the selected tumors in the firstline of the file
-            if firstline: 
-                n = 0
-                for field in fields[1:]:
-                    n += 1
-                    if field in tumors:
-                        control = fields[n+1]
-                        p_indexes.append(fields.index(field))
-                        if 'Metastatic' in control:
-                            m_indexes.append(n+1)
-                            n_indexes.append(n+2)
-                        else:
-                            m_indexes.append(-1)
-                            n_indexes.append(n+1)
-                firstline = 0
-            else: 
-                # Identify median value for each sample group in the selected tumors and selected scale, and add it to corresponding list
-                if gene == fields[0]:
-                    if scale == 'log2(TPM+1)':
-                        for index in m_indexes:
-                            if index == -1:
-                                metastatic.append(np.nan) # Add NA if metastatic data not available
-                                t_data['Metastatic median'].append(np.nan)
-                            else:
-                                metastatic.append(log2(float(fields[index])+1))
-                                t_data['Metastatic median'].append(log2(float(fields[index])+1))
-                        for index in p_indexes:
-                            primary.append(log2(float(fields[index])+1))
-                            t_data['Primary tumor median'].append(log2(float(fields[index])+1))
-                        for index in n_indexes: 
-                            normal.append(log2(float(fields[index])+1))
-                            t_data['Control median'].append(log2(float(fields[index])+1))
-                    else:
-                        for index in m_indexes:
-                            if index == -1:
-                                metastatic.append(np.nan)
-                                t_data['Metastatic median'].append(np.nan)
-                            else:
-                                metastatic.append(float(fields[index]))
-                                t_data['Metastatic median'].append(float(fields[index]))
-                        for index in p_indexes:
-                            primary.append(float(fields[index]))
-                            t_data['Primary tumor median'].append(float(fields[index]))
-                        for index in n_indexes: 
-                            normal.append(float(fields[index]))    
-                            t_data['Control median'].append(float(fields[index]))
+    if gene != '' and gene in medians: 
+        # Get the median value of each sample group in the selected tumors (sorted alphabetically) and scale
+        categories = sorted(tumors)
+        values = medians.values(gene, categories, log2=scale == 'log2(TPM+1)') # NA if the group is not available
         classes = ['Metastatic', 'Primary', 'Control']
-        values = [None]*len(categories)
-        for i in range(len(categories)):
-            for k in range(len(classes)):
-                if k == 0:
-                    values[i] = [metastatic[i]]
-                elif k == 1:
-                    values[i].append(primary[i])
-                elif k == 2:
-                    values[i].append(normal[i])
+        t_data = {'Tumor':categories,'Metastatic median':values[:,0], 'Primary tumor median':values[:,1], 'Control median':values[:,2]}
         # Create table with the results
         table_data = pd.DataFrame(t_data)
         # Creation of the dictionary containing all needed information for the pltypeot
@@ -229,6 +158,6 @@ if st.button('Create barplot'):
         st.markdown(href, unsafe_allow_html=True) 
     elif gene == '':
         st.error('No gene symbol was introduced')
-    elif gene not in data['gene'].values:
+    elif gene not in medians:
         st.error(f'{gene} gene symbol not found')  
 create_footer()
@@ -2,14 +2,12 @@ from itertools import count
 import streamlit as st
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import pandas as pd
-from math import log2
 import numpy as np
 import seaborn as sns
-from scipy.stats import mannwhitneyu
-import pickle
 import base64
+from cartar.data import fold_change_table, hpa_membrane_genes, no_membrane_genes, expression_store, summary_tables, antigen_tables, violin_store
+from cartar.plots import new_figure, render, theme, rotate_xticks, box_plot, thin_dots, violin_plot, hue_legend, categorical_axis, MAX_DOTS
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -66,7 +64,6 @@ st.markdown(mystyle, unsafe_allow_html=True)
 st.title('Gene expression across tumors')
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>',unsafe_allow_html=True)
 st.write('This tool can be used to generate boxplots, violin plots, or dot plots for the expression values of a gene of interest in primary tumor and control samples of desired tumor groups. Besides, median expression values, sample sizes of each group, and statistical significance of differential expression (obtained by Mann-Whitney U test) between "Primary tumor" and "Control" samples are reported in table format. This provides more detailed information than the **Tumor median expression tool** while no information about "Metastatic" samples is included due to its reduced sample size. In case of Skin Cutaneous Melanoma (SKCM), the only tumor group with a large "Metastatic" sample size (N=366) you can go to the **Metastatic gene expression tool** to compare between the three sample groups.')
-st.set_option('deprecation.showPyplotGlobalUse', False)
 
 tumor_options  = ['ACC','BLCA','BRCA','CESC','CHOL','COAD','DLBC','ESCA','GBM','HNSC','KICH','KIRC','KIRP','LAML','LGG','LIHC','LUAD','LUSC','OV','PAAD','PCPG','PRAD','READ','SARC','SKCM','STAD','TGCT','THCA','THYM','UCEC','UCS']
 scale_options = ['TPM','log2(TPM+1)']
@@ -85,17 +82,13 @@ abbreviations = {'ACC':'Adrenocortical carcinoma','BLCA':'Bladder Urothelial Car
                  'UCEC':'Uterine Corpus Endometrial Carcinoma','UCS':'Uterine Carcinosarcoma'}
 
 gene = st.text_input('Enter gene symbol').upper().strip(' ')
-experimental_pm_file = open('Data/HPA_evidence_pm.csv','r')
-for line in experimental_pm_file:
-    experimental_pm_genes = line.split(',')
+experimental_pm_genes = hpa_membrane_genes()
 # Identify if indicated gene is present in the data
-data = pd.read_csv('Data/log2FC_expression.csv')
-exclude = open('Data/no_membrane_genes.csv','r')
-for line in exclude:
-    no_membrane = line.split(',')
+fold_changes = fold_change_table()
+no_membrane = no_membrane_genes()
 if gene == '':
     st.error('Introduce gene symbol. You can try CEACAM6')
-elif gene != '' and gene not in data['gene'].values:
+elif gene != '' and gene not in fold_changes:
     if gene in no_membrane:
         st.error(f'The protein encoded by {gene} is not located at the membrane')
     else:
@@ -121,6 +114,8 @@ if selection2 == 'TPM':
 elif selection2 == 'log2(TPM+1)':
     scale = 'log2(TPM+1)'
 st.info('TPM = Transcript Per Million')
+# The dot plots of large groups show a subsample of their points unless all the points are requested
+all_points = plot == 'Dot plot' and st.checkbox('Show all points', help=f'By default, groups with more than {MAX_DOTS} samples show at most {MAX_DOTS} points plus their outliers')
 
 # Generate the data for the plot function
 def plot_data(data):
@@ -131,93 +126,88 @@ def plot_data(data):
     return(df)
 
 # Calculate statistical significance and customize plot function
-def plot_significance(tumors,y):
+def plot_significance(fig,ax,tumors,y):
     # Creat table data
     data = {'Tumor':[],'Tumor median':[], 'Tumor sample size':[], 'Control median':[], 'Control sample size':[],'log2(Fold Change)':[],'Significance':[],'p-value':[]}
     # Create list to store percentile90 of each group
     percentile90 = []
+    # Precomputed statistics of the primary tumor and control samples of each tumor, log2(TPM+1) medians for the fold 
+    # change and p-values of the Mann-Whitney U test comparing both groups
+    names = [f'{tumor}_{group}' for tumor in tumors for group in ['Tumor', 'Control']]
+    summaries = summary_tables()
+    stats = summaries.frame(gene, names, log2=scale == 'log2(TPM+1)')
+    log2_median = summaries.frame(gene, names, log2=True)['median']
+    p_values = antigen_tables().values(gene, tumors, 'p_value')
+    positions = np.arange(len(tumors))
     # Compare statistical difference between groups of a tumor type
-    tumors = df['Tumor'].unique()
     for k in range(len(tumors)):
         tumor = tumors[k]
-        tumor_data = df[df['Tumor'] == tumor]
-        types = tumor_data['Sample'].unique()
-        positions = np.arange(len(categories))
-        for i in range(len(types)):
-            for j in range(i + 1, len(types)):
-                type1 = types[i]
-                type2 = types[j]
-                values1 = tumor_data[tumor_data['Sample'] == type1]['Values']
-                percentile_90_1 = np.percentile(values1, 90)
-                data['Tumor sample size'].append(len(values1))
-                values2 = tumor_data[tumor_data['Sample'] == type2]['Values']
-                percentile_90_2 = np.percentile(values2, 90)
-                if percentile_90_2 > percentile_90_1:
-                    percentile_90_1 = percentile_90_2
-                percentile90.append(percentile_90_1)
-                data['Control sample size'].append(len(values2))
-                _, p_value = mannwhitneyu(values1, values2)
-                data['Tumor'].append(tumor)
-                data['Tumor median'].append(np.median(values1))
-                data['Control median'].append(np.median(values2))
-                data['p-value'].append(p_value)
-                if p_value < 0.001:
-                    data['Significance'].append('<0.001')
-                elif p_value < 0.01:
-                    data['Significance'].append('<0.01')
-                elif p_value < 0.05:
-                    data['Significance'].append('<0.05')
-                else: 
-                    data['Significance'].append('No significant')
-                if scale == 'TPM':
-                    logvalues1 = [log2(value1 + 1) for value1 in values1]
-                    logvalues2 = [log2(value2 + 1) for value2 in values2]
-                    data['log2(Fold Change)'].append(np.median(logvalues1)-np.median(logvalues2))
+        tumor_stats = stats.loc[f'{tumor}_Tumor']
+        control_stats = stats.loc[f'{tumor}_Control']
+        if tumor_stats['n'] and control_stats['n']:
+            percentile_90_1 = max(tumor_stats['p90'], control_stats['p90'])
+            percentile90.append(percentile_90_1)
+            p_value = p_values[k]
+            data['Tumor'].append(tumor)
+            data['Tumor median'].append(tumor_stats['median'])
+            data['Tumor sample size'].append(int(tumor_stats['n']))
+            data['Control median'].append(control_stats['median'])
+            data['Control sample size'].append(int(control_stats['n']))
+            data['p-value'].append(p_value)
+            if p_value < 0.001:
+                data['Significance'].append('<0.001')
+            elif p_value < 0.01:
+                data['Significance'].append('<0.01')
+            elif p_value < 0.05:
+                data['Significance'].append('<0.05')
+            else: 
+                data['Significance'].append('No significant')
+            data['log2(Fold Change)'].append(log2_median[f'{tumor}_Tumor'] - log2_median[f'{tumor}_Control'])
+            # Identify significant differences
+            if p_value < 0.05:
+                color = 'red' if tumor_stats['median'] > control_stats['median'] else 'green'
+            # Add * representation of significance
+            if p_value < 0.001:
+                if y == 1:
+                    ax.text(positions[k], percentile_90_1, '***', color=color, ha='center', fontsize=8)
                 else:
-                    data['log2(Fold Change)'].append(np.median(values1)-np.median(values2))
-                # Identify significant differences
-                if p_value < 0.05:
-                    color = 'red' if np.median(values1) > np.median(values2) else 'green'
-                # Add * representation of significance
-                if p_value < 0.001:
-                    if y == 1:
-                        plt.text(positions[k], percentile_90_1, '***', color=color, ha='center', fontsize=8)
-                    else:
-                        plt.text(positions[k], max(df['Values']), '***', color=color, ha='center', fontsize=8)
-                elif p_value < 0.01:
-                    if y == 1:
-                        plt.text(positions[k], percentile_90_1, '**', color=color, ha='center', fontsize=8)
-                    else:
-                        plt.text(positions[k], max(df['Values']), '**', color=color, ha='center', fontsize=8)
-                elif p_value < 0.05:
-                    if y == 1:
-                        plt.text(positions[k], percentile_90_1, '*', color=color, ha='center', fontsize=8)
-                    else:
-                        plt.text(positions[k], max(df['Values']), '*', color=color, ha='center', fontsize=8)
+                    ax.text(positions[k], stats['max'].max(), '***', color=color, ha='center', fontsize=8)
+            elif p_value < 0.01:
+                if y == 1:
+                    ax.text(positions[k], percentile_90_1, '**', color=color, ha='center', fontsize=8)
+                else:
+                    ax.text(positions[k], stats['max'].max(), '**', color=color, ha='center', fontsize=8)
+            elif p_value < 0.05:
+                if y == 1:
+                    ax.text(positions[k], percentile_90_1, '*', color=color, ha='center', fontsize=8)
+                else:
+                    ax.text(positions[k], stats['max'].max(), '*', color=color, ha='center', fontsize=8)
     # Create table with the results
     table_data = pd.DataFrame(data)
     # Customize the plot
-    plt.title(f'{gene} expression difference between tumoral conditions', y=1.03)
+    ax.set_title(f'{gene} expression difference between tumoral conditions', y=1.03)
     if y == 1:
         if scale == 'TPM':
-            plt.ylim(0,max(percentile90)+20)
+            ax.set_ylim(0,max(percentile90)+20)
         else:
-            plt.ylim(0,max(percentile90)+0.5)
+            ax.set_ylim(0,max(percentile90)+0.5)
     else:
-        plt.ylim(0, max(df['Values']))
+        ax.set_ylim(0, stats['max'].max())
     if scale == 'TPM':
-        plt.ylabel(f'{gene} expression in TPM')
+        ax.set_ylabel(f'{gene} expression in TPM')
     else: 
-        plt.ylabel(f'{gene} expression in log2(TPM+1)')
-    plt.xlabel('Tumor')
-    plt.xticks(rotation=45, ha='right')
-    plt.subplots_adjust(left=0.067, bottom=0.135, right=0.968, top=0.91)
+        ax.set_ylabel(f'{gene} expression in log2(TPM+1)')
+    ax.set_xlabel('Tumor')
+    rotate_xticks(ax)
+    fig.subplots_adjust(left=0.067, bottom=0.135, right=0.968, top=0.91)
     # Show the graph and table
     st.header(plot, divider='rainbow')
-    st.pyplot()
+    st.image(render(fig), use_column_width=True)
     st.write(
         f'The above figure displays the {plot} for {gene} expression in {scale} across selected tumors, comparing the expression between "Primary tumor" and "Control" samples. Statistical significance is indicated on top, between each specified tumor and its corresponding control (***: p_value < 0.001, **: p_value < 0.01, *: p_value < 0.05). The plot highlights significant overexpression in :red[red] when the gene is overexpressed in "Primary tumor" samples compared to "Control" samples, and in :green[green] when it is underexpressed.'
     )
+    if plot == 'Dot plot' and thinned:
+        st.write(f'The densest regions of {", ".join(thinned)} are thinned to show at most {MAX_DOTS} points of each group, plus all the points more than 1.5 IQR away from the quartiles. Check "Show all points" to plot every sample.')
     st.header('Data table', divider='rainbow')
     st.write(
         f'All pertinent data is presented in the table below, featuring the log2(Fold Change) for each comparison —calculated as the median of log2(TPM+1) expression in primary tumor samples minus the median of log2(TPM+1) in control samples— and the corresponding p-value. You can click on column names to arrange the tumors based on that column, either in ascending or descending order. Please note that **p-values under 0.001 are rounded to 0**; for the complete decimal value, click on the respective cell.'
@@ -239,95 +229,62 @@ gtex_tcga = {'ACC':'Adrenal Gland','BLCA':'Bladder','BRCA':'Breast','CESC':'Cerv
                     'STAD':'Stomach','TGCT':'Testis','THCA':'Thyroid','THYM':'Blood','UCEC':'Uterus','UCS':'Uterus'}
 
 if st.button(f'Create {plot}'):
-    if gene != '' and gene in data['gene'].values:
+    if gene != '' and gene in fold_changes:
         # If gene and tumor abreviation in data
-        if gene in data['gene'].values:  
-            # Load dictionary with tcga data  
-            if 'A' <= gene[0] <= 'C':
-                data = 'Data/tcga_AC.pkl'
-            elif 'D' <= gene[0] <= 'J':   
-                data = 'Data/tcga_DJ.pkl'
-            elif 'K' <= gene[0] <= 'N':
-                data = 'Data/tcga_KN.pkl'
-            elif 'O' <= gene[0] <= 'R':
-                data = 'Data/tcga_OR.pkl'
-            elif 'S' <= gene[0] <= 'T':
-                data = 'Data/tcga_ST.pkl'
-            elif 'U' <= gene[0] <= 'Z':
-                data = 'Data/tcga_UZ.pkl'
-            with open(data, 'rb') as archivo:
-                tcga = pickle.load(archivo)
-            # Get requested information
-            categories = [] # List with tumor types
-            groups = [] # Gruops of tumor (Primary or Normal)
-            values = [] # Expression values
-            for tumor in tumors:
-                for group in tcga[gene][tumor].keys():
-                    for value in tcga[gene][tumor][group]:
-                        categories.append(tumor)
-                        if group == 'Normal':
-                            groups.append('Control')
-                        else:
-                            groups.append(group)
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values.append(value)
-            # Load dictionary with gtex data
-            x = 1
-            for tumor in tumors:
-                if tumor in gtex_tcga.keys():
-                    if x:
-                        if 'A' <= gene[0] <= 'C':
-                            data = 'Data/gtex_AC.pkl'
-                        elif 'D' <= gene[0] <= 'J':   
-                            data = 'Data/gtex_DJ.pkl'
-                        elif 'K' <= gene[0] <= 'N':
-                            data = 'Data/gtex_KN.pkl'
-                        elif 'O' <= gene[0] <= 'R':
-                            data = 'Data/gtex_OR.pkl'
-                        elif 'S' <= gene[0] <= 'T':
-                            data = 'Data/gtex_ST.pkl'
-                        elif 'U' <= gene[0] <= 'Z':
-                            data = 'Data/gtex_UZ.pkl'
-                        with open(data, 'rb') as archivo:
-                            gtex = pickle.load(archivo)
-                        x = 0
-                    group = 'Control'
-                    for value in gtex[gene][gtex_tcga[tumor]]:
-                        categories.append(tumor)
-                        groups.append(group)
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values.append(value)                    
-            data = {'Tumor': categories, 'Sample':groups, 'Values':values}
-            # Create the boxplot
+        if gene in fold_changes:  
+            # Tumors in alphabetical order, as shown in the plots
+            tumors = sorted(tumors)
+            # Groups of each tumor, in the order drawn
+            names = [f'{tumor}_{group}' for tumor in tumors for group in ['Tumor', 'Control']]
+            # Create the boxplot from the precomputed statistics of the primary tumor and control samples of each tumor
             if plot == 'Boxplot':
-                df = plot_data(data)
-                plt.figure()
-                sns.set(style='whitegrid')
-                sns.boxplot(x='Tumor', y='Values', hue='Sample', data=df, palette={'Tumor': 'lightseagreen', 'Control': 'tan'}, flierprops={'marker': '.'},whis=(10, 90),showfliers=False)
-                xmin, xmax, ymin, ymax = plt.axis()
+                stats = summary_tables().frame(gene, names, log2=scale == 'log2(TPM+1)')
+                fig, ax = new_figure()
+                box_plot(ax, stats, positions=[k + offset for k in range(len(tumors)) for offset in [-0.2, 0.2]], colors=['lightseagreen', 'tan'] * len(tumors), width=0.4)
+                categorical_axis(ax, tumors)
+                hue_legend(ax, {'Tumor': 'lightseagreen', 'Control': 'tan'}, 'Sample')
                 # Calculate statistical significance and customize the plot
-                plot_significance(tumors,1)
-            # Create the violin plot
-            if plot == 'Violin plot':
-                df = plot_data(data)
-                plt.figure()
-                sns.violinplot(x='Tumor', y='Values', hue='Sample', data=df, split=True, inner='quartile', density_norm='width',palette={'Tumor': 'lightseagreen', 'Control': 'tan', 'Metastatic':'grey'})
-                xmin, xmax, ymin, ymax = plt.axis()
+                plot_significance(fig, ax, tumors,1)
+            # Create the violin plot from the precomputed densities of the primary tumor and control samples of each tumor
+            elif plot == 'Violin plot':
+                stats = summary_tables().frame(gene, names, log2=scale == 'log2(TPM+1)')
+                support, density = violin_store().violins(gene, names, log2=scale == 'log2(TPM+1)')
+                fig, ax = new_figure()
+                violin_plot(ax, support, density, stats, positions=[k for k in range(len(tumors)) for _ in range(2)], colors=['lightseagreen', 'tan'] * len(tumors), sides=[-1, 1] * len(tumors))
+                categorical_axis(ax, tumors)
+                hue_legend(ax, {'Tumor': 'lightseagreen', 'Control': 'tan'}, 'Sample')
                 # Calculate statistical significance and customize plot
-                plot_significance(tumors,0)         
+                plot_significance(fig, ax, tumors,0)
             # Create the dotplot
-            if plot == 'Dot plot':
+            else:
+                # Open the expression store
+                store = expression_store()
+                # Get requested information
+                categories = [] # List with tumor types
+                groups = [] # Gruops of tumor (Primary or Control)
+                values = [] # Expression values
+                thinned = [] # Groups drawn with a subsample of their points
+                for tumor in tumors:
+                    # The normal samples and the GTEX samples used as control of the tumor are the control group
+                    controls = [f'{tumor}_Normal'] + ([gtex_tcga[tumor]] if tumor in gtex_tcga else [])
+                    for group, samples in [('Tumor', [f'{tumor}_Tumor']), ('Control', controls)]:
+                        group_values = np.concatenate([store.values(gene, name, log2=scale == 'log2(TPM+1)') for name in samples])
+                        if not all_points and len(group_values) > MAX_DOTS:
+                            group_values = group_values[thin_dots(group_values)]
+                            thinned.append(f'{tumor} {group}')
+                        categories += [tumor] * len(group_values)
+                        groups += [group] * len(group_values)
+                        values += group_values.tolist()
                 data = {'Tumor': categories, 'Sample':groups, 'Values':values}
                 df = plot_data(data)
-                plt.figure()
-                sns.stripplot(x='Tumor', y='Values', jitter=True, hue='Sample', data=data, size=4, palette={'Tumor': 'lightseagreen', 'Control': 'tan', 'Metastatic':'grey'})
-                xmin, xmax, ymin, ymax = plt.axis()
+                fig, ax = new_figure()
+                with theme():
+                    sns.stripplot(x='Tumor', y='Values', jitter=True, hue='Sample', data=data, size=4, palette={'Tumor': 'lightseagreen', 'Control': 'tan', 'Metastatic':'grey'}, ax=ax)
+                xmin, xmax, ymin, ymax = ax.axis()
                 # Calculate statistical significance and customize the plot
-                plot_significance(tumors,0)   
+                plot_significance(fig, ax, tumors,0)   
     elif gene == '':
         st.error('No gene symbol was introduced')  
-    elif gene not in data['gene'].values:
+    elif gene not in fold_changes:
         st.error(f'{gene} gene symbol not found')
 create_footer()
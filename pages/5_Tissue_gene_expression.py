@@ -1,14 +1,13 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import pandas as pd
-from math import log2
 import numpy as np
 import seaborn as sns
-import pickle
 from scipy.stats import mannwhitneyu
 import base64
+from cartar.data import fold_change_table, hpa_membrane_genes, no_membrane_genes, expression_store, summary_tables, violin_store
+from cartar.plots import new_figure, render, theme, rotate_xticks, box_plot, thin_dots, violin_plot, categorical_axis, MAX_DOTS
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -65,7 +64,6 @@ st.markdown(mystyle, unsafe_allow_html=True)
 st.title('Gene expression across GTEx tissues')
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>',unsafe_allow_html=True)
 st.write('This tool can be used to create boxplots, violin plots, or dot plots for the expression values of a gene of interest across all GTEx tissues. When a tumor group is specified, the expression values of "Primary tumor" samples are included in the plot and compared to the expression values in each GTEx tissue. Besides, median expression values, sample sizes of each group, and statistical significance of differential expression when a tumor is introduced are reported in table format. This is critical to assess the specificity of candidate target genes. The CAR therapy will recognize the target antigen in all expressing cells and it is important to ensure that no vital tissue cells are destroyed.')
-st.set_option('deprecation.showPyplotGlobalUse', False)
 
 tumor_options  = ['ACC','BLCA','BRCA','CESC','CHOL','COAD','DLBC','ESCA','GBM','HNSC','KICH','KIRC','KIRP','LAML','LGG','LIHC','LUAD','LUSC','OV','PAAD','PCPG','PRAD','READ','SARC','SKCM','STAD','TGCT','THCA','THYM','UCEC','UCS']
 scale_options = ['TPM','log2(TPM+1)']
@@ -85,17 +83,13 @@ abbreviations = {'ACC':'Adrenocortical carcinoma','BLCA':'Bladder Urothelial Car
                  'UCEC':'Uterine Corpus Endometrial Carcinoma','UCS':'Uterine Carcinosarcoma'}
 
 gene = st.text_input('Enter gene symbol').upper().strip(' ')
-experimental_pm_file = open('Data/HPA_evidence_pm.csv','r')
-for line in experimental_pm_file:
-    experimental_pm_genes = line.split(',')
+experimental_pm_genes = hpa_membrane_genes()
 # Identify if indicated gene is present in the data
-data = pd.read_csv('Data/log2FC_expression.csv')
-exclude = open('Data/no_membrane_genes.csv','r')
-for line in exclude:
-    no_membrane = line.split(',')
+fold_changes = fold_change_table()
+no_membrane = no_membrane_genes()
 if gene == '':
     st.error('Introduce gene symbol. You can try CEACAM6')
-elif gene != '' and gene not in data['gene'].values:
+elif gene != '' and gene not in fold_changes:
     if gene in no_membrane:
         st.error(f'The protein encoded by {gene} is not located at the membrane')
     else:
@@ -117,6 +111,8 @@ elif selection == 'Dot plot':
     plot = 'Dot plot'
 selection2 = st.radio('Select scale', scale_options)
 st.info('TPM = Transcript Per Million')
+# The dot plots of large groups show a subsample of their points unless all the points are requested
+all_points = plot == 'Dot plot' and st.checkbox('Show all points', help=f'By default, groups with more than {MAX_DOTS} samples show at most {MAX_DOTS} points plus their outliers')
 if selection2 == 'TPM':
     scale = 'TPM'
 elif selection2 == 'log2(TPM+1)':
@@ -125,84 +121,83 @@ elif selection2 == 'log2(TPM+1)':
 # Create a list with all gtex tissues
 tissues = ['Blood','Blood Vessel','Brain','Thyroid','Pancreas','Muscle','Lung','Skin','Colon','Nerve','Adipose Tissue','Ovary','Heart','Breast','Pituitary','Testis','Vagina','Esophagus','Small Intestine','Spleen','Adrenal Gland','Stomach','Uterus','Liver','Bone Marrow','Salivary Gland','Prostate','Kidney','Bladder','Fallopian Tube','Cervix Uteri']
 # Function for statistical analysis of significance of tumoral group vs gtex data and customize plot function
-def statistics(y):
+def statistics(fig,ax,y):
+    # Precomputed statistics of each group in the plotted scale and log2(TPM+1) medians for the fold change
+    summaries = summary_tables()
+    stats = summaries.frame(gene, names, log2=scale == 'log2(TPM+1)')
+    log2_median = summaries.frame(gene, names, log2=True)['median']
     if tumor != '':
         if scale == 'TPM':
             n = 15
         else:
             n = 0.5
-        plt.axvline(x=0.5, color='red', linestyle='--') # Add a line to separte the tumor group fromt the GTEx data
+        ax.axvline(x=0.5, color='red', linestyle='--') # Add a line to separte the tumor group fromt the GTEx data
         # Creat table data
         data = {'GTEx tissue':[],f'{tumor} median':[],f'{tumor} sample size':[], 'Tissue median':[],'Tissue sample size':[], 'log2(Fold Change)':[],'Significance':[],'p-value':[]}
-        # Statistical analysis of significance of tumoral group vs gtex data
-        for i in range(len(groups)):
-            if groups[i] != tumor + ' Tumor':
-                percentile_90 = np.percentile(groups_data[i], 90)
-                data[f'{tumor} sample size'].append(len(groups_data[0]))
-                data['Tissue sample size'].append(len(groups_data[i]))
-                _, p_value = mannwhitneyu(groups_data[i], groups_data[0])
-                data['GTEx tissue'].append(groups[i])
-                data[f'{tumor} median'].append(np.median(groups_data[0]))
-                data['Tissue median'].append(np.median(groups_data[i]))
-                data['p-value'].append(p_value)
-                if p_value < 0.001:
-                    data['Significance'].append('<0.001')
-                elif p_value < 0.01:
-                    data['Significance'].append('<0.01')
-                elif p_value < 0.05:
-                    data['Significance'].append('<0.05')
-                else: 
-                    data['Significance'].append('No significant')
-                if scale == 'TPM':
-                    logvalues1 = [log2(value1 + 1) for value1 in groups_data[0]]
-                    logvalues2 = [log2(value2 + 1) for value2 in groups_data[i]]
-                    data['log2(Fold Change)'].append(np.median(logvalues1)-np.median(logvalues2))
+        # Statistical analysis of significance of tumoral group vs gtex data (only the test reads the samples)
+        tumor_values = store.values(gene, names[0])
+        for i in range(1, len(groups)):
+            percentile_90 = stats['p90'].iloc[i]
+            data[f'{tumor} sample size'].append(stats['n'].iloc[0])
+            data['Tissue sample size'].append(stats['n'].iloc[i])
+            _, p_value = mannwhitneyu(store.values(gene, names[i]), tumor_values)
+            data['GTEx tissue'].append(groups[i])
+            data[f'{tumor} median'].append(stats['median'].iloc[0])
+            data['Tissue median'].append(stats['median'].iloc[i])
+            data['p-value'].append(p_value)
+            if p_value < 0.001:
+                data['Significance'].append('<0.001')
+            elif p_value < 0.01:
+                data['Significance'].append('<0.01')
+            elif p_value < 0.05:
+                data['Significance'].append('<0.05')
+            else: 
+                data['Significance'].append('No significant')
+            data['log2(Fold Change)'].append(log2_median.iloc[0] - log2_median.iloc[i])
+            # Identify significant differences
+            if p_value < 0.05:
+                color = 'red' if stats['median'].iloc[i] < stats['median'].iloc[0] else 'green'
+            # Add * representation of significance
+            if p_value < 0.001:
+                if y == 1:
+                    ax.text(positions[i], percentile_90, '***', color=color,ha='center', fontsize=8)
+                else:
+                    ax.text(positions[i], stats['max'].iloc[i] + n, '***', color=color,ha='center',fontsize=8)
+            elif p_value < 0.01:
+                if y == 1:
+                    ax.text(positions[i], percentile_90, '**', color=color,ha='center', fontsize=8)
                 else:
-                    data['log2(Fold Change)'].append(np.median(groups_data[0])-np.median(groups_data[i]))
-                # Identify significant differences
-                if p_value < 0.05:
-                    color = 'red' if np.median(groups_data[i]< np.median(groups_data[0])) else 'green'
-                # Add * representation of significance
-                if p_value < 0.001:
-                    if y == 1:
-                        plt.text(positions[i], percentile_90, '***', color=color,ha='center', fontsize=8)
-                    else:
-                        plt.text(positions[i], max(groups_data[i]) + n, '***', color=color,ha='center',fontsize=8)
-                elif p_value < 0.01:
-                    if y == 1:
-                        plt.text(positions[i], percentile_90, '**', color=color,ha='center', fontsize=8)
-                    else:
-                        plt.text(positions[i], max(groups_data[i]) + n, '***', color=color,ha='center',fontsize=8)
-                elif p_value < 0.05:
-                    if y == 1:
-                        plt.text(positions[i], percentile_90, '*', color=color,ha='center', fontsize=8)
-                    else:
-                        plt.text(positions[i], max(groups_data[i]) + n, '***', color=color,ha='center',fontsize=8)
+                    ax.text(positions[i], stats['max'].iloc[i] + n, '***', color=color,ha='center',fontsize=8)
+            elif p_value < 0.05:
+                if y == 1:
+                    ax.text(positions[i], percentile_90, '*', color=color,ha='center', fontsize=8)
+                else:
+                    ax.text(positions[i], stats['max'].iloc[i] + n, '***', color=color,ha='center',fontsize=8)
     else:
         data = {'GTEx tissue':[],'Tissue median':[],'Tissue sample size':[]}
         for i in range(len(groups)):
             data['GTEx tissue'].append(groups[i])
-            data['Tissue median'].append(np.median(groups_data[i]))
-            data['Tissue sample size'].append(len(groups_data[i]))
+            data['Tissue median'].append(stats['median'].iloc[i])
+            data['Tissue sample size'].append(stats['n'].iloc[i])
     # Create table with the results
     table_data = pd.DataFrame(data)  
     # Customize plot 
     if y == 0:
-        plt.ylim(0, max(df['Values']) + 2)
-    plt.xlabel('Tissues')
+        ax.set_ylim(0, stats['max'].max() + 2)
+    ax.set_xlabel('Tissues')
     if tumor != '':
-        plt.title(f'{gene} expression comparison between {tumor} and GTEx data', y=1.03)
+        ax.set_title(f'{gene} expression comparison between {tumor} and GTEx data', y=1.03)
     else: 
-        plt.title(f'{gene} expression in GTEx data', y=1.03)
+        ax.set_title(f'{gene} expression in GTEx data', y=1.03)
     if scale == 'TPM':
-        plt.ylabel(f'{gene} expression in TPM')
+        ax.set_ylabel(f'{gene} expression in TPM')
     else: 
-        plt.ylabel(f'{gene} expression in log2(TPM+1)')
-    plt.xticks(rotation=45,ha='right')
-    plt.subplots_adjust(left=0.067, bottom=0.2, right=0.968, top=0.91)
+        ax.set_ylabel(f'{gene} expression in log2(TPM+1)')
+    rotate_xticks(ax)
+    fig.subplots_adjust(left=0.067, bottom=0.2, right=0.968, top=0.91)
     # Show the graph and table
     st.header(plot, divider='rainbow')
-    st.pyplot()
+    st.image(render(fig), use_column_width=True)
     if tumor:
         if plot != 'Dot plot':
             st.write(
@@ -221,6 +216,8 @@ def statistics(y):
             st.write(
                 f'The figure above depicts the {plot} illustrating {gene} expression in {scale} across all GTEx tissues. The black bar represents the median of each group. As no tumor was specified, no statistical significance is indicated.'
             )
+    if plot == 'Dot plot' and thinned:
+        st.write(f'The densest regions of {", ".join(thinned)} are thinned to show at most {MAX_DOTS} points of each group, plus all the points more than 1.5 IQR away from the quartiles. Check "Show all points" to plot every sample.')
     st.header('Data table', divider='rainbow')
     if not tumor:
         st.write(
@@ -241,98 +238,62 @@ def statistics(y):
     st.markdown(href, unsafe_allow_html=True)
     
 if st.button(f'Create {plot}'):
-    if gene != '' and gene in data['gene'].values:
-        groups = [] # List with the names of the tissue
-        values = [] # List with the exoression values
-        if tumor != '':
-            # Load dictionary with tcga data  
-            if 'A' <= gene[0] <= 'C':
-                data = 'Data/tcga_AC.pkl'
-            elif 'D' <= gene[0] <= 'J':   
-                data = 'Data/tcga_DJ.pkl'
-            elif 'K' <= gene[0] <= 'N':
-                data = 'Data/tcga_KN.pkl'
-            elif 'O' <= gene[0] <= 'R':
-                data = 'Data/tcga_OR.pkl'
-            elif 'S' <= gene[0] <= 'T':
-                data = 'Data/tcga_ST.pkl'
-            elif 'U' <= gene[0] <= 'Z':
-                data = 'Data/tcga_UZ.pkl'
-            with open(data, 'rb') as archivo:
-                tcga = pickle.load(archivo)
-            for value in tcga[gene][tumor]['Tumor']:
-                groups.append(tumor + ' Tumor')
-                if scale == 'log2(TPM+1)':
-                    value = log2(value+1)
-                values.append(value)
-        # Load dictionary with gtex data  
-        if 'A' <= gene[0] <= 'C':
-            data = 'Data/gtex_AC.pkl'
-        elif 'D' <= gene[0] <= 'J':   
-            data = 'Data/gtex_DJ.pkl'
-        elif 'K' <= gene[0] <= 'N':
-            data = 'Data/gtex_KN.pkl'
-        elif 'O' <= gene[0] <= 'R':
-            data = 'Data/gtex_OR.pkl'
-        elif 'S' <= gene[0] <= 'T':
-            data = 'Data/gtex_ST.pkl'
-        elif 'U' <= gene[0] <= 'Z':
-            data = 'Data/gtex_UZ.pkl'
-        with open(data, 'rb') as archivo:
-            gtex = pickle.load(archivo)
-        for tissue in gtex[gene].keys():
-            for value in gtex[gene][tissue]:
-                groups.append(tissue)
-                if scale == 'log2(TPM+1)':
-                    value = log2(value+1)
-                values.append(value)
-        # Create the dicitionary with all the data
-        data = {'Groups':groups, 'Values':values} 
-        # Select tissues and order them alphabetically 
-        indexes = np.unique(data['Groups'], return_index=True)[1]
-        groups = [data['Groups'][index] for index in sorted(indexes)]
-        df = pd.DataFrame(data)
-        # Create a list with the values for each group
-        groups_data = []
-        for group in groups:
-            group_data = np.array(data['Values'])[np.array(data['Groups']) == group]
-            groups_data.append(group_data)
+    if gene != '' and gene in fold_changes:
+        # Open the expression store
+        store = expression_store()
+        # Groups of the plot: the tumor samples (if a tumor was selected) and all GTEX tissues in alphabetical order
+        names = ([f'{tumor}_Tumor'] if tumor != '' else []) + store.tissues()
+        groups = ([tumor + ' Tumor'] if tumor != '' else []) + store.tissues()
         # Calculate the position of each group in the graph
         positions = np.arange(len(groups))
-        # Create the boxplot
+        # Create the boxplot from the precomputed statistics of each group
         if plot == 'Boxplot':
-            sns.boxplot(data=df, x='Groups', y='Values', hue='Groups', palette='Spectral', whis=(10, 90) ,legend=False, showfliers=False)
-            xmin, xmax, ymin, ymax = plt.axis()
+            fig, ax = new_figure()
+            box_plot(ax, summary_tables().frame(gene, names, log2=scale == 'log2(TPM+1)'), positions, sns.color_palette('Spectral', len(groups)))
+            categorical_axis(ax, groups)
             # Statistical analysis of significance of tumoral group vs gtex data and customize plot function
-            statistics(1)
-        # Create a violin plot
-        if plot == 'Violin plot':
-            plt.figure(figsize=(12, 6))
-            sns.violinplot(data=df, x='Groups', y='Values', hue='Groups', palette='Spectral', legend=False)
-            xmin, xmax, ymin, ymax = plt.axis()
+            statistics(fig, ax, 1)
+        # Create a violin plot from the precomputed densities of each group
+        elif plot == 'Violin plot':
+            support, density = violin_store().violins(gene, names, log2=scale == 'log2(TPM+1)')
+            fig, ax = new_figure(figsize=(12, 6))
+            violin_plot(ax, support, density, summary_tables().frame(gene, names, log2=scale == 'log2(TPM+1)'), positions, sns.color_palette('Spectral', len(groups)), inner='box')
+            categorical_axis(ax, groups)
             # Statistical analysis of significance of tumoral group vs gtex data and customize plot function
-            statistics(0)
+            statistics(fig, ax, 0)
         # Create the dotplot
-        if plot == 'Dot plot':
-            plt.figure(figsize=(12, 6))
-            sns.stripplot(data=df, x='Groups', y='Values', jitter=True, hue='Groups', palette='Spectral', legend=False, size=4)
-            xmin, xmax, ymin, ymax = plt.axis()
-            # Calculate the medians for each group
-            medians = df.groupby('Groups', observed=False, sort=False)['Values'].median()
-            # Add a horizontal line for each median within the corresponding group
-            n = 0.25
-            for tissue, median in medians.items():
-                x_start = xmin + n
-                x_end = x_start + 0.5
-                n += 1
-                plt.plot(
-                    [x_start, x_end],
-                    [median, median], lw=1, c='k', zorder=10000
-                )
+        else:
+            # Create the dicitionary with the expression values of each group
+            data = {'Groups':[], 'Values':[]}
+            thinned = [] # Groups drawn with a subsample of their points
+            for name, group in zip(names, groups):
+                group_values = store.values(gene, name, log2=scale == 'log2(TPM+1)')
+                if not all_points and len(group_values) > MAX_DOTS:
+                    group_values = group_values[thin_dots(group_values)]
+                    thinned.append(group)
+                data['Groups'] += [group] * len(group_values)
+                data['Values'] += group_values.tolist()
+            df = pd.DataFrame(data)
+            # Medians of all the samples of each group (not only of the points drawn)
+            medians = summary_tables().frame(gene, names, log2=scale == 'log2(TPM+1)')['median']
+            fig, ax = new_figure(figsize=(12, 6))
+            with theme():
+                sns.stripplot(data=df, x='Groups', y='Values', jitter=True, hue='Groups', palette='Spectral', legend=False, size=4, ax=ax)
+                xmin, xmax, ymin, ymax = ax.axis()
+                # Add a horizontal line for each median within the corresponding group
+                n = 0.25
+                for median in medians:
+                    x_start = xmin + n
+                    x_end = x_start + 0.5
+                    n += 1
+                    ax.plot(
+                        [x_start, x_end],
+                        [median, median], lw=1, c='.1', zorder=10000
+                    )
             # Statistical analysis of significance of tumoral group vs gtex data
-            statistics(0)
+            statistics(fig, ax, 0)
     elif gene == '':
         st.error('No gene symbol was introduced')  
-    elif gene not in data['gene'].values:
+    elif gene not in fold_changes:
         st.error(f'{gene} gene symbol not found')
 create_footer()
@@ -1,13 +1,12 @@
 import streamlit as st
-import matplotlib.pyplot as plt
 import pandas as pd
-from math import log2
 import numpy as np
 import seaborn as sns
-import pickle
 from scipy.stats import mannwhitneyu
 from scipy.stats import kruskal 
 import base64
+from cartar.data import fold_change_table, hpa_membrane_genes, no_membrane_genes, expression_store, summary_tables, violin_store
+from cartar.plots import new_figure, render, theme, rotate_xticks, box_plot, thin_dots, violin_plot, categorical_axis, MAX_DOTS
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -64,26 +63,21 @@ st.markdown(mystyle, unsafe_allow_html=True)
 st.title('Metastatic gene expression in SKCM')
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>',unsafe_allow_html=True)
 st.write('This tool can be used to generate boxplots, violin plots, or dot plots for the expression values of a gene of interest for the "Primary tumor", "Metastatic" and "Control" samples of **Skin Cutaneous Melanoma (SKCM)**. SKCM is the only TCGA tumor group with sufficient "Metastatic" sample size (N=366) to get statistical significance of differential expression. Besides, median expression values, sample sizes for each group, and statistical significance of differential expression between sample groups are reported in table format.')
-st.set_option('deprecation.showPyplotGlobalUse', False)
 
 scale_options = ['TPM','log2(TPM+1)']
 plot_options = ['Boxplot','Violin plot','Dot plot']
 gene = st.text_input('Enter gene symbol').upper().strip(' ')
 # Open files to identify location of the genes
-experimental_pm_file = open('Data/HPA_evidence_pm.csv','r')
-for line in experimental_pm_file:
-    experimental_pm_genes = line.split(',')
-no_membrane = open('Data/no_membrane_genes.csv','r')
-for line in no_membrane:
-    no_membrane_genes = line.split(',')
+experimental_pm_genes = hpa_membrane_genes()
+no_membrane = no_membrane_genes()
 # Identify if indicated gene is present in the data
-data = pd.read_csv('Data/log2FC_expression.csv')
+fold_changes = fold_change_table()
 if gene == '':
     st.error('Introduce gene symbol. You can try FGFR1')
 if 'MORF' not in gene:
     if 'ORF' in gene:
         gene = gene.replace('ORF','orf')
-elif gene != '' and gene not in data['gene'].values:
+elif gene != '' and gene not in fold_changes:
     st.error(f'{gene} gene symbol not found')
 selection = st.radio('Select plot', plot_options)
 if selection == 'Boxplot':
@@ -98,27 +92,27 @@ if selection2 == 'TPM':
 elif selection2 == 'log2(TPM+1)':
     scale = 'log2(TPM+1)'
 st.info('TPM = Transcript Per Million')
+# The dot plots of large groups show a subsample of their points unless all the points are requested
+all_points = plot == 'Dot plot' and st.checkbox('Show all points', help=f'By default, groups with more than {MAX_DOTS} samples show at most {MAX_DOTS} points plus their outliers')
 
 # Calculate statistical significance and customize plot function
-def plot_significance(tumor,y,bottom,top,K_pvalue):
+def plot_significance(fig,ax,tumor,y,bottom,top,K_pvalue):
     significant_combinations = []
     data = {'Groups compared':[],'Median Group 1':[],'Group 1 sample size':[], 'Median Group 2':[],'Group 2 sample size':[], 'log2(Fold Change)':[],'Significance':[],'p-value':[]}
     # Get the y-axis limits
     y_range = top - bottom
-    # Identify groups with statistical difference
-    tumor_types = df['Tumor'].unique()
+    # Identify groups with statistical difference (only the test reads the samples, the other values are precomputed)
+    tumor_types = list(SKCM)
     for i in reversed(range(len(tumor_types))):
         for j in range(i+1, len(tumor_types)):
             tumor1 = tumor_types[i]
             tumor2 = tumor_types[j]
-            tumor1_data = df[df['Tumor'] == tumor1]['Values']
-            tumor2_data = df[df['Tumor'] == tumor2]['Values']
-            _, p_value = mannwhitneyu(tumor1_data, tumor2_data)
-            data['Group 1 sample size'].append(len(tumor1_data))
-            data['Group 2 sample size'].append(len(tumor2_data))
+            _, p_value = mannwhitneyu(samples[tumor1], samples[tumor2])
+            data['Group 1 sample size'].append(stats['n'][tumor1])
+            data['Group 2 sample size'].append(stats['n'][tumor2])
             data['Groups compared'].append(f'{tumor1} vs {tumor2}')
-            data['Median Group 1'].append(np.median(tumor1_data))
-            data['Median Group 2'].append(np.median(tumor2_data))
+            data['Median Group 1'].append(stats['median'][tumor1])
+            data['Median Group 2'].append(stats['median'][tumor2])
             data['p-value'].append(p_value)
             if p_value < 0.001:
                 data['Significance'].append('<0.001')
@@ -128,14 +122,9 @@ def plot_significance(tumor,y,bottom,top,K_pvalue):
                 data['Significance'].append('<0.05')
             else: 
                 data['Significance'].append('No significant')
-            if scale == 'TPM':
-                logvalues1 = [log2(value1 + 1) for value1 in tumor1_data]
-                logvalues2 = [log2(value2 + 1) for value2 in tumor2_data]
-                data['log2(Fold Change)'].append(np.median(logvalues1)-np.median(logvalues2))
-            else:
-                data['log2(Fold Change)'].append(np.median(tumor1_data)-np.median(tumor2_data))
+            data['log2(Fold Change)'].append(log2_median[tumor1] - log2_median[tumor2])
             if p_value < 0.05:
-                if np.median(tumor1_data) > np.median(tumor2_data):
+                if stats['median'][tumor1] > stats['median'][tumor2]:
                     k = 0
                 else:
                     k = 1
@@ -144,117 +133,125 @@ def plot_significance(tumor,y,bottom,top,K_pvalue):
     table_data = pd.DataFrame(data)
     # Add to the graph the statistical significance bars
     significant_combinations = significant_combinations[::-1]
-    for i, significant_combination in enumerate(significant_combinations):
-        # Columns corresponding to the datasets of interest
-        x1 = significant_combination[0][0]
-        x2 = significant_combination[0][1]
-        # What level is this bar among the bars above the plot?
-        if i == 2:
-            level = len(significant_combinations) - i + 1
-        else:
-            level = len(significant_combinations) - i 
-        # Plot the bar
-        bar_height = (y_range * 0.07 * level) + top
-        bar_tips = bar_height - (y_range * 0.02)
-        plt.plot(
-            [x1, x1, x2, x2],
-            [bar_tips, bar_height, bar_height, bar_tips], lw=1, c='k'
-        )
-        # Significance level
-        p = significant_combination[1]
-        if p < 0.001:
-            sig_symbol = '***'
-        elif p < 0.01:
-            sig_symbol = '**'
-        elif p < 0.05:
-            sig_symbol = '*'
-        text_height = bar_height + (y_range * 0.0001)
-        plt.text((x1 + x2) * 0.5, text_height, sig_symbol, ha='center', va='bottom', color='black')
+    with theme():
+        for i, significant_combination in enumerate(significant_combinations):
+            # Columns corresponding to the datasets of interest
+            x1 = significant_combination[0][0]
+            x2 = significant_combination[0][1]
+            # What level is this bar among the bars above the plot?
+            if i == 2:
+                level = len(significant_combinations) - i + 1
+            else:
+                level = len(significant_combinations) - i 
+            # Plot the bar
+            bar_height = (y_range * 0.07 * level) + top
+            bar_tips = bar_height - (y_range * 0.02)
+            ax.plot(
+                [x1, x1, x2, x2],
+                [bar_tips, bar_height, bar_height, bar_tips], lw=1, c='.1'
+            )
+            # Significance level
+            p = significant_combination[1]
+            if p < 0.001:
+                sig_symbol = '***'
+            elif p < 0.01:
+                sig_symbol = '**'
+            elif p < 0.05:
+                sig_symbol = '*'
+            text_height = bar_height + (y_range * 0.0001)
+            ax.text((x1 + x2) * 0.5, text_height, sig_symbol, ha='center', va='bottom', color='black')
     # Customize the plot
-    plt.title(f'{gene} expression comparison between SKCM conditions', y=1.03)
+    ax.set_title(f'{gene} expression comparison between SKCM conditions', y=1.03)
     if scale == 'TPM':
-        plt.ylabel(f'{gene} expression in TPM')
+        ax.set_ylabel(f'{gene} expression in TPM')
     else: 
-        plt.ylabel(f'{gene} expression in log2(TPM+1)')
-    plt.xlabel('SKCM group')
-    plt.xticks(rotation=45, ha='right')
-    plt.subplots_adjust(left=0.067, bottom=0.155, right=0.968, top=0.91)
+        ax.set_ylabel(f'{gene} expression in log2(TPM+1)')
+    ax.set_xlabel('SKCM group')
+    rotate_xticks(ax)
+    fig.subplots_adjust(left=0.067, bottom=0.155, right=0.968, top=0.91)
     # Show the graph and table
     st.header(plot, divider='rainbow')
-    st.pyplot(plt)
+    st.image(render(fig), use_column_width=True)
     K_pvalue_formatted = f'{K_pvalue:.2e}'
     if K_pvalue<0.05:
         st.write(f'The above figure illustrates the {plot} for {gene} expression in {scale} across "Metastatic" "Primary tumor" and "Control" SKCM samples, comparing the expression between these groups with **Mann-Whitney U test**. Statistical significance is denoted for each SKCM group (***: p_value < 0.001, **: p_value < 0.01, *: p_value < 0.05). The **Kruskal-Wallis test** indicates that there are :red[statistical differences] between the groups with a p_value of {K_pvalue_formatted}.')
     else:
         st.write(f'The above figure illustrates the {plot} for {gene} expression in {scale} across "Metastatic" "Primary tumor" and "Control" SKCM samples, comparing the expression between these groups with **Mann-Whitney U test**. Statistical significance is denoted for each SKCM group (***: p_value < 0.001, **: p_value < 0.01, *: p_value < 0.05). The **Kruskal-Wallis test** indicates that there are :red[no statistical differences] between the groups with a p_value of {K_pvalue_formatted}.')
+    if plot == 'Dot plot' and thinned:
+        st.write(f'The densest regions of {", ".join(thinned)} are thinned to show at most {MAX_DOTS} points of each group, plus all the points more than 1.5 IQR away from the quartiles. Check "Show all points" to plot every sample.')
     st.header('Data table', divider='rainbow')
     st.write(f'All relevant information is presented in the table below, encompassing critical aspects such as the log2(Fold Change) for each comparison. Computed as the log2(TPM+1) median of SKCM Group 1 expression minus the log2(TPM+1) median of SKCM Group 2 expression. For ease of exploration, you can click on the column names to arrange the rows based on the selected column, either in ascending or descending order. Please note that **p-values under 0.001 are rounded to 0**; for the complete decimal value, click on the respective cell.')
     if gene in experimental_pm_genes:
         st.write(f'**{gene}** ([NCBI](https://www.ncbi.nlm.nih.gov/gene/?term=Homo+sapiens+{gene}), [HGNC](https://www.genenames.org/tools/search/#!/?query={gene})) has been **experimentally** reported to be **located in the plasma membrane** by the Human Protein Atlas.')
-    elif gene in no_membrane_genes:
+    elif gene in no_membrane:
         st.write(f'**{gene}** ([NCBI](https://www.ncbi.nlm.nih.gov/gene/?term=Homo+sapiens+{gene}), [HGNC](https://www.genenames.org/tools/search/#!/?query={gene})) has **not** been reported to be **located in the plasma membrane** by the Gene Ontology.')      
     else:
         st.write(f'**{gene}** ([NCBI](https://www.ncbi.nlm.nih.gov/gene/?term=Homo+sapiens+{gene}), [HGNC](https://www.genenames.org/tools/search/#!/?query={gene})) has been reported to be **located in the plasma membrane** according to Gene Ontology, **but it has not been experimentally determined** by the Human Protein Atlas.')    
     st.dataframe(table_data, hide_index=True)
 
 if st.button(f'Create {plot}'):
-    if gene != '' and gene in data['gene'].values: 
-        # Identify GTEx tissue sample corresponding to control group of tumor
-        with open('Data/SKCM.pkl', 'rb') as archivo:
-            SKCM = pickle.load(archivo)
-        # Get requested information
-        groups = [] # Gruops of tumor (Metastatic, Primary or Control)
-        values = [] # Expression values
-        for group in SKCM[gene]['SKCM'].keys():
-            for value in SKCM[gene]['SKCM'][group]:
-                if group == 'Normal':
-                    group = 'Control'
-                groups.append(group)
-                if scale == 'log2(TPM+1)':
-                    value = log2(value+1)
-                values.append(value)
-        data = {'Tumor': groups, 'Values':values}
-        df = pd.DataFrame(data)
-        group_order = ['Metastatic', 'Primary', 'Control']
-        df['Tumor'] = pd.Categorical(df['Tumor'], categories=group_order, ordered=True)
-        df = df.sort_values(by=['Tumor'])
-        metastatic = df[df['Tumor'] == 'Metastatic']['Values'].tolist()
-        primary = df[df['Tumor'] == 'Primary']['Values'].tolist()
-        control = df[df['Tumor'] == 'Control']['Values'].tolist()
-        H, K_pvalue = kruskal(metastatic, primary, control)
-        # Create the boxplot
+    if gene != '' and gene in fold_changes: 
+        # Open the expression store
+        store = expression_store()
+        # Get requested information (Skin GTEx samples are used as control samples of SKCM)
+        SKCM = {'Metastatic':['SKCM_Metastatic'], 'Primary':['SKCM_Tumor'], 'Control':['SKCM_Normal','Skin']}
+        samples = {group:np.concatenate([store.values(gene, name) for name in SKCM[group]]) for group in SKCM}
+        H, K_pvalue = kruskal(*samples.values())
+        # Precomputed statistics of each group in the plotted scale and log2(TPM+1) medians for the fold change
+        summaries = summary_tables()
+        names = ['SKCM_Metastatic', 'SKCM_Tumor', 'SKCM_Control']
+        stats = summaries.frame(gene, names, log2=scale == 'log2(TPM+1)').set_axis(list(SKCM))
+        log2_median = summaries.frame(gene, names, log2=True)['median'].set_axis(list(SKCM))
+        # Create the boxplot from the precomputed statistics
         if plot == 'Boxplot':
-            plt.figure()
-            sns.boxplot(data=df, x='Tumor', y='Values', hue='Tumor', legend=False, showfliers=False, palette={'Primary': 'lightseagreen', 'Control': 'tan', 'Metastatic':'grey'})
-            xmin, xmax, ymin, ymax = plt.axis()
+            fig, ax = new_figure()
+            box_plot(ax, stats, [0, 1, 2], ['grey', 'lightseagreen', 'tan'], whiskers=('whisker_low', 'whisker_high'))
+            categorical_axis(ax, list(SKCM))
+            xmin, xmax, ymin, ymax = ax.axis()
             # Statistical significant differences and customize the plot
-            plot_significance('SKCM',0,ymin,ymax,K_pvalue)
-        # Create the violin plot
-        if plot == 'Violin plot':
-            sns.violinplot(x='Tumor', y='Values', hue='Tumor', data=df, inner='quartile', density_norm='width',palette={'Primary': 'lightseagreen', 'Control': 'tan', 'Metastatic':'grey'}, legend=False)
-            xmin, xmax, ymin, ymax = plt.axis()
+            plot_significance(fig, ax, 'SKCM',0,ymin,ymax,K_pvalue)
+        # Create the violin plot from the precomputed densities
+        elif plot == 'Violin plot':
+            support, density = violin_store().violins(gene, names, log2=scale == 'log2(TPM+1)')
+            fig, ax = new_figure()
+            violin_plot(ax, support, density, stats, [0, 1, 2], ['grey', 'lightseagreen', 'tan'])
+            categorical_axis(ax, list(SKCM))
+            xmin, xmax, ymin, ymax = ax.axis()
             # Statistical significant differences and customize the plot
-            plot_significance('SKCM',1,ymin,ymax,K_pvalue)        
+            plot_significance(fig, ax, 'SKCM',1,ymin,ymax,K_pvalue)        
         # Create the dotplot
-        if plot == 'Dot plot':
-            sns.stripplot(x='Tumor', y='Values', jitter=True, data=data, hue='Tumor', size=4, palette={'Primary': 'lightseagreen', 'Control': 'tan', 'Metastatic':'grey'})
-            plt.xlim(-0.5, 2.5)
-            xmin, xmax, ymin, ymax = plt.axis()
-            # Calculate the medians for each group
-            medians = df.groupby('Tumor', observed=False)['Values'].median()
-            # Add a horizontal line for each median within the corresponding group
-            n = 0.25
-            for tumor, median in medians.items():
-                x_start = xmin + n
-                x_end = x_start + 0.5
-                n += 1
-                plt.plot(
-                    [x_start, x_end],
-                    [median, median], lw=1, c='k', zorder=10000
-                )
+        else:
+            groups = [] # Gruops of tumor (Metastatic, Primary or Control)
+            values = [] # Expression values
+            thinned = [] # Groups drawn with a subsample of their points
+            for group in SKCM.keys():
+                group_values = np.concatenate([store.values(gene, name, log2=scale == 'log2(TPM+1)') for name in SKCM[group]])
+                if not all_points and len(group_values) > MAX_DOTS:
+                    group_values = group_values[thin_dots(group_values)]
+                    thinned.append(f'SKCM {group}')
+                groups += [group] * len(group_values)
+                values += group_values.tolist()
+            data = {'Tumor': groups, 'Values':values}
+            fig, ax = new_figure()
+            with theme():
+                sns.stripplot(x='Tumor', y='Values', jitter=True, data=data, hue='Tumor', size=4, palette={'Primary': 'lightseagreen', 'Control': 'tan', 'Metastatic':'grey'}, ax=ax)
+                ax.set_xlim(-0.5, 2.5)
+                xmin, xmax, ymin, ymax = ax.axis()
+                # Medians of all the samples of each group (not only of the points drawn)
+                medians = stats['median']
+                # Add a horizontal line for each median within the corresponding group
+                n = 0.25
+                for median in medians:
+                    x_start = xmin + n
+                    x_end = x_start + 0.5
+                    n += 1
+                    ax.plot(
+                        [x_start, x_end],
+                        [median, median], lw=1, c='.1', zorder=10000
+                    )
             # Statistical significant differences and customize the plot
-            plot_significance('SKCM',1,ymin,ymax,K_pvalue)        
-    elif gene not in data['gene'].values:
+            plot_significance(fig, ax, 'SKCM',1,ymin,ymax,K_pvalue)        
+    elif gene not in fold_changes:
         st.error(f'{gene} gene symbol not found')
     else:
         st.error('No gene symbol was introduced')        
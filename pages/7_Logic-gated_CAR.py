@@ -1,14 +1,12 @@
 import streamlit as st
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import pandas as pd
-from math import log2
-import pickle
 import numpy as np
 import seaborn as sns
 import plotly.express as px
 import base64
+from cartar.data import fold_change_table, expression_store
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -88,13 +86,13 @@ abbreviations = {'ACC':'Adrenocortical carcinoma','BLCA':'Bladder Urothelial Car
 
 gene1 = st.text_input('Enter first gene symbol').upper().strip(' ')
 # Identify if indicated gene is present in the data
-data = pd.read_csv('Data/log2FC_expression.csv')
+fold_changes = fold_change_table()
 if gene1 == '':
     st.error('Introduce gene symbol. You can try CEACAM6')
 if 'MORF' not in gene1:
     if 'ORF' in gene1:
         gene1 = gene1.replace('ORF','orf')
-elif gene1 != '' and gene1 not in data['gene'].values:
+elif gene1 != '' and gene1 not in fold_changes:
     st.error(f'{gene1} gene symbol not found')
 gene2 = st.text_input('Enter second gene symbol').upper().strip(' ')
 if gene2 == '':
@@ -102,7 +100,7 @@ if gene2 == '':
 if 'MORF' not in gene2:
     if 'ORF' in gene2:
         gene2 = gene2.replace('ORF','orf')
-elif gene2 != '' and gene2 not in data['gene'].values:
+elif gene2 != '' and gene2 not in fold_changes:
     st.error(f'{gene2} gene symbol not found')
 tumor = st.selectbox('Choose tumor', tumor_options)
 # Expander to show abbreviation meaning
@@ -125,110 +123,18 @@ gtex_tcga = {'ACC':'Adrenal Gland','BLCA':'Bladder','BRCA':'Breast','CESC':'Cerv
 if st.button(f'Show correlation'):
     if gene1 != '' and gene2 != '':
         # If gene in data
-        if gene1 in data['gene'].values and gene2 in data['gene'].values:  
-            if 'A' <= gene1[0] <= 'C':
-                gtex1 = 'Data/gtex_AC.pkl'
-                tcga1 = 'Data/tcga_AC.pkl'
-            elif 'D' <= gene1[0] <= 'J':
-                gtex1 = 'Data/gtex_DJ.pkl'
-                tcga1 = 'Data/tcga_DJ.pkl'
-            elif 'K' <= gene1[0] <= 'N':
-                gtex1 = 'Data/gtex_KN.pkl'
-                tcga1 = 'Data/tcga_KN.pkl'
-            elif 'O' <= gene1[0] <= 'R':   
-                gtex1 = 'Data/gtex_OR.pkl'
-                tcga1 = 'Data/tcga_OR.pkl'
-            elif 'S' <= gene1[0] <= 'T':   
-                gtex1 = 'Data/gtex_ST.pkl'
-                tcga1 = 'Data/tcga_ST.pkl'
-            elif 'U' <= gene1[0] <= 'Z':   
-                gtex1 = 'Data/gtex_UZ.pkl'
-                tcga1 = 'Data/tcga_UZ.pkl'
-            if 'A' <= gene2[0] <= 'C':
-                gtex2 = 'Data/gtex_AC.pkl'
-                tcga2 = 'Data/tcga_AC.pkl'
-            elif 'D' <= gene2[0] <= 'J':
-                gtex2 = 'Data/gtex_DJ.pkl'
-                tcga2 = 'Data/tcga_DJ.pkl'
-            elif 'K' <= gene2[0] <= 'N':
-                gtex2 = 'Data/gtex_KN.pkl'
-                tcga2 = 'Data/tcga_KN.pkl'
-            elif 'O' <= gene2[0] <= 'R':   
-                gtex2 = 'Data/gtex_OR.pkl'
-                tcga2 = 'Data/tcga_OR.pkl'
-            elif 'S' <= gene2[0] <= 'T':   
-                gtex2 = 'Data/gtex_ST.pkl'
-                tcga2 = 'Data/tcga_ST.pkl'
-            elif 'U' <= gene2[0] <= 'Z':   
-                gtex2 = 'Data/gtex_UZ.pkl'
-                tcga2 = 'Data/tcga_UZ.pkl'
+        if gene1 in fold_changes and gene2 in fold_changes:  
+            # Open the expression store
+            store = expression_store()
+            # Primary tumor and normal samples of the tumor and GTEX samples used as control of the tumor
+            names = [f'{tumor}_Tumor', f'{tumor}_Normal'] + ([gtex_tcga[tumor]] if tumor in gtex_tcga.keys() else [])
             # Create the dicitionary with all the data
+            values1 = [store.values(gene1, name, log2=scale == 'log2(TPM+1)') for name in names] # Gene1 expression values 
+            values2 = [store.values(gene2, name, log2=scale == 'log2(TPM+1)') for name in names] # Gene2 expression values 
             groups = [] # Groups of tumor (Primary or Control)
-            values1 = [] # Gene1 expression values 
-            values2 = [] # Gene2 expression values 
-            #If both genes in same file get the desired data
-            if gtex1 == gtex2:
-                with open(tcga1, 'rb') as archivo:
-                    tcga = pickle.load(archivo)
-                for group in tcga[gene1][tumor].keys():
-                    for value in tcga[gene1][tumor][group]:
-                        if group == 'Normal':
-                            group = 'Control'
-                        groups.append(group)
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values1.append(value)
-                for group in tcga[gene2][tumor].keys():
-                    for value in tcga[gene2][tumor][group]:
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values2.append(value)
-                if tumor in gtex_tcga.keys():            
-                    with open(gtex1, 'rb') as archivo:
-                        gtex = pickle.load(archivo)
-                    for value in gtex[gene1][gtex_tcga[tumor]]:
-                        groups.append('Control')
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values1.append(value)   
-                    for value in gtex[gene2][gtex_tcga[tumor]]:
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values2.append(value)   
-            #If genes in different files get data from respective files
-            else:
-                with open(tcga1, 'rb') as archivo:
-                    tcga1 = pickle.load(archivo)
-                for group in tcga1[gene1][tumor].keys():
-                    for value in tcga1[gene1][tumor][group]:
-                        if group == 'Normal':
-                            group = 'Control'
-                        groups.append(group)
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values1.append(value)
-                with open(tcga2, 'rb') as archivo:
-                    tcga2 = pickle.load(archivo)
-                for group in tcga2[gene2][tumor].keys():
-                    for value in tcga2[gene2][tumor][group]:
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values2.append(value)
-                if tumor in gtex_tcga.keys():            
-                    with open(gtex1, 'rb') as archivo:
-                        gtex1 = pickle.load(archivo)
-                    for value in gtex1[gene1][gtex_tcga[tumor]]:
-                        groups.append('Control')
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values1.append(value)  
-                    with open(gtex2, 'rb') as archivo:
-                        gtex2 = pickle.load(archivo)    
-                    for value in gtex2[gene2][gtex_tcga[tumor]]:
-                        if scale == 'log2(TPM+1)':
-                            value = log2(value+1)
-                        values2.append(value)  
-            data = {'Sample':groups, f'{gene1} expression':values1, f'{gene2} expression':values2}
+            for name, values in zip(names, values1):
+                groups += ['Tumor' if name == f'{tumor}_Tumor' else 'Control'] * len(values)
+            data = {'Sample':groups, f'{gene1} expression':np.concatenate(values1), f'{gene2} expression':np.concatenate(values2)}
             # Create correlation plot
             df = pd.DataFrame(data)          
             fig = px.scatter(data, x=f'{gene2} expression', y=f'{gene1} expression', color='Sample', color_discrete_sequence=['#20b2aa','#d2b48c'])
@@ -239,13 +145,6 @@ if st.button(f'Show correlation'):
                 fig.update_layout(title=f'{gene1} and {gene2} expression correlation in {tumor} samples', title_x=0.2, xaxis_title=f'{gene2} expression in TPM', yaxis_title= f'{gene1} expression in TPM')
             # Create table with the results
             table_data = pd.DataFrame(data)
-            if scale == 'TPM':
-                plt.ylabel(f'{gene1} expression in TPM')
-                plt.xlabel(f'{gene2} expression in TPM')
-            else: 
-                plt.ylabel(f'{gene1} expression in log2(TPM+1)')
-                plt.xlabel(f'{gene2} expression in log2(TPM+1)')
-            plt.xticks(rotation=45, ha='right')
             # Show the graph and table
             st.header('Correlation plot', divider='rainbow')
             st.plotly_chart(fig,use_container_width=True)
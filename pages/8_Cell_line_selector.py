@@ -1,10 +1,10 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 from math import log2
-import requests
-import csv
 import plotly.express as px
 import base64
+from cartar.data import hpa_membrane_genes, no_membrane_genes, cell_line_genes, cell_line_store
 
 st.set_page_config(page_title='CARTAR', page_icon='logo.png',layout='wide')
 mystyle = '''
@@ -68,17 +68,10 @@ tissue_options = ['Adrenal Gland','Ampulla of Vater','Biliary Tract','Bladder/Ur
 expression_options = ['Overexpression', 'Underexpression']
 scale_options = ['TPM','log2(TPM+1)']
 # Identify if indicated gene is present in the data
-data = open('Data/genes_cells.csv','r')
-data_list = []
-for line in data:
-    data_list.extend(line.split(','))
+data_list = cell_line_genes()
 gene = st.text_input('Select gene').upper().strip(' ')  # Introduce gene
-experimental_pm_file = open('Data/HPA_evidence_pm.csv','r')
-for line in experimental_pm_file:
-    experimental_pm_genes = line.split(',')
-exclude = open('Data/no_membrane_genes.csv','r')
-for line in exclude:
-    no_membrane = line.split(',')
+experimental_pm_genes = hpa_membrane_genes()
+no_membrane = no_membrane_genes()
 if gene == '':
     st.error('Introduce gene. You can try CEACAM6')
 if 'MORF' not in gene:
@@ -112,61 +105,43 @@ if value:
 
 if st.button('Find cell lines'):
     if gene != '' and gene in data_list and value.replace('.', '').isdigit() and value != '':
-        url_data = 'https://gitlab.com/gmx2/CARTAR/-/raw/main/Expression_Public_23Q4_filtered.csv'
-        data = pd.read_csv(url_data, index_col=0)
-        url_metadata = 'https://gitlab.com/gmx2/CARTAR/-/raw/main/cell_line_metadata_reduced.csv'
-        metadata = pd.read_csv(url_metadata)
+        try:
+            store = cell_line_store()
+        except (OSError, ValueError) as error:
+            st.error(f'The cell line data could not be loaded, please try again later ({error})')
+            create_footer()
+            st.stop()
+        metadata = store.metadata
         # Identify cell lines belonging to specified tumor
-        cell_lines = []
         if tumors:
-            indexes = metadata[metadata['OncotreeLineage'].isin(tumors)].index.tolist() # Create a list with the row number corresponding to specified tumors
-            cell_lines.extend(metadata.loc[indexes, 'ModelID'].tolist())
+            cell_lines = metadata['OncotreeLineage'].isin(tumors).to_numpy()
         else:
-            cell_lines.extend(metadata['ModelID'].tolist())
+            cell_lines = np.ones(len(metadata), dtype=bool)
         # If inidcated gene in dataset
-        if gene in data.columns:
-            # Identify cell lines with expression related to threshold
-            data = pd.DataFrame({gene: data[gene]})
-            data2 = data.T
-            desired_lines = [] # List to store the cell lines with desired expression
-            values = [] # List to store the cell line expression
-            for column in data2.columns:
-                if column in cell_lines:
-                    exp = float(data2[column].tolist()[0])
-                    if expression == 'Underexpression':
-                        if exp <= threshold:
-                            desired_lines.append(column)
-                            values.append(exp)
-                    else:
-                        if exp >= threshold:
-                            desired_lines.append(column)   
-                            values.append(exp)       
+        if gene in store:
+            data = store.expression(gene).astype(float)
         else:
             st.error(f'{gene} gene data not available')
-        # Select column corresponding to the indicated gene and rows for desired cell lines
-        data3 = data.loc[cell_lines, [gene]]
-        # Identify maximum and minimum expression values for the gene
-        max_value = data3[gene].max()
-        min_value = data3[gene].min()
+            data = np.full(len(metadata), np.nan)
+        # Identify cell lines with expression related to threshold
+        if expression == 'Underexpression':
+            desired_lines = cell_lines & (data <= threshold)
+        else:
+            desired_lines = cell_lines & (data >= threshold)
+        # Identify maximum and minimum expression values for the gene in the cell lines of the specified tumor
+        max_value = pd.Series(data[cell_lines]).max()
+        min_value = pd.Series(data[cell_lines]).min()
+        values = data[desired_lines]
         if scale == 'TPM':
             max_value = 2**(max_value)-1
             min_value = 2**(min_value)-1
+            values = 2**values-1
         # Obtain all relevant information about the selected cell lines
-        table = {'Cell line':[],f'{gene} expression':[],'Catalog Number':[],'Lineage':[],'Primary Disease':[],'Subtype':[],'Code':[]}
-        desired_rows = metadata[metadata['ModelID'].isin(desired_lines)].index.tolist()
-        table['Cell line'].extend(metadata.loc[desired_rows, 'CellLineName'].tolist())
-        if scale == 'TPM':
-            log_values = []
-            for value in values:
-                log_values.append(2**value-1)
-            table[f'{gene} expression'] = log_values
-        else:
-            table[f'{gene} expression'] = values
-        table['Catalog Number'].extend(metadata.loc[desired_rows, 'CatalogNumber'].tolist())
-        table['Lineage'].extend(metadata.loc[desired_rows, 'OncotreeLineage'].tolist())
-        table['Primary Disease'].extend(metadata.loc[desired_rows, 'OncotreePrimaryDisease'].tolist())
-        table['Subtype'].extend(metadata.loc[desired_rows, 'OncotreeSubtype'].tolist())
-        table['Code'].extend(metadata.loc[desired_rows, 'OncotreeCode'].tolist())
+        desired_rows = metadata[desired_lines]
+        table = {'Cell line':desired_rows['CellLineName'].tolist(),f'{gene} expression':values.tolist(),
+                 'Catalog Number':desired_rows['CatalogNumber'].tolist(),'Lineage':desired_rows['OncotreeLineage'].tolist(),
+                 'Primary Disease':desired_rows['OncotreePrimaryDisease'].tolist(),'Subtype':desired_rows['OncotreeSubtype'].tolist(),
+                 'Code':desired_rows['OncotreeCode'].tolist()}
         table_data = pd.DataFrame(table)
         if table_data.size > 0:
             # Generate interactive barplot
@@ -0,0 +1,93 @@
+"""Checks of the theme of the figures and of the subsample of the dot plots drawn by cartar.plots."""
+import matplotlib as mpl
+import numpy as np
+import pytest
+
+from cartar.plots import THEME, new_figure, render, thin_dots
+
+
+def outliers(values):
+    q1, q3 = np.percentile(values, [25, 75])
+    return np.flatnonzero((values < q1 - 1.5 * (q3 - q1)) | (values > q3 + 1.5 * (q3 - q1)))
+
+
+def check_subsample(values, kept, max_points, bins=50):
+    # Sorted unique indexes with every outlier and both extremes, within the budget of the other points
+    assert np.all(np.diff(kept) > 0)
+    assert set(outliers(values)) <= set(kept.tolist())
+    assert values[kept].min() == values.min() and values[kept].max() == values.max()
+    budget = max(max_points - len(outliers(values)), bins)
+    assert len(kept) - len(outliers(values)) <= budget
+
+
+@pytest.mark.parametrize('n', [10, 500])
+def test_small_groups_are_kept(n):
+    np.testing.assert_array_equal(thin_dots(np.random.default_rng(n).normal(size=n), max_points=500), np.arange(n))
+
+
+def test_equal_values():
+    kept = thin_dots(np.full(900, 2.5), max_points=100)
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == 899
+
+
+def test_just_above_max_points():
+    values = np.random.default_rng(0).normal(size=501)
+    kept = thin_dots(values, max_points=500)
+    check_subsample(values, kept, 500)
+    assert len(kept) < 501
+
+
+def test_more_outliers_than_max_points():
+    # A mostly zero group where every expressed sample is an outlier: the budget of the other points falls back to
+    # the number of bins
+    rng = np.random.default_rng(1)
+    values = np.concatenate([np.zeros(2000), rng.lognormal(2, 1, 300)])
+    kept = thin_dots(values, max_points=200)
+    check_subsample(values, kept, 200)
+    assert len(kept) == len(outliers(values)) + 50
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_outliers_and_extremes_are_kept(seed):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.lognormal(3, 1, 3000), rng.normal(0, 1, 500)])
+    kept = thin_dots(values, max_points=300)
+    check_subsample(values, kept, 300)
+
+
+def test_sparse_bins_are_kept():
+    # A dense peak over a sparse plateau: the plateau points within the whiskers are all kept and only the bins of the
+    # peak are thinned
+    rng = np.random.default_rng(2)
+    values = np.concatenate([rng.normal(0, 0.2, 3000), rng.uniform(-2, 2, 1000)])
+    kept = thin_dots(values, max_points=1500)
+    check_subsample(values, kept, 1500)
+    sparse = np.flatnonzero((np.abs(values) > 0.8) & (np.abs(values) < 1.1))
+    assert len(sparse) and set(sparse) <= set(kept.tolist())
+    assert len(kept) < len(values)
+
+
+def test_deterministic():
+    values = np.random.default_rng(3).gamma(2, 10, 5000)
+    np.testing.assert_array_equal(thin_dots(values, max_points=250), thin_dots(values.copy(), max_points=250))
+
+
+def test_theme_is_not_set_for_the_process():
+    defaults = dict(mpl.rcParams)
+    figure, ax = new_figure()
+    ax.set_xticks(range(10))
+    render(figure)
+    assert dict(mpl.rcParams) == defaults
+
+
+def test_new_figure_keeps_the_theme():
+    # Including the ticks created after the figure, outside of the theme
+    figure, ax = new_figure()
+    ax.set_xticks(range(10))
+    ticks = ax.xaxis.get_major_ticks()
+    assert len(ticks) == 10
+    assert all(tick.label1.get_fontsize() == THEME['xtick.labelsize'] for tick in ticks)
+    assert all(tick.gridline.get_visible() and tick.gridline.get_color() == THEME['grid.color'] and
+               not tick.tick1line.get_visible() for tick in ticks)
+    assert ax.spines['left'].get_edgecolor() == mpl.colors.to_rgba(THEME['axes.edgecolor'])
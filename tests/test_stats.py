@@ -0,0 +1,73 @@
+"""Checks of the vectorized statistics of cartar.stats against scipy and matplotlib."""
+import numpy as np
+import pytest
+from matplotlib.cbook import boxplot_stats
+from scipy.stats import gaussian_kde, mannwhitneyu
+
+from cartar.stats import mann_whitney, summarize, violin_densities
+from cartar.tables import SUMMARY_FIELDS
+
+
+def random_values(rng, n_rows, n_samples, ties=False):
+    # Expression-like values; rounded (with many zeros) to get ties
+    values = rng.lognormal(2, 1.5, size=(n_rows, n_samples)) * (rng.random((n_rows, n_samples)) > 0.2)
+    return np.round(values) if ties else values
+
+
+@pytest.mark.parametrize('n1, n2', [(1, 1), (2, 7), (5, 5), (8, 40), (9, 9), (60, 35)])
+@pytest.mark.parametrize('ties', [False, True])
+def test_mann_whitney_matches_scipy(n1, n2, ties):
+    rng = np.random.default_rng(n1 * 100 + n2)
+    x, y = random_values(rng, 30, n1, ties), random_values(rng, 30, n2, ties) * 1.5
+    for method, scipy_method in [('asymptotic', 'asymptotic'), ('auto', 'auto')]:
+        result = mann_whitney(x, y, method=method)
+        for row in range(len(x)):
+            expected = mannwhitneyu(x[row], y[row], method=scipy_method)
+            assert result.u[row] == pytest.approx(expected.statistic)
+            np.testing.assert_allclose(result.p_value[row], expected.pvalue, rtol=1e-9, atol=1e-14)
+
+
+def test_summarize_matches_boxplot_stats():
+    rng = np.random.default_rng(0)
+    for n, ties in [(1, False), (2, False), (7, True), (50, True), (333, False)]:
+        values = random_values(rng, 20, n, ties)
+        summary = summarize(values)
+        fields = {field: summary[:, k] for k, field in enumerate(SUMMARY_FIELDS)}
+        for row in range(len(values)):
+            percentiles = boxplot_stats(values[row], whis=(10, 90))[0]
+            tukey = boxplot_stats(values[row], whis=1.5)[0]
+            expected = {'min': values[row].min(), 'max': values[row].max(), 'q1': tukey['q1'], 'median': tukey['med'],
+                        'q3': tukey['q3'], 'p10': np.percentile(values[row], 10),
+                        'p90': np.percentile(values[row], 90), 'whisker_p10': percentiles['whislo'],
+                        'whisker_p90': percentiles['whishi'], 'whisker_low': tukey['whislo'],
+                        'whisker_high': tukey['whishi']}
+            for field, value in expected.items():
+                assert fields[field][row] == pytest.approx(value), field
+
+
+def test_summarize_without_samples():
+    assert np.isnan(summarize(np.empty((3, 0)))).all()
+
+
+def test_violin_densities_match_gaussian_kde():
+    rng = np.random.default_rng(1)
+    for n, ties in [(2, False), (3, False), (20, True), (400, False)]:
+        values = random_values(rng, 15, n, ties)
+        values[0] = 5  # no variance
+        support, density = violin_densities(values)
+        assert np.isnan(density[0]).all() and (support[0] == 5).all()
+        for row in range(1, len(values)):
+            kde = gaussian_kde(values[row], bw_method='scott')
+            bandwidth = np.sqrt(kde.covariance[0, 0])
+            np.testing.assert_allclose(support[row], [values[row].min() - 2 * bandwidth,
+                                                      values[row].max() + 2 * bandwidth])
+            expected = kde(np.linspace(support[row, 0], support[row, 1], density.shape[1]))
+            np.testing.assert_allclose(density[row], expected / expected.max(), atol=1e-5)
+
+
+def test_violin_densities_of_tiny_and_empty_groups():
+    support, density = violin_densities(np.array([[3.0], [7.0]]))
+    assert np.isnan(density).all()
+    np.testing.assert_array_equal(support, [[3, 3], [7, 7]])
+    support, density = violin_densities(np.empty((2, 0)))
+    assert np.isnan(support).all() and np.isnan(density).all()
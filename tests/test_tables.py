@@ -0,0 +1,61 @@
+"""Checks of the threshold queries of cartar.tables.FoldChangeTable against brute-force masks."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from cartar.tables import FoldChangeTable, write_fold_change_table
+
+
+def random_table(rng, n_genes=200):
+    # log2(FC) columns with missing values, repeated values (ties) and a column without any value
+    values = np.round(rng.normal(0, 2, size=(n_genes, 4)), 1)
+    values[rng.random(values.shape) < 0.1] = np.nan
+    values[:, 3] = np.nan
+    return FoldChangeTable([f'GENE{k}' for k in range(n_genes)], ['ACC', 'BRCA', 'LUAD', 'UCS'], values)
+
+
+def thresholds(column):
+    # Values present in the column (ties at the threshold), values in between and values outside its range
+    present = column[~np.isnan(column)]
+    return np.concatenate([present[:20], present[:20] + 0.05, [-np.inf, -100, 100, np.inf]])
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_above_and_below_match_masks(seed):
+    table = random_table(np.random.default_rng(seed))
+    for tumor in table.tumors:
+        column = table.column(tumor)
+        for threshold in thresholds(column) if tumor != 'UCS' else [-np.inf, 0, np.inf]:
+            above, below = table.above(tumor, threshold), table.below(tumor, threshold)
+            np.testing.assert_array_equal(np.sort(above), np.flatnonzero(column >= threshold))
+            np.testing.assert_array_equal(np.sort(below), np.flatnonzero(column <= threshold))
+            # In ascending log2(FC) order
+            assert np.all(np.diff(column[above]) >= 0) and np.all(np.diff(column[below]) >= 0)
+
+
+def test_limits():
+    table = random_table(np.random.default_rng(3))
+    for tumor in ['ACC', 'BRCA', 'LUAD']:
+        column = table.column(tumor)
+        assert table.limits(tumor) == (np.nanmin(column), np.nanmax(column))
+    # A tumor without log2(FC) values has no limits instead of NaN ones
+    assert table.limits('UCS') is None
+
+
+def test_lookup_and_contains():
+    table = random_table(np.random.default_rng(4))
+    assert 'GENE7' in table and 'CD19' not in table
+    np.testing.assert_array_equal(table.lookup(['GENE7', 'GENE2'], ['LUAD', 'ACC']),
+                                  table.values[np.ix_([7, 2], [2, 0])])
+
+
+def test_load_and_from_frame(tmp_path):
+    table = random_table(np.random.default_rng(5))
+    write_fold_change_table(tmp_path / 'log2FC_expression.npz', table.genes, table.tumors, table.values)
+    frame = pd.DataFrame(table.values, columns=table.tumors)
+    frame.insert(0, 'gene', table.genes)
+    for other in [FoldChangeTable.load(tmp_path / 'log2FC_expression.npz'), FoldChangeTable.from_frame(frame)]:
+        assert other.tumors == table.tumors
+        np.testing.assert_array_equal(other.genes, table.genes)
+        np.testing.assert_array_equal(other.values, table.values)
+        np.testing.assert_array_equal(other.above('BRCA', 0.5), table.above('BRCA', 0.5))